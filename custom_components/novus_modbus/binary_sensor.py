@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from datetime import timedelta
+import logging
+from typing import Any, Optional
+
+from homeassistant.components.binary_sensor import (
+    BinarySensorEntity,
+    BinarySensorEntityDescription,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_NAME
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+import homeassistant.util.dt as dt_util
+
+from .const import ATTR_MANUFACTURER, DOMAIN, NovusBit
+from .hub import NovusHub
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+) -> bool:
+    hub_name = entry.data[CONF_NAME]
+    hub = hass.data[DOMAIN][hub_name]["hub"]
+
+    device_info: DeviceInfo = {
+        "identifiers": {(DOMAIN, hub_name)},
+        "name": hub_name,
+        "manufacturer": ATTR_MANUFACTURER,
+    }
+
+    async_add_entities(
+        NovusBinarySensor(hub_name, hub, device_info, description)
+        for description in hub.profile.bits
+    )
+    return True
+
+
+class NovusBinarySensor(CoordinatorEntity, BinarySensorEntity):
+    """Represents one bit of a status word on the controller"""
+
+    def __init__(
+        self,
+        platform_name: str,
+        hub: NovusHub,
+        device_info: DeviceInfo,
+        description: NovusBit,
+    ) -> None:
+        self._platform_name = platform_name
+        self._attr_device_info = device_info
+        self.entity_description = BinarySensorEntityDescription(
+            key=description.key,
+            name=description.name,
+            entity_registry_enabled_default=description.enabled,
+        )
+        self._address = description.address
+        self._mask = 1 << description.bit
+
+        # the hub only wakes entities whose bit flipped
+        super().__init__(coordinator=hub, context=description.key)
+
+    @property
+    def name(self) -> str:
+        """Returns the binary sensor name."""
+        return f"{self._platform_name} {self.entity_description.name}"
+
+    @property
+    def unique_id(self) -> Optional[str]:
+        """Returns the binary sensor's unique ID"""
+        return f"{self._platform_name}_{self.entity_description.key}"
+
+    @property
+    def extra_state_attributes(self) -> Optional[dict[str, Any]]:
+        """Flag values served from the last good read."""
+        key = self.entity_description.key
+        if key not in self.coordinator.stale:
+            return None
+        age = self.coordinator.value_age(key)
+        return {
+            "stale": True,
+            "last_read": dt_util.utcnow() - timedelta(seconds=age),
+        }
+
+    @property
+    def is_on(self) -> Optional[bool]:
+        """Return whether the bit is set in the last status word."""
+        word = self.coordinator.status_words.get(self._address)
+        if word is None:
+            return None
+        return bool(word & self._mask)
@@ -0,0 +1,55 @@
+"""Novus Modbus burst polling"""
+from __future__ import annotations
+
+from typing import Iterable, Mapping, Optional
+
+
+class BurstPolicy:
+    """Picks the scan interval from status bit transitions.
+
+    A flip of any trigger bit polls every interval seconds for the next
+    duration seconds, further flips extend the burst. After that the
+    interval doubles every poll until it is back at the base interval.
+    """
+
+    __slots__ = (
+        "base", "interval", "duration", "triggers", "current", "until", "bursts"
+    )
+
+    def __init__(
+        self, base: float, interval: float, duration: float, triggers: Iterable[str]
+    ):
+        self.base = base
+        self.interval = min(interval, base)
+        self.duration = duration
+        self.triggers = tuple(triggers)
+        self.current = base
+        # time.monotonic() the burst ends, None while idle
+        self.until: Optional[float] = None
+        self.bursts = 0
+
+    @property
+    def active(self) -> bool:
+        return self.current < self.base
+
+    def update(
+        self, previous: Mapping, data: Mapping, now: float
+    ) -> float:
+        """Return the interval until the next poll after data was read."""
+        flipped = [
+            key
+            for key in self.triggers
+            if key in data
+            and previous.get(key) is not None
+            and data[key] != previous[key]
+        ]
+        if flipped:
+            if self.until is None or now >= self.until:
+                self.bursts += 1
+            self.until = now + self.duration
+            self.current = self.interval
+        elif self.until is not None and now >= self.until:
+            self.current = min(self.current * 2, self.base)
+            if self.current >= self.base:
+                self.until = None
+        return self.current
@@ -0,0 +1,263 @@
+"""Novus Modbus raw frame capture and replay
+
+A capture file is a 5 byte header followed by one record per block read:
+
+    >d  wall clock timestamp
+    >B  unit id
+    >H  first register address
+    >B  register count
+    >nH the registers
+
+Files are append only and rotate to path.1, path.2, ... once they would
+grow past max_bytes. They are written on a thread of their own and read
+in the executor, readers memory map them.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict, deque
+from dataclasses import dataclass
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterator, Optional, Sequence
+
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.register_read_message import ReadHoldingRegistersResponse
+from pymodbus.register_write_message import WriteMultipleRegistersResponse
+
+from .const import TRANSPORT_REPLAY
+from .transport import NovusTransport
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"NVSC"
+VERSION = 1
+HEADER = MAGIC + bytes((VERSION,))
+RECORD = struct.Struct(">dBHB")
+# records waiting for the writer thread, a stalled disk drops the rest
+MAX_PENDING = 1024
+
+
+@dataclass(frozen=True)
+class Frame:
+    """One captured block read"""
+
+    timestamp: float
+    unit: int
+    address: int
+    registers: tuple[int, ...]
+
+
+class FrameRecorder:
+    """Appends block reads to a size bounded, rotating capture file
+
+    record() only packs the frame, a writer thread of its own does the
+    file I/O so the event loop never waits on the disk.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        backups: int = 1,
+        max_pending: int = MAX_PENDING,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_pending = max_pending
+        self.frames = 0
+        # frames lost to a full queue
+        self.dropped = 0
+        self._file: Optional[BinaryIO] = None
+        self._size = 0
+        self._pending: queue.SimpleQueue[Optional[bytes]] = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _open(self) -> BinaryIO:
+        file = open(self.path, "ab")  # pylint: disable=consider-using-with
+        self._file = file
+        self._size = file.tell()
+        if self._size == 0:
+            file.write(HEADER)
+            self._size = len(HEADER)
+        return file
+
+    def _rotate(self, file: BinaryIO) -> BinaryIO:
+        file.close()
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        _LOGGER.debug("rotated %s after %d frames", self.path, self.frames)
+        return self._open()
+
+    def _write(self, record: bytes) -> None:
+        file = self._file
+        if file is None:
+            file = self._open()
+        elif self._size + len(record) > self.max_bytes:
+            file = self._rotate(file)
+        file.write(record)
+        self._size += len(record)
+
+    def _run(self) -> None:
+        try:
+            while True:
+                record = self._pending.get()
+                if record is None:
+                    return
+                try:
+                    self._write(record)
+                except OSError as exception:
+                    _LOGGER.warning("writing %s failed: %s", self.path, exception)
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def record(self, unit: int, address: int, registers: Sequence[int]) -> None:
+        """Queue one block read for the writer thread."""
+        if self._closed:
+            return
+        count = len(registers)
+        record = RECORD.pack(time.time(), unit, address, count) + struct.pack(
+            f">{count}H", *registers
+        )
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"novus_modbus capture {self.path}",
+                daemon=True,
+            )
+            self._thread.start()
+        if self._pending.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.put(record)
+        self.frames += 1
+
+    def close(self) -> None:
+        """Write what is queued and close the file, without waiting for it."""
+        if self._closed:
+            return
+        self._closed = True
+        # the end marker, the thread closes the file once it got there
+        self._pending.put(None)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait until the writer thread closed the file, see close()."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def read_frames(path: str) -> Iterator[Frame]:
+    """Yield the frames of a capture file, oldest first."""
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size <= len(HEADER):
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[: len(HEADER)] != HEADER:
+                raise ValueError(f"{path} is not a capture file")
+            offset = len(HEADER)
+            end = len(data)
+            while offset + RECORD.size <= end:
+                timestamp, unit, address, count = RECORD.unpack_from(data, offset)
+                offset += RECORD.size
+                if offset + 2 * count > end:
+                    # torn last record of a file still being written
+                    break
+                registers = struct.unpack_from(f">{count}H", data, offset)
+                offset += 2 * count
+                yield Frame(timestamp, unit, address, registers)
+
+
+class ReplayTransport(NovusTransport):
+    """Serves block reads from a capture file instead of a bus.
+
+    Every unit's frames are applied in order to a register image. A read
+    consumes frames up to and including the next one overlapping the
+    requested block and answers from the image, so the hub may plan its
+    reads differently from the recording run. With a speed the answers
+    are held back to the recorded pace divided by speed, speed 0 replays
+    as fast as the hub asks. The capture is loaded in the executor when
+    the transport connects or on the first read.
+    """
+
+    mode = TRANSPORT_REPLAY
+    # recorded pace multiplier, 0 answers at once
+    speed: float
+
+    def __init__(self, path: str, speed: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self._frames: dict[int, deque[Frame]] = defaultdict(deque)
+        self._images: dict[int, list[int]] = defaultdict(list)
+        self._first: Optional[float] = None
+        self._loading: Optional[asyncio.Future] = None
+        self._started: Optional[float] = None
+
+    def _load(self) -> None:
+        for frame in read_frames(self.path):
+            if self._first is None:
+                self._first = frame.timestamp
+            self._frames[frame.unit].append(frame)
+
+    async def async_connect(self) -> None:
+        """Load the capture, once."""
+        if self._loading is None:
+            self._loading = asyncio.get_running_loop().run_in_executor(
+                None, self._load
+            )
+        await asyncio.shield(self._loading)
+
+    async def async_read(
+        self, unit: int, address: int, count: int, timeout: Optional[float] = None
+    ) -> ReadHoldingRegistersResponse:
+        """Return the block as of the next recorded read overlapping it."""
+        await self.async_connect()
+        frames = self._frames.get(unit)
+        image = self._images[unit]
+        end = address + count
+        frame = None
+        while frames:
+            frame = frames.popleft()
+            stop = frame.address + len(frame.registers)
+            if len(image) < stop:
+                image.extend([0] * (stop - len(image)))
+            image[frame.address:stop] = frame.registers
+            if frame.address < end and address < stop:
+                break
+        else:
+            raise ModbusIOException(f"capture of unit {unit} exhausted")
+
+        if self.speed > 0 and self._first is not None:
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now
+            delay = (frame.timestamp - self._first) / self.speed - (
+                now - self._started
+            )
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        return ReadHoldingRegistersResponse(image[address:end], slave=unit)
+
+    async def async_write(
+        self, unit: int, address: int, values: list[int]
+    ) -> WriteMultipleRegistersResponse:
+        """Writes are not part of a capture."""
+        raise ModbusIOException("writes are not replayed")
+
+    def close(self) -> None:
+        self._frames.clear()
@@ -1,61 +1,348 @@
+import asyncio
+import os
 import re
-import validators
+from typing import Any, Mapping, Optional
 
 from homeassistant import config_entries
 from homeassistant.const import CONF_HOST, CONF_NAME, CONF_SCAN_INTERVAL
 from homeassistant.core import HomeAssistant, callback
+from homeassistant.data_entry_flow import FlowResult
 import voluptuous as vol
 from homeassistant.helpers import config_validation as cv
 
-from .const import DEFAULT_NAME, DEFAULT_PORT, DEFAULT_SCAN_INTERVAL, DOMAIN
+from .const import (
+    CONF_BURST_DURATION,
+    CONF_BURST_INTERVAL,
+    CONF_BURST_TRIGGERS,
+    CONF_CAPTURE_MAX_BYTES,
+    CONF_CAPTURE_PATH,
+    CONF_DEADBAND,
+    CONF_DISCOVER,
+    CONF_MAX_AGE,
+    CONF_MAX_REGISTERS,
+    CONF_PIPELINE,
+    CONF_PROFILE,
+    CONF_REPLAY_SPEED,
+    CONF_RESTORE,
+    CONF_RETRIES,
+    CONF_SAMPLE_INTERVAL,
+    CONF_SAMPLE_WINDOW,
+    CONF_SLOW_INTERVAL,
+    CONF_TRANSPORT,
+    CONF_UNIT_ID,
+    DEFAULT_BURST_DURATION,
+    DEFAULT_BURST_INTERVAL,
+    DEFAULT_BURST_TRIGGERS,
+    DEFAULT_CAPTURE_MAX_BYTES,
+    DEFAULT_CAPTURE_PATH,
+    DEFAULT_DEADBAND,
+    DEFAULT_MAX_AGE,
+    DEFAULT_MAX_REGISTERS,
+    DEFAULT_NAME,
+    DEFAULT_PIPELINE,
+    DEFAULT_REPLAY_SPEED,
+    DEFAULT_RESTORE,
+    DEFAULT_RETRIES,
+    DEFAULT_PORT,
+    DEFAULT_SAMPLE_INTERVAL,
+    DEFAULT_SAMPLE_WINDOW,
+    DEFAULT_SCAN_INTERVAL,
+    DEFAULT_SLOW_INTERVAL,
+    DEFAULT_TRANSPORT,
+    DEFAULT_UNIT_ID,
+    DOMAIN,
+    PROFILE_AUTO,
+    REGISTERS,
+    ENTRY_IDENTITY,
+    MODBUS_MAX_REGISTERS,
+    TRANSPORT_ASYNC,
+    TRANSPORT_REPLAY,
+    TRANSPORT_SYNC,
+)
+from .discovery import DiscoveredUnit, async_discover
+
+# /dev/ttyUSB0, /dev/serial/by-id/..., COM3
+SERIAL_PORT = re.compile(r"^(/dev/\S+|com\d+)$", re.IGNORECASE)
+# an RFC 1123 host name or IPv4 address
+HOSTNAME = re.compile(
+    r"^(?=.{1,253}$)[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?"
+    r"(\.[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?)*$",
+    re.IGNORECASE,
+)
+
+
+def valid_bus(host: str) -> bool:
+    """Return whether host is a serial port or a host[:port] to connect to."""
+    if SERIAL_PORT.match(host):
+        return True
+    hostname, colon, port = host.rpartition(":")
+    if not colon:
+        hostname = host
+    elif not (port.isdigit() and 0 < int(port) < 65536):
+        return False
+    return HOSTNAME.match(hostname) is not None
+
 
 DATA_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_NAME, default=DEFAULT_NAME): str,
         vol.Required(CONF_HOST, default="localhost"): str,
+        vol.Optional(CONF_UNIT_ID, default=DEFAULT_UNIT_ID): vol.All(
+            int, vol.Range(min=1, max=247)
+        ),
+        vol.Optional(CONF_DISCOVER, default=False): bool,
+        vol.Optional(CONF_TRANSPORT, default=DEFAULT_TRANSPORT): vol.In(
+            [TRANSPORT_ASYNC, TRANSPORT_SYNC, TRANSPORT_REPLAY]
+        ),
         vol.Optional(CONF_SCAN_INTERVAL, default=DEFAULT_SCAN_INTERVAL): int,
     }
 )
 
+# everything that can change without re-adding the controller, with its
+# default
+OPTIONS = {
+    CONF_SCAN_INTERVAL: DEFAULT_SCAN_INTERVAL,
+    CONF_SLOW_INTERVAL: DEFAULT_SLOW_INTERVAL,
+    CONF_MAX_REGISTERS: DEFAULT_MAX_REGISTERS,
+    CONF_PIPELINE: DEFAULT_PIPELINE,
+    CONF_DEADBAND: DEFAULT_DEADBAND,
+    CONF_RETRIES: DEFAULT_RETRIES,
+    CONF_MAX_AGE: DEFAULT_MAX_AGE,
+    CONF_SAMPLE_INTERVAL: DEFAULT_SAMPLE_INTERVAL,
+    CONF_SAMPLE_WINDOW: DEFAULT_SAMPLE_WINDOW,
+    CONF_BURST_INTERVAL: DEFAULT_BURST_INTERVAL,
+    CONF_BURST_DURATION: DEFAULT_BURST_DURATION,
+    CONF_PROFILE: PROFILE_AUTO,
+    CONF_RESTORE: DEFAULT_RESTORE,
+    CONF_CAPTURE_PATH: DEFAULT_CAPTURE_PATH,
+    CONF_CAPTURE_MAX_BYTES: DEFAULT_CAPTURE_MAX_BYTES,
+    CONF_REPLAY_SPEED: DEFAULT_REPLAY_SPEED,
+    CONF_BURST_TRIGGERS: list(DEFAULT_BURST_TRIGGERS),
+}
+
+OPTION_VALIDATORS = {
+    CONF_SCAN_INTERVAL: vol.All(int, vol.Range(min=1)),
+    CONF_SLOW_INTERVAL: vol.All(int, vol.Range(min=1)),
+    CONF_MAX_REGISTERS: vol.All(int, vol.Range(min=1, max=MODBUS_MAX_REGISTERS)),
+    CONF_PIPELINE: vol.All(int, vol.Range(min=1, max=16)),
+    CONF_DEADBAND: vol.All(vol.Coerce(float), vol.Range(min=0)),
+    CONF_RETRIES: vol.All(int, vol.Range(min=0)),
+    CONF_MAX_AGE: vol.All(int, vol.Range(min=0)),
+    CONF_SAMPLE_INTERVAL: vol.All(vol.Coerce(float), vol.Range(min=0)),
+    CONF_SAMPLE_WINDOW: vol.All(int, vol.Range(min=1)),
+    CONF_BURST_INTERVAL: vol.All(vol.Coerce(float), vol.Range(min=0)),
+    CONF_BURST_DURATION: vol.All(int, vol.Range(min=0)),
+    CONF_PROFILE: str,
+    CONF_RESTORE: bool,
+    CONF_CAPTURE_PATH: str,
+    CONF_CAPTURE_MAX_BYTES: vol.All(int, vol.Range(min=1024)),
+    CONF_REPLAY_SPEED: vol.All(vol.Coerce(float), vol.Range(min=0)),
+    CONF_BURST_TRIGGERS: cv.multi_select(
+        {
+            register.key: register.name
+            for register in REGISTERS.values()
+            if register.bit is not None
+        }
+    ),
+}
+
+
+def options_schema(current: Mapping) -> vol.Schema:
+    """Return the options form, prefilled with the current settings."""
+    fields = {}
+    for key, validator in OPTION_VALIDATORS.items():
+        default = current.get(key, OPTIONS[key])
+        fields[vol.Optional(key, default=default)] = validator
+    return vol.Schema(fields)
+
 
 @callback
-def novus_modbus_entries(hass: HomeAssistant):
-    """Return the hosts already configured."""
+def novus_modbus_entries(hass: HomeAssistant) -> set[tuple[str, int]]:
+    """Return the (host, unit id) pairs already configured."""
     return {
-        entry.data[CONF_HOST] for entry in hass.config_entries.async_entries(DOMAIN)
+        (entry.data[CONF_HOST], entry.data.get(CONF_UNIT_ID, DEFAULT_UNIT_ID))
+        for entry in hass.config_entries.async_entries(DOMAIN)
     }
 
 
 class NovusModbusConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Novus Modbus configflow."""
 
-    VERSION = 1
+    # 2: status bits are binary sensors, see async_migrate_entry
+    VERSION = 2
     CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_POLL
 
-    async def async_step_user(self, user_input=None):
+    def __init__(self) -> None:
+        self._config: dict = {}
+        self._discovered: dict[str, DiscoveredUnit] = {}
+        self._discovery: Optional[asyncio.Task] = None
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(
+        config_entry: config_entries.ConfigEntry,
+    ) -> config_entries.OptionsFlow:
+        return NovusModbusOptionsFlow(config_entry)
+
+    async def async_step_user(
+        self, user_input: Optional[dict[str, Any]] = None
+    ) -> FlowResult:
         """Handle initial configuration"""
         errors = {}
 
         if user_input is not None:
             host = user_input[CONF_HOST]
+            unit_id = user_input[CONF_UNIT_ID]
+            discover = user_input.pop(CONF_DISCOVER, False)
 
-            if self._host_config_exists(host):
+            if not discover and self._host_config_exists(host, unit_id):
                 errors[CONF_HOST] = "already_configured"
-            elif not validators.url(host):
-                errors[CONF_HOST] = "invalid host"
             else:
-                await self.async_set_unique_id(user_input[CONF_HOST])
-                self._abort_if_unique_id_configured()
-                return self.async_create_entry(
-                    title=user_input[CONF_NAME], data=user_input
-                )
+                transport = user_input.get(CONF_TRANSPORT, DEFAULT_TRANSPORT)
+                error = await self._async_host_error(host, transport)
+                if error is not None:
+                    errors[CONF_HOST] = error
+                elif discover:
+                    self._config = user_input
+                    return await self.async_step_discover()
+                else:
+                    await self.async_set_unique_id(f"{host}_{unit_id}")
+                    self._abort_if_unique_id_configured()
+                    return self.async_create_entry(
+                        title=user_input[CONF_NAME], data=user_input
+                    )
 
         return self.async_show_form(
             step_id="user", data_schema=DATA_SCHEMA, errors=errors
         )
 
-    def _host_config_exists(self, host) -> bool:
+    async def async_step_discover(
+        self, user_input: Optional[dict[str, Any]] = None
+    ) -> FlowResult:
+        """Scan the bus, a full RTU scan takes a while"""
+        host = self._config[CONF_HOST]
+
+        if self._discovery is None:
+            self._discovery = self.hass.async_create_task(
+                async_discover(self.hass, host)
+            )
+        if not self._discovery.done():
+            return self.async_show_progress(
+                step_id="discover",
+                progress_action="discover",
+                progress_task=self._discovery,
+                description_placeholders={"host": host},
+            )
+
+        configured = novus_modbus_entries(self.hass)
+        self._discovered = {
+            str(unit.unit_id): unit
+            for unit in self._discovery.result()
+            if (host, unit.unit_id) not in configured
+        }
+        if not self._discovered:
+            return self.async_show_progress_done(next_step_id="no_units")
+        return self.async_show_progress_done(next_step_id="units")
+
+    async def async_step_no_units(
+        self, user_input: Optional[dict[str, Any]] = None
+    ) -> FlowResult:
+        """Nothing new answered the scan"""
+        return self.async_abort(reason="no_units_found")
+
+    async def async_step_units(
+        self, user_input: Optional[dict[str, Any]] = None
+    ) -> FlowResult:
+        """Pick the discovered controllers to add"""
+        if user_input is not None:
+            selected = [self._discovered[unit] for unit in user_input["units"]]
+            if selected:
+                return await self._async_create_entries(selected)
+
+        return self.async_show_form(
+            step_id="units",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(
+                        "units", default=list(self._discovered)
+                    ): cv.multi_select(
+                        {key: str(unit) for key, unit in self._discovered.items()}
+                    ),
+                }
+            ),
+            description_placeholders={"host": self._config[CONF_HOST]},
+        )
+
+    async def _async_create_entries(self, units: list[DiscoveredUnit]) -> FlowResult:
+        """Create this flow's entry for the first unit, import the others."""
+        entries = []
+        for unit in units:
+            # the fingerprint seeds the identity cache of the new entry
+            identity = {
+                "serial_high": unit.serial_high,
+                "serial_low": unit.serial_low,
+            }
+            if unit.version is not None:
+                identity["version_and_screen_n"] = unit.version
+            data = {
+                **self._config,
+                CONF_UNIT_ID: unit.unit_id,
+                ENTRY_IDENTITY: identity,
+            }
+            if len(units) > 1:
+                data[CONF_NAME] = f"{self._config[CONF_NAME]} {unit.unit_id}"
+            entries.append(data)
+
+        for data in entries[1:]:
+            self.hass.async_create_task(
+                self.hass.config_entries.flow.async_init(
+                    DOMAIN,
+                    context={"source": config_entries.SOURCE_IMPORT},
+                    data=data,
+                )
+            )
+
+        data = entries[0]
+        await self.async_set_unique_id(f"{data[CONF_HOST]}_{data[CONF_UNIT_ID]}")
+        self._abort_if_unique_id_configured()
+        return self.async_create_entry(title=data[CONF_NAME], data=data)
+
+    async def async_step_import(self, import_data: dict[str, Any]) -> FlowResult:
+        """Add a controller found by discovery"""
+        await self.async_set_unique_id(
+            f"{import_data[CONF_HOST]}_{import_data[CONF_UNIT_ID]}"
+        )
+        self._abort_if_unique_id_configured()
+        return self.async_create_entry(title=import_data[CONF_NAME], data=import_data)
+
+    async def _async_host_error(self, host: str, transport: str) -> Optional[str]:
+        """Return why host does not fit transport, None if it does."""
+        if transport == TRANSPORT_REPLAY:
+            # the path of a capture file instead of a bus
+            if not await self.hass.async_add_executor_job(os.path.isfile, host):
+                return "capture_not_found"
+        elif not valid_bus(host):
+            return "invalid_host"
+        return None
+
+    def _host_config_exists(self, host: str, unit_id: int) -> bool:
         """Return True if configuration already exists"""
-        if host in novus_modbus_entries(self.hass):
+        if (host, unit_id) in novus_modbus_entries(self.hass):
             return True
         return False
+
+
+class NovusModbusOptionsFlow(config_entries.OptionsFlow):
+    """Change the polling settings of a controller, the entry reloads."""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        self.config_entry = config_entry
+
+    async def async_step_init(
+        self, user_input: Optional[dict[str, Any]] = None
+    ) -> FlowResult:
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        current = {**self.config_entry.data, **self.config_entry.options}
+        return self.async_show_form(step_id="init", data_schema=options_schema(current))
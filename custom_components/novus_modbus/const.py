@@ -1,14 +1,12 @@
-from dataclasses import dataclass
-
-from homeassistant.components.sensor import (
-    STATE_CLASS_MEASUREMENT,
-    SensorDeviceClass,
-    SensorEntityDescription,
-)
+"""Novus Modbus constants and register descriptions
 
-from homeassistant.const import (
-    TEMP_CELSIUS,
-)
+Nothing here imports Home Assistant, the platforms turn the register
+descriptions into entity descriptions.
+"""
+from dataclasses import dataclass
+import json
+import os
+from typing import Mapping, Optional
 
 DOMAIN = "novus_modbus"
 DEFAULT_NAME = "Novus Temperature Controller"
@@ -16,177 +14,198 @@ DEFAULT_SCAN_INTERVAL = 10
 DEFAULT_PORT = 502
 ATTR_MANUFACTURER = "Novus Automation"
 
+CONF_UNIT_ID = "unit_id"
+DEFAULT_UNIT_ID = 1
+# scan the bus for controllers instead of adding the given unit id
+CONF_DISCOVER = "discover"
+
+CONF_MAX_REGISTERS = "max_registers"
+# the controller refuses to return more than 4 registers per request
+DEFAULT_MAX_REGISTERS = 4
+# the most a read holding registers request may ask for
+MODBUS_MAX_REGISTERS = 125
+
+# temperature changes smaller than the deadband do not update entities
+CONF_DEADBAND = "deadband"
+DEFAULT_DEADBAND = 0.0
+
+# register groups are refreshed at different rates: live values every
+# poll, setpoints every slow interval, identity once per connection.
+TIER_LIVE = "live"
+TIER_SLOW = "slow"
+TIER_IDENTITY = "identity"
+CONF_SLOW_INTERVAL = "slow_interval"
+DEFAULT_SLOW_INTERVAL = 300
+# identity values cached in the config entry across restarts
+ENTRY_IDENTITY = "identity"
+
+# a failed block read is retried this many times, after that its values
+# are served from the last good read for at most max_age seconds
+CONF_RETRIES = "retries"
+DEFAULT_RETRIES = 1
+CONF_MAX_AGE = "max_age"
+DEFAULT_MAX_AGE = 60
+
+# T1/T2 are optionally sampled every sample_interval seconds (0 disables)
+# into ring buffers holding sample_window seconds, entities publish the
+# min/max/mean/last of each scan interval
+CONF_SAMPLE_INTERVAL = "sample_interval"
+DEFAULT_SAMPLE_INTERVAL = 0.0
+CONF_SAMPLE_WINDOW = "sample_window"
+DEFAULT_SAMPLE_WINDOW = 300
+SAMPLED_REGISTERS = ("r0", "r1", "r2")
+SAMPLE_STATS = ("min", "max", "mean", "last")
+
+# a flip of any burst trigger bit polls every burst_interval seconds (0
+# disables) for burst_duration seconds, then decays back to scan_interval
+CONF_BURST_INTERVAL = "burst_interval"
+DEFAULT_BURST_INTERVAL = 0.0
+CONF_BURST_DURATION = "burst_duration"
+DEFAULT_BURST_DURATION = 120
+CONF_BURST_TRIGGERS = "burst_triggers"
+DEFAULT_BURST_TRIGGERS = (
+    "ihm_p1_out1",
+    "ihm_p1_out2",
+    "ihm_status_defrost",
+    "ice_status",
+    "ht1_status",
+    "ht2_status",
+)
+
+CONF_TRANSPORT = "transport"
+TRANSPORT_ASYNC = "async"
+TRANSPORT_SYNC = "sync"
+# reads answered from a capture file, host is the file's path
+TRANSPORT_REPLAY = "replay"
+DEFAULT_TRANSPORT = TRANSPORT_ASYNC
+# transactions in flight at once on a Modbus TCP connection, gateways
+# that match answers by transaction id can take more than 1 (async only)
+CONF_PIPELINE = "pipeline"
+DEFAULT_PIPELINE = 1
+
+# every block read is appended to capture_path (empty disables), which
+# rotates once it reaches capture_max_bytes. replay_speed scales the pace
+# of the replay transport, 0 replays as fast as the hub polls.
+CONF_CAPTURE_PATH = "capture_path"
+DEFAULT_CAPTURE_PATH = ""
+CONF_CAPTURE_MAX_BYTES = "capture_max_bytes"
+DEFAULT_CAPTURE_MAX_BYTES = 10 * 1024 * 1024
+CONF_REPLAY_SPEED = "replay_speed"
+DEFAULT_REPLAY_SPEED = 1.0
+
+# entities start out with the last saved snapshot (flagged stale) while
+# the connection opens in the background, the snapshot is saved at most
+# every STORE_DELAY seconds
+CONF_RESTORE = "restore"
+DEFAULT_RESTORE = True
+STORE_VERSION = 1
+STORE_DELAY = 60
+
+# controller model whose register map (profiles/<model>.json) is polled,
+# auto picks it from the version register. Profiles dropped into
+# <config>/novus_modbus/profiles are loaded next to the built-in ones.
+CONF_PROFILE = "profile"
+PROFILE_AUTO = "auto"
+DEFAULT_PROFILE = "differential"
+PROFILES_DIR = os.path.join(os.path.dirname(__file__), "profiles")
+PROFILES_CONFIG_DIR = os.path.join(DOMAIN, "profiles")
+# model picked by auto detection, cached in the config entry
+ENTRY_PROFILE = "detected_profile"
+DATA_TYPES = ("int16", "uint16")
+TIERS = (TIER_LIVE, TIER_SLOW, TIER_IDENTITY)
+
 
-@dataclass
-class NovusRegister(SensorEntityDescription):
-    """Generic container for register values"""
+@dataclass(frozen=True)
+class NovusRegister:
+    """Generic container for register values
 
+    key: unique id of the value, e.g. t1_temp_c
+    name: shown in entity names
+    address: holding register the value is read from
+    data_type: "int16" or "uint16"
+    scale: raw value is divided by scale (e.g. 10 for tenths of a degree)
+    bit: if set, the value is this bit of the register word
+    deadband: smallest change that updates the entity, overrides the
+        configured deadband for temperatures
+    tier: how often the register is refreshed (live, slow or identity)
+    writable: the register is a setpoint exposed as a number entity
+    enabled: the entity is enabled when the controller is added
+    """
 
-@dataclass
+    key: str
+    name: Optional[str] = None
+    address: Optional[int] = None
+    data_type: str = "int16"
+    scale: int = 1
+    bit: Optional[int] = None
+    deadband: Optional[float] = None
+    tier: str = TIER_LIVE
+    writable: bool = False
+    enabled: bool = True
+
+
+@dataclass(frozen=True)
 class NovusTemperature(NovusRegister):
-    """Registers holding temperature values"""
-
-    device_class = SensorDeviceClass.TEMPERATURE
-    state_class = STATE_CLASS_MEASUREMENT
-    native_unit_of_measurement = TEMP_CELSIUS
-    icon = "mdi:thermometer"
-
-
-REGISTERS: dict[str, list[NovusRegister]] = {
-    "r0": NovusTemperature(
-        key="t1_temp_c",
-        name="T1 Temperature",
-    ),
-    "r1": NovusTemperature(
-        key="t2_temp_c",
-        name="T2 Temperature",
-    ),
-    "r2": NovusTemperature(
-        key="temp_diff_c",
-        name="T1-T2 Temperature (dIF)",
-    ),
-    "r3": NovusTemperature(
-        key="don",
-        name="Differential setpoint for pump activation (dOn)",
-    ),
-    "r4": NovusTemperature(
-        key="doff",
-        name="Differential setpoint for pump deactivation (dOff)",
-    ),
-    "r5": NovusTemperature(
-        key="ind",
-        name="Temperature value shown on display (Ind)",
-    ),
-    "r6": NovusRegister(
-        key="serial_high",
-        name="First 3 digits of the controller serial number",
-    ),
-    "r7": NovusRegister(
-        key="serial_low",
-        name="Last 3 digits of the controller serial number",
-    ),
-    "r8": NovusTemperature(
-        key="ice",
-        name="Anti-frost temperature setpoint (ICE)",
-    ),
-    "r9": NovusTemperature(
-        key="ht1",
-        name="Temperature setpoint T1 overheating (Ht1)",
-    ),
-    "r10": NovusTemperature(
-        key="ht2",
-        name="Temperature setpoint T2 critical maximum in the tank (Ht2)",
-    ),
-    "r11": NovusTemperature(
-        key="hys",
-        name="Anti-frost temperature T1 hysteresis (HYS)",
-    ),
-    "r12": NovusTemperature(
-        key="hy1",
-        name="Hysteresis of the overheating temperature T1 (Hy1)",
-    ),
-    "r13": NovusTemperature(
-        key="hy2",
-        name="Hysteresis of the overheating temperature T2 (Hy2)",
-    ),
-    # r14: IHM status bits (see below)
-    "r15": NovusRegister(
-        key="control_status",
-        name="Measurement Status",
-    ),
-    "r16": NovusRegister(
-        key="screen_display_value",
-        name="Value displayed on screen",
-    ),
-    "r17": NovusRegister(
-        key="version_and_screen_n",
-        name="Software version and currently displayed screen",
-    ),
-    "r18": NovusTemperature(
-        key="of1",
-        name="Offset value for sensor 1 measurement (oF1)",
-    ),
-    "r19": NovusTemperature(
-        key="of2",
-        name="Offset value for sensor 2 measurement (oF2)",
-    ),
-    # r20: ICE, HT1, HT2 status bits (see below)
-    "ihm_p1_out1": NovusRegister(
-        key="ihm_p1_out1",
-        name="P1 (OUT1) Enabled",
-    ),
-    "ihm_p2_out2": NovusRegister(
-        key="ihm_p2_out2",
-        name="P2 (OUT2) Enabled",
-    ),
-    "ihm_pv": NovusRegister(
-        key="ihm_pv",
-        name="PV Enabled",
-    ),
-    "ihm_rx": NovusRegister(
-        key="ihm_rx",
-        name="Serial Command Received",
-    ),
-    "ihm_internal_4": NovusRegister(
-        key="ihm_internal_4",
-        name="Internal Control (bit 4)",
-    ),
-    "ihm_status_t1": NovusRegister(
-        key="ihm_status_t1",
-        name="T1 Status LED",
-    ),
-    "ihm_status_defrost": NovusRegister(
-        key="ihm_status_defrost",
-        name="Defrosting",
-    ),
-    "ihm_status_t2": NovusRegister(
-        key="ihm_status_t2",
-        name="T2 Status LED",
-    ),
-    "ihm_internal_8": NovusRegister(
-        key="ihm_internal_8",
-        name="Internal Control (bit 8)",
-    ),
-    "ihm_internal_9": NovusRegister(
-        key="ihm_internal_9",
-        name="Internal Control (bit 9)",
-    ),
-    "ihm_value_has_decimal": NovusRegister(
-        key="ihm_value_has_decimal",
-        name="Value has a decimal point",
-    ),
-    "ihm_internal_11": NovusRegister(
-        key="ihm_internal_11",
-        name="Internal Control (bit 11)",
-    ),
-    "ihm_internal_12": NovusRegister(
-        key="ihm_internal_12",
-        name="Internal Control (bit 12)",
-    ),
-    "ihm_internal_13": NovusRegister(
-        key="ihm_internal_13",
-        name="Internal Control (bit 13)",
-    ),
-    "ihm_internal_14": NovusRegister(
-        key="ihm_internal_14",
-        name="Internal Control (bit 14)",
-    ),
-    "ihm_internal_15": NovusRegister(
-        key="ihm_internal_15",
-        name="Internal Control (bit 15)",
-    ),
-    "ice_status": NovusRegister(
-        key="ice_status",
-        name="Defrosting Enabled (ICE)",
-    ),
-    "ht1_status": NovusRegister(
-        key="ht1_status",
-        name="HT1 Enabled",
-    ),
-    "ht2_status": NovusRegister(
-        key="ht2_status",
-        name="HT2 Enabled",
-    ),
-    # r21-23 (sp1, b1y, ac1) result in errors when read.
-    # the documentation is very unclear here.
+    """Registers holding temperature values, in degrees Celsius"""
+
+
+@dataclass(frozen=True)
+class NovusBit:
+    """One bit of a status word, shown as a binary sensor
+
+    address: holding register of the status word
+    bit: position of the bit in the word
+    """
+
+    key: str
+    name: Optional[str] = None
+    address: int = 0
+    bit: int = 0
+    enabled: bool = True
+
+
+def register_description(spec: dict) -> NovusRegister:
+    """Build the description of one register of a profile."""
+    spec = dict(spec)
+    if spec.pop("kind", None) == "temperature":
+        return NovusTemperature(**spec)
+    return NovusRegister(**spec)
+
+
+def _load_profile_data(model: str) -> dict:
+    with open(os.path.join(PROFILES_DIR, f"{model}.json"), encoding="utf-8") as file:
+        return json.load(file)
+
+
+# the built-in controller's map, profiles/differential.json. The hubs poll
+# the map of their profile, see profile.py.
+_DEFAULT_PROFILE_DATA = _load_profile_data(DEFAULT_PROFILE)
+REGISTERS: dict[str, NovusRegister] = {
+    register_id: register_description(spec)
+    for register_id, spec in _DEFAULT_PROFILE_DATA["registers"].items()
 }
+# r21-23 (sp1, b1y, ac1) result in errors when read,
+# the read planner never includes them in a request.
+UNREADABLE_REGISTERS = tuple(_DEFAULT_PROFILE_DATA["unreadable"])
+
+
+def aggregates(
+    registers: Mapping[str, NovusRegister]
+) -> tuple[NovusTemperature, ...]:
+    """Describe the windowed aggregates of the fast sampled registers.
+
+    Keys follow the profile's register keys, e.g. t1_temp_c_max, like the
+    data the sampler publishes.
+    """
+    return tuple(
+        NovusTemperature(
+            key=f"{registers[register].key}_{stat}",
+            name=f"{registers[register].name} ({stat})",
+        )
+        for register in SAMPLED_REGISTERS
+        for stat in SAMPLE_STATS
+    )
+
+
+# listener context of the diagnostic entities, woken after every poll
+TELEMETRY_CONTEXT = "telemetry"
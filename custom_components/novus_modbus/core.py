@@ -0,0 +1,358 @@
+"""Novus Modbus polling core
+
+Reads, plans and decodes one controller without Home Assistant: NovusHub
+wraps a core as its coordinator, the headless runner polls cores
+directly. Nothing here imports Home Assistant, the transport stack is
+imported on first use.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, Optional, cast
+
+from .const import TRANSPORT_REPLAY
+from .decoder import BlockDecoder
+from .planner import ReadBlock
+from .scheduler import DeadlineExceeded, DeviceBackoff
+from .snapshot import Snapshot, SnapshotLayout
+from .telemetry import PollTelemetry
+from .tracing import STAGE_DECODE
+
+if TYPE_CHECKING:
+    from .capture import FrameRecorder, ReplayTransport
+    from .profile import Profile
+    from .transport import NovusTransport
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PollFailed(Exception):
+    """No block of a poll was answered"""
+
+
+class CoreClosed(Exception):
+    """The core was closed, its bus connection released for good"""
+
+
+class NovusCore:
+    """Polls one controller into immutable snapshots.
+
+    Registers are read in tiers, each with its own interval (None reads
+    a tier once per connection). A block that cannot be read keeps
+    serving its last known good values until they are older than
+    max_age, its keys are listed in stale meanwhile.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        hostname: str,
+        profile: Profile,
+        tier_intervals: Mapping[str, Optional[float]],
+        max_registers: int,
+        transport: str,
+        unit_id: int,
+        retries: int,
+        max_age: float,
+        pipeline: int = 1,
+        replay_speed: float = 0,
+        recorder: Optional[FrameRecorder] = None,
+        extra_keys: Iterable[str] = (),
+    ):
+        self.name = name
+        self._hostname = hostname
+        self._transport_mode = transport
+        self._pipeline = pipeline
+        self._replay_speed = replay_speed
+        # acquired on first use, which is what imports pymodbus
+        self._transport: Optional[NovusTransport] = None
+        self._closed = False
+        self.unit_id = unit_id
+        self.profile = profile
+        self.telemetry = PollTelemetry()
+        self.recorder = recorder
+        self.retries = retries
+        self.max_age = max_age
+
+        # seconds between reads of each tier, None reads once per connection
+        self._tier_intervals = dict(tier_intervals)
+        # time.monotonic() each tier is next due, None once read for good
+        self._next_read: dict[str, Optional[float]] = dict.fromkeys(
+            self._tier_intervals, 0.0
+        )
+        # one read plan per combination of due tiers, shared by every core
+        # of the profile
+        self.plans: dict[frozenset[str], tuple[BlockDecoder, ...]] = (
+            profile.plans(max_registers)
+        )
+        self._key_tiers = {r.key: r.tier for r in profile.registers.values()}
+        # tiers due at the last poll, and those read without a failed block
+        self.due: frozenset[str] = frozenset()
+        self.read_tiers: frozenset[str] = frozenset()
+
+        # every poll's values go into one immutable snapshot of this layout
+        self.layout = SnapshotLayout(
+            [register.key for register in profile.registers.values()]
+            + list(extra_keys)
+        )
+        # merged values of every tier, a key without a value holds None so
+        # snapshots are one C call. read_at holds the time.monotonic() each
+        # key was last read, stale the keys served from last known good
+        # values after a failed read.
+        self.values: dict = self.layout.values()
+        self.read_at: dict[str, float] = {}
+        self.stale: set[str] = set()
+        self._failed: set[str] = set()
+        # values decoded by the last read, before merging
+        self.decoded: dict = {}
+
+        # raw status words by address, binary sensors test their bit of it.
+        # A read XORs old and new words and lists the bits that flipped.
+        self.status_words: dict[int, int] = {}
+        self._status_bits: dict[int, dict[int, str]] = {}
+        self._bit_addresses: dict[str, int] = {}
+        for bit in profile.bits:
+            self._status_bits.setdefault(bit.address, {})[1 << bit.bit] = bit.key
+            self._bit_addresses[bit.key] = bit.address
+        self._status_masks = {
+            address: sum(bits) for address, bits in self._status_bits.items()
+        }
+        self.flipped: set[str] = set()
+
+    @property
+    def bit_keys(self) -> frozenset[str]:
+        return frozenset(self._bit_addresses)
+
+    @property
+    def transport(self) -> NovusTransport:
+        """Return the bus connection, acquiring it on first use.
+
+        Raises CoreClosed after close(), a closed core never reopens the bus.
+        """
+        if self._closed:
+            raise CoreClosed(f"{self.name} is closed")
+        if self._transport is None:
+            from .transport import acquire_transport
+
+            transport = acquire_transport(
+                self._hostname, self._transport_mode, self._pipeline
+            )
+            if self._transport_mode == TRANSPORT_REPLAY:
+                # 0 replays as fast as the core polls
+                cast("ReplayTransport", transport).speed = self._replay_speed
+            self._transport = transport
+        return self._transport
+
+    def close(self) -> None:
+        """Release the (possibly shared) bus connection, for good."""
+        self._closed = True
+        if self._transport is not None:
+            from .transport import release_transport
+
+            release_transport(self._transport)
+            self._transport = None
+
+    def snapshot(self) -> Snapshot:
+        return self.layout.snapshot(self.values)
+
+    def update(self, values: Mapping) -> Snapshot:
+        """Merge values from outside a read, e.g. a written setpoint."""
+        self.values.update(values)
+        return self.snapshot()
+
+    def restore(self, values: Mapping, age: float) -> Snapshot:
+        """Serve values saved age seconds ago until they are read again.
+
+        Tiers read once per connection are not marked stale.
+        """
+        read_at = time.monotonic() - age
+        restored = set()
+        for key, value in values.items():
+            if key in self.layout.index and value is not None:
+                self.values[key] = value
+                self.read_at[key] = read_at
+                tier = self._key_tiers.get(key)
+                if tier is None or self._tier_intervals[tier] is not None:
+                    restored.add(key)
+        self.stale = restored
+        self._flip(self._status_from_values())
+        return self.snapshot()
+
+    def saved_values(self) -> dict:
+        """Return every value worth restoring."""
+        return {
+            key: value
+            for key, value in self.values.items()
+            if value is not None and key in self.layout.index
+        }
+
+    def due_tiers(self, now: float) -> frozenset[str]:
+        """Return the tiers that need reading at now."""
+        return frozenset(
+            tier
+            for tier, due in self._next_read.items()
+            if due is not None and now >= due
+        )
+
+    def read_soon(self, tiers: Iterable[str]) -> None:
+        """Read tiers with the next poll."""
+        for tier in tiers:
+            self._next_read[tier] = 0.0
+
+    def reset_tiers(self) -> None:
+        """Re-read every tier after a failure, the connection may be new."""
+        self.read_soon(self._next_read)
+
+    def value_age(self, key: str) -> Optional[float]:
+        """Return the seconds since key was last read from the controller."""
+        read_at = self.read_at.get(key)
+        return None if read_at is None else time.monotonic() - read_at
+
+    async def async_poll(self, deadline: Optional[float] = None) -> Snapshot:
+        """Read the tiers that are due and return the merged snapshot.
+
+        deadline is the time.monotonic() by which every block must be on
+        the wire. Raises if no block was answered.
+        """
+        started = time.monotonic()
+        self.due = due = self.due_tiers(started)
+        try:
+            snapshot = await self.async_read(due, deadline)
+        except Exception:
+            self.telemetry.record_poll(time.monotonic() - started, False)
+            self.read_tiers = frozenset()
+            self.reset_tiers()
+            raise
+        self.telemetry.record_poll(time.monotonic() - started, True)
+
+        # a tier that lost a block is read again next poll
+        self.read_tiers = due - {self._key_tiers[key] for key in self._failed}
+        for tier in self.read_tiers:
+            interval = self._tier_intervals[tier]
+            self._next_read[tier] = None if interval is None else started + interval
+        return snapshot
+
+    async def _async_read_block(
+        self, block: ReadBlock, deadline: Optional[float]
+    ) -> Optional[list[int]]:
+        """Read one block's registers, retrying a bounded number of times.
+
+        Words a misbehaving device sends beyond the block are dropped.
+        """
+        scheduler = self.transport.scheduler
+        for attempt in range(self.retries + 1):
+            try:
+                resp = await scheduler.async_read(
+                    self.unit_id, block.address, block.count, deadline, self.telemetry
+                )
+            except (DeviceBackoff, DeadlineExceeded) as exception:
+                _LOGGER.debug(
+                    "%s: r%d skipped: %s", self.name, block.address, exception
+                )
+                return None
+            except Exception as exception:
+                error: object = exception
+            else:
+                if not resp.isError() and len(resp.registers) >= block.count:
+                    return resp.registers[: block.count]
+                error = resp
+            _LOGGER.debug(
+                "%s: reading r%d failed (attempt %d): %s",
+                self.name,
+                block.address,
+                attempt + 1,
+                error,
+            )
+        return None
+
+    async def async_read(
+        self,
+        tiers: Optional[frozenset[str]] = None,
+        deadline: Optional[float] = None,
+    ) -> Snapshot:
+        """Read the given tiers (default all) and merge them into the snapshot."""
+        if tiers is None:
+            tiers = frozenset(self._tier_intervals)
+        data: dict[str, Any] = {}
+        words: dict[int, Optional[int]] = {}
+        stale: set[str] = set()
+        plan = self.plans[tiers]
+
+        # every block is queued at once, a pipelining transport puts them
+        # on the wire without waiting for each answer
+        responses = await asyncio.gather(
+            *(self._async_read_block(decoder.block, deadline) for decoder in plan)
+        )
+        tracer = self.telemetry.tracer
+        traced = tracer.enabled
+        decode_started = time.perf_counter() if traced else 0.0
+        now = time.monotonic()
+        for decoder, registers in zip(plan, responses):
+            if registers is None:
+                stale.update(decoder.keys)
+                continue
+            if self.recorder is not None:
+                self.recorder.record(self.unit_id, decoder.block.address, registers)
+            # FIXME: account for decimal values on ind/screen_display_value?
+            decoder.decode_into(registers, data)
+            for address, offset in decoder.status:
+                words[address] = registers[offset]
+            for key in decoder.keys:
+                self.read_at[key] = now
+
+        if len(stale) == sum(len(decoder.keys) for decoder in plan):
+            raise PollFailed(f"no response from unit {self.unit_id}")
+
+        now = time.monotonic()
+        for key in stale:
+            read_at = self.read_at.get(key)
+            if read_at is None or now - read_at > self.max_age:
+                self.values[key] = None
+                self.read_at.pop(key, None)
+                if key in self._bit_addresses:
+                    words[self._bit_addresses[key]] = None
+        self._failed = stale
+        self.stale = {key for key in stale if self.values.get(key) is not None}
+
+        self.flipped = self._flip(words)
+        self.decoded = data
+        self.values.update(data)
+        snapshot = self.snapshot()
+        if traced:
+            tracer.span(STAGE_DECODE, time.perf_counter() - decode_started)
+        return snapshot
+
+    def _status_from_values(self) -> dict[int, int]:
+        """Rebuild the status words whose bits all hold a value."""
+        words = {}
+        for address, bits in self._status_bits.items():
+            values = [(mask, self.values.get(key)) for mask, key in bits.items()]
+            if all(value is not None for _, value in values):
+                words[address] = sum(mask for mask, value in values if value)
+        return words
+
+    def _flip(self, words: Mapping[int, Optional[int]]) -> set[str]:
+        """Store new status words, return the keys of the bits that flipped.
+
+        A word of None is no longer known, every bit of it changes.
+        """
+        flipped: set[str] = set()
+        for address, word in words.items():
+            bits = self._status_bits[address]
+            old = self.status_words.get(address)
+            if word is None:
+                if old is not None:
+                    del self.status_words[address]
+                    flipped.update(bits.values())
+                continue
+            diff = self._status_masks[address]
+            if old is not None:
+                diff &= old ^ word
+            while diff:
+                low = diff & -diff
+                flipped.add(bits[low])
+                diff ^= low
+            self.status_words[address] = word
+        return flipped
@@ -0,0 +1,78 @@
+"""Novus Modbus register decoding"""
+from __future__ import annotations
+
+import struct
+from typing import Sequence
+
+from .planner import ReadBlock
+
+
+class BlockDecoder:
+    """Precompiled decoder for one planned read block.
+
+    The raw registers are packed into a reusable buffer and unpacked with
+    a single struct format that carries each word's signedness and skips
+    addresses nobody maps. Scaling and bit expansion are table driven.
+    """
+
+    __slots__ = (
+        "block", "keys", "status", "_pack", "_unpack", "_buffer", "_raw",
+        "_scaled", "_bits",
+    )
+
+    def __init__(self, block: ReadBlock):
+        self.block = block
+        self.keys = tuple(register.key for register in block.registers)
+        # (address, offset in the block) of every status word holding bits
+        status = set()
+        for register in block.registers:
+            if register.bit is not None:
+                offset = block.offset(register)
+                status.add((block.address + offset, offset))
+        self.status = tuple(sorted(status))
+
+        fields: dict[int, str] = {}
+        for register in block.registers:
+            offset = block.offset(register)
+            if register.bit is not None or register.data_type == "uint16":
+                fields.setdefault(offset, "H")
+            else:
+                fields[offset] = "h"
+
+        # each decoded word's position in the unpacked tuple
+        index = {offset: i for i, offset in enumerate(sorted(fields))}
+        fmt = "".join(fields.get(offset, "xx") for offset in range(block.count))
+
+        self._pack = struct.Struct(f">{block.count}H")
+        self._unpack = struct.Struct(f">{fmt}")
+        self._buffer = bytearray(self._pack.size)
+
+        raw, scaled, bits = [], [], []
+        for register in block.registers:
+            i = index[block.offset(register)]
+            if register.bit is not None:
+                bits.append((register.key, i, 1 << register.bit))
+            elif register.scale != 1:
+                scaled.append((register.key, i, register.scale))
+            else:
+                raw.append((register.key, i))
+        self._raw = tuple(raw)
+        self._scaled = tuple(scaled)
+        self._bits = tuple(bits)
+
+    def decode_into(self, registers: Sequence[int], data: dict) -> None:
+        """Decode a response's registers into data."""
+        self._pack.pack_into(self._buffer, 0, *registers)
+        words = self._unpack.unpack_from(self._buffer)
+
+        for key, i in self._raw:
+            data[key] = words[i]
+        for key, i, scale in self._scaled:
+            data[key] = words[i] / scale
+        for key, i, mask in self._bits:
+            data[key] = (words[i] & mask) != 0
+
+
+def compile_decoders(plan: Sequence[ReadBlock]) -> tuple[BlockDecoder, ...]:
+    """Compile a decoder for every block of a read plan."""
+    return tuple(BlockDecoder(block) for block in plan)
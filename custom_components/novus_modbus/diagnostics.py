@@ -0,0 +1,56 @@
+"""Diagnostics support for Novus Modbus"""
+from __future__ import annotations
+
+from dataclasses import asdict
+import time
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_HOST, CONF_NAME
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, ENTRY_IDENTITY
+
+TO_REDACT = {CONF_HOST, ENTRY_IDENTITY, "serial_high", "serial_low"}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict:
+    """Return diagnostics for a config entry."""
+    hub = hass.data[DOMAIN][entry.data[CONF_NAME]]["hub"]
+    transport = hub.transport
+
+    return {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "telemetry": hub.telemetry.as_dict(),
+        "bus": {
+            "mode": transport.mode,
+            "serial": transport.serial,
+            "users": transport.users,
+            "connects": transport.connects,
+            "queue_depth": transport.queue_depth,
+            "worker": transport.worker.as_dict()
+            if hasattr(transport, "worker")
+            else None,
+            "device": asdict(transport.scheduler.device(hub.unit_id)),
+        },
+        "data": async_redact_data(hub.data, TO_REDACT),
+        "burst": None
+        if hub.burst is None
+        else {
+            "active": hub.burst.active,
+            "interval": hub.burst.current,
+            "bursts": hub.burst.bursts,
+        },
+        "phase": {
+            "offset": hub.phase_offset,
+            "hubs": len(hub.phases),
+            "spreads": hub.phases.spreads,
+            "load": hub.phases.load.as_dict(time.monotonic()),
+        },
+        "startup": hub.startup,
+        "tracing": hub.telemetry.tracer.as_dict(),
+        "stale": sorted(hub.stale),
+        "value_age": {key: hub.value_age(key) for key in hub.read_at},
+    }
@@ -0,0 +1,151 @@
+"""Novus Modbus bus discovery"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import importlib
+import logging
+from typing import TYPE_CHECKING, Awaitable, Callable, Iterable, Optional, cast
+
+from homeassistant.core import HomeAssistant
+
+from .const import REGISTERS, TRANSPORT_ASYNC
+
+if TYPE_CHECKING:
+    from pymodbus.register_read_message import ReadHoldingRegistersResponse
+
+    from .transport import NovusTransport
+
+    ProbeRead = Callable[
+        [int, int, int, Optional[float]], Awaitable[ReadHoldingRegistersResponse]
+    ]
+
+_LOGGER = logging.getLogger(__name__)
+
+# every unit id a modbus serial line can address
+UNIT_IDS = range(1, 248)
+# seconds to wait for a probe answer once it is on the wire (not while
+# it queues behind the polls of a shared bus), a live controller answers
+# within a few tens of milliseconds even behind a gateway
+PROBE_TIMEOUT = 0.3
+# parallel gateway connections, RTU buses are always probed one by one
+PROBE_CONNECTIONS = 8
+
+# addresses of the serial number (two words) and the version
+_SERIAL = cast(int, REGISTERS["r6"].address)
+_VERSION = cast(int, REGISTERS["r17"].address)
+
+
+@dataclass(frozen=True)
+class DiscoveredUnit:
+    """A controller that answered a probe"""
+
+    unit_id: int
+    serial_high: int
+    serial_low: int
+    version: Optional[int]
+
+    @property
+    def serial(self) -> str:
+        return f"{self.serial_high}-{self.serial_low}"
+
+    def __str__(self) -> str:
+        version = "?" if self.version is None else f"{self.version:#06x}"
+        return f"unit {self.unit_id} (serial {self.serial}, version {version})"
+
+
+async def async_probe(
+    read: ProbeRead, unit: int, timeout: float = PROBE_TIMEOUT
+) -> Optional[DiscoveredUnit]:
+    """Fingerprint unit through read(unit, address, count, timeout).
+
+    The serial number (r6/r7) doubles as the presence probe, the version
+    (r17) is only read from units that answered it.
+    """
+    try:
+        resp = await read(unit, _SERIAL, 2, timeout)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    # a late answer of a previous probe carries another unit id
+    if resp.isError() or len(resp.registers) < 2 or resp.slave_id != unit:
+        return None
+
+    version = None
+    try:
+        version_resp = await read(unit, _VERSION, 1, None)
+    except Exception as exception:  # pylint: disable=broad-except
+        _LOGGER.debug("unit %d: reading the version failed: %s", unit, exception)
+    else:
+        if not version_resp.isError() and version_resp.registers:
+            version = version_resp.registers[0]
+    return DiscoveredUnit(unit, resp.registers[0], resp.registers[1], version)
+
+
+async def async_discover(
+    hass: HomeAssistant,
+    hostname: str,
+    units: Iterable[int] = UNIT_IDS,
+    timeout: float = PROBE_TIMEOUT,
+) -> list[DiscoveredUnit]:
+    """Return the controllers answering on hostname's bus.
+
+    A serial line only carries one transaction at a time, so RTU units
+    are probed in turn through the bus's shared transport. TCP gateways
+    are probed over several connections at once.
+    """
+    # pymodbus is imported off the event loop, like a hub's first connect
+    await hass.async_add_import_executor_job(
+        importlib.import_module, f"{__package__}.transport"
+    )
+    from .transport import acquire_transport, is_serial_bus, release_transport
+
+    units = list(units)
+    if is_serial_bus(hostname):
+        transport = acquire_transport(hostname, TRANSPORT_ASYNC)
+
+        def read(
+            unit: int, address: int, count: int, timeout: Optional[float]
+        ) -> Awaitable[ReadHoldingRegistersResponse]:
+            return transport.scheduler.async_read(
+                unit, address, count, timeout=timeout
+            )
+
+        try:
+            found = [await async_probe(read, unit, timeout) for unit in units]
+        finally:
+            # lingers, so the entry created next picks up the open port
+            release_transport(transport)
+    else:
+        found = await _async_discover_tcp(hostname, units, timeout)
+
+    return sorted(
+        (unit for unit in found if unit is not None), key=lambda unit: unit.unit_id
+    )
+
+
+async def _async_discover_tcp(
+    hostname: str, units: list[int], timeout: float
+) -> list[Optional[DiscoveredUnit]]:
+    from .transport import create_transport
+
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for unit in units:
+        queue.put_nowait(unit)
+    found: list[Optional[DiscoveredUnit]] = []
+
+    async def worker(transport: NovusTransport) -> None:
+        while not queue.empty():
+            found.append(
+                await async_probe(transport.async_read, queue.get_nowait(), timeout)
+            )
+
+    transports = [
+        create_transport(hostname, TRANSPORT_ASYNC)
+        for _ in range(min(PROBE_CONNECTIONS, len(units)))
+    ]
+    try:
+        await asyncio.gather(*(worker(transport) for transport in transports))
+    finally:
+        for transport in transports:
+            transport.close()
+    return found
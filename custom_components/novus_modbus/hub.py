@@ -1,26 +1,83 @@
 """Novus Modbus Hub"""
-from datetime import timedelta
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import importlib
 import logging
-import threading
-import pymodbus
-from urllib.parse import urlparse
+import time
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, Optional
 
+from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import CALLBACK_TYPE, callback
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 from homeassistant.helpers.update_coordinator import UpdateFailed
-from pymodbus.client import ModbusTcpClient, ModbusSerialClient
-from pymodbus.constants import Endian
-from pymodbus.exceptions import ConnectionException
-from pymodbus.payload import BinaryPayloadDecoder
-from pymodbus.register_read_message import ReadHoldingRegistersResponse
-from voluptuous.validators import Number
+
+from .const import (
+    DEFAULT_BURST_DURATION,
+    DEFAULT_BURST_INTERVAL,
+    DEFAULT_BURST_TRIGGERS,
+    DEFAULT_CAPTURE_MAX_BYTES,
+    DEFAULT_CAPTURE_PATH,
+    DEFAULT_DEADBAND,
+    DEFAULT_MAX_AGE,
+    DEFAULT_MAX_REGISTERS,
+    DEFAULT_PIPELINE,
+    DEFAULT_REPLAY_SPEED,
+    DEFAULT_RESTORE,
+    DEFAULT_RETRIES,
+    DEFAULT_SAMPLE_INTERVAL,
+    DEFAULT_SAMPLE_WINDOW,
+    DEFAULT_SLOW_INTERVAL,
+    DEFAULT_TRANSPORT,
+    DEFAULT_UNIT_ID,
+    DOMAIN,
+    ENTRY_IDENTITY,
+    ENTRY_PROFILE,
+    SAMPLED_REGISTERS,
+    STORE_DELAY,
+    STORE_VERSION,
+    TELEMETRY_CONTEXT,
+    TIER_IDENTITY,
+    TIER_LIVE,
+    TIER_SLOW,
+    TRANSPORT_REPLAY,
+    NovusTemperature,
+    aggregates,
+)
+from .burst import BurstPolicy
+from .core import NovusCore
+from .phase import PHASE_TOLERANCE, POLL_PHASES
+from .profile import Profile, get_profile, select_profile
+from .sampler import FastSampler
+from .snapshot import Snapshot, SnapshotLayout
+from .telemetry import PollTelemetry
+from .tracing import STAGE_NOTIFY, dump_profile
+from .writer import WriteQueue
+
+if TYPE_CHECKING:
+    from .capture import FrameRecorder
+    from .transport import NovusTransport
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class NovusHub(DataUpdateCoordinator[dict]):
-    """Manages data retrieval from a Novus Controller"""
+def store_key(entry_id: str) -> str:
+    """Return the storage key of an entry's saved snapshot."""
+    return f"{DOMAIN}.{entry_id}"
+
+
+class NovusHub(DataUpdateCoordinator[Snapshot]):
+    """Manages data retrieval from a Novus Controller
+
+    Reading and decoding is the NovusCore's, the hub schedules its polls
+    and wakes the entities whose values changed.
+    """
+
+    # the coordinator's property, changed by burst polling
+    update_interval: Optional[timedelta]
 
     def __init__(
         self,
@@ -28,163 +85,391 @@ class NovusHub(DataUpdateCoordinator[dict]):
         name: str,
         hostname: str,
         interval: timedelta,
-    ):
+        max_registers: int = DEFAULT_MAX_REGISTERS,
+        transport: str = DEFAULT_TRANSPORT,
+        unit_id: int = DEFAULT_UNIT_ID,
+        deadband: float = DEFAULT_DEADBAND,
+        slow_interval: int = DEFAULT_SLOW_INTERVAL,
+        retries: int = DEFAULT_RETRIES,
+        max_age: int = DEFAULT_MAX_AGE,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+        sample_window: int = DEFAULT_SAMPLE_WINDOW,
+        pipeline: int = DEFAULT_PIPELINE,
+        burst_interval: float = DEFAULT_BURST_INTERVAL,
+        burst_duration: int = DEFAULT_BURST_DURATION,
+        burst_triggers: Iterable[str] = DEFAULT_BURST_TRIGGERS,
+        capture_path: str = DEFAULT_CAPTURE_PATH,
+        capture_max_bytes: int = DEFAULT_CAPTURE_MAX_BYTES,
+        replay_speed: float = DEFAULT_REPLAY_SPEED,
+        restore: bool = DEFAULT_RESTORE,
+        profile: Optional[Profile] = None,
+        detect_profile: bool = False,
+        entry: Optional[ConfigEntry] = None,
+    ) -> None:
+        if transport == TRANSPORT_REPLAY and replay_speed > 0:
+            # keep up with the accelerated capture
+            interval = interval / replay_speed
         super().__init__(hass, _LOGGER, name=name, update_interval=interval)
+        # seconds from construction to each startup milestone
+        self._created = time.monotonic()
+        self.startup: dict[str, Optional[float]] = dict.fromkeys(
+            ("setup", "restored", "connected", "first_poll")
+        )
 
-        # split the configured hostname into its component parts.
-        # If it's not a URL it might be a serial port.
-        # This logic is tested to work with linux and windows serial port names.
-        parsed = urlparse(f"//{hostname}")
-        if (parsed.port is None) and (
-            (parsed.hostname is None) or (parsed.hostname[0:3] == "com")
-        ):
-            self._client = ModbusSerialClient(
-                method="rtu",
-                port=parsed.path + parsed.netloc,
-                baudrate=9600,
-                stopbits=1,
-                bytesize=8,
-                timeout=5,
-            )
-        else:
-            if parsed.port is None:
-                localport = 502
-            else:
-                localport = parsed.port
-
-            self._client = ModbusTcpClient(
-                host=parsed.hostname, port=localport, timeout=5
+        self._entry = entry
+        # polls are spread over the interval together with every other hub
+        # once the hub joined them
+        self.phases = POLL_PHASES
+        self._phase_key = name if entry is None else entry.entry_id
+        self._unsub_phase: Optional[CALLBACK_TYPE] = None
+        self._polls = 0
+        # reload the entry if the version register asks for another profile
+        self._detect_profile = detect_profile
+
+        self.recorder: Optional[FrameRecorder] = None
+        if capture_path:
+            # capture builds on the transport module, which imports pymodbus
+            from . import capture
+
+            self.recorder = capture.FrameRecorder(capture_path, capture_max_bytes)
+
+        profile = profile or get_profile()
+        sampled = sample_interval > 0 and all(
+            key in profile.registers for key in SAMPLED_REGISTERS
+        )
+        # the sensors of the sampler's windowed aggregates
+        self.aggregates: tuple[NovusTemperature, ...] = (
+            aggregates(profile.registers) if sampled else ()
+        )
+        self.core = NovusCore(
+            name,
+            hostname,
+            profile,
+            {TIER_LIVE: 0, TIER_SLOW: slow_interval, TIER_IDENTITY: None},
+            max_registers,
+            transport,
+            unit_id,
+            retries,
+            max_age,
+            pipeline=pipeline,
+            replay_speed=replay_speed if transport == TRANSPORT_REPLAY else 0,
+            recorder=self.recorder,
+            extra_keys=(d.key for d in self.aggregates),
+        )
+        # identity is seeded from the last run
+        if entry is not None:
+            self.core.update(entry.data.get(ENTRY_IDENTITY, {}))
+
+        # keys whose value moved since the listeners were last notified,
+        # None notifies every listener (first poll, availability change)
+        self._changed: Optional[set[str]] = None
+        self._notified: dict = {}
+        self._notified_success = False
+        self._deadbands = {}
+        for register in profile.registers.values():
+            band = register.deadband
+            if band is None and isinstance(register, NovusTemperature):
+                band = deadband
+            if band:
+                self._deadbands[register.key] = band
+
+        self.burst: Optional[BurstPolicy] = None
+        if burst_interval > 0:
+            self.burst = BurstPolicy(
+                interval.total_seconds(), burst_interval, burst_duration, burst_triggers
             )
 
-        self._lock = threading.Lock()
-        self.data: dict = {}
+        self.writer = WriteQueue(self, max_registers)
+        self.sampler: Optional[FastSampler] = None
+        if sampled:
+            self.sampler = FastSampler(self, sample_interval, sample_window)
+
+        # keys compared value by value, bits are covered by the status XOR
+        bits = self.core.bit_keys
+        self._diff_keys = tuple(key for key in self.layout.keys if key not in bits)
+        self.data: Snapshot = self.core.snapshot()
+
+        self._store: Optional[Store] = None
+        if restore and entry is not None:
+            self._store = Store(hass, STORE_VERSION, store_key(entry.entry_id))
+
+    @property
+    def profile(self) -> Profile:
+        return self.core.profile
+
+    @property
+    def layout(self) -> SnapshotLayout:
+        return self.core.layout
+
+    @property
+    def unit_id(self) -> int:
+        return self.core.unit_id
+
+    @property
+    def telemetry(self) -> PollTelemetry:
+        return self.core.telemetry
+
+    @property
+    def transport(self) -> NovusTransport:
+        """Return the bus connection, acquiring it on first use and after close()."""
+        return self.core.transport
+
+    @property
+    def stale(self) -> set[str]:
+        return self.core.stale
+
+    @property
+    def read_at(self) -> dict[str, float]:
+        return self.core.read_at
+
+    @property
+    def status_words(self) -> dict[int, int]:
+        return self.core.status_words
+
+    def value_age(self, key: str) -> Optional[float]:
+        """Return the seconds since key was last read from the controller."""
+        return self.core.value_age(key)
 
     @callback
-    def async_remove_listener(self, update_callback: CALLBACK_TYPE) -> None:
-        """Remove data update listener."""
-        super().async_remove_listener(update_callback)
+    def async_update_listeners(self) -> None:
+        """Update only the listeners whose register changed."""
+        tracer = self.telemetry.tracer
+        if not tracer.enabled:
+            self._notify_listeners()
+            return
+        started = time.perf_counter()
+        self._notify_listeners()
+        tracer.span(STAGE_NOTIFY, time.perf_counter() - started)
 
-        """No listeners left then close connection"""
-        if not self._listeners:
-            self.close()
+    @callback
+    def _notify_listeners(self) -> None:
+        changed, self._changed = self._changed, None
+        if changed is None or self.last_update_success != self._notified_success:
+            self._notified_success = self.last_update_success
+            super().async_update_listeners()
+            return
 
-    def close(self) -> None:
-        """Disconnect client."""
-        with self._lock:
-            self._client.close()
+        for update_callback, context in list(self._listeners.values()):
+            if context is None or context in changed:
+                update_callback()
+
+    def _diff(self, data: Mapping) -> set[str]:
+        """Return the keys of data that moved past their deadband."""
+        changed = set()
+        notified = self._notified
+        for key in self._diff_keys:
+            new = data.get(key)
+            old = notified.get(key)
+            if new == old:
+                continue
+            band = self._deadbands.get(key)
+            if band and new is not None and old is not None and abs(new - old) < band:
+                continue
+            notified[key] = new
+            changed.add(key)
+        return changed
 
-    def _read(self, unit, address, count) -> ReadHoldingRegistersResponse:
-        """Read modbus holding registers"""
+    @callback
+    def async_set_value(self, key: str, value: Any) -> None:
+        """Show a value before the controller confirms it, e.g. a setpoint."""
+        self._notified[key] = value
+        self.data = self.core.update({key: value})
+        self._changed = {key}
+        self.async_update_listeners()
+
+    def join_phases(self) -> None:
+        """Take a slot of the poll phases, re-spreading every hub's."""
+        self.phases.add(self._phase_key)
 
-        with self._lock:
-            kwargs = {"slave": unit}
+    @callback
+    def _align_phase(self, started: float) -> None:
+        """Move the polls back onto the hub's phase once they drifted off it.
 
-            return self._client.read_holding_registers(address, count, **kwargs)
+        The coordinator schedules each poll an interval after the last
+        one, so a single poll at the phase's next slot re-anchors it.
+        """
+        if self.update_interval is None or self._unsub_phase is not None:
+            return
+        if self.phases.phase(self._phase_key) is None:
+            return
+        if self.burst is not None and self.burst.active:
+            return
+        if self.config_entry and self.config_entry.pref_disable_polling:
+            return
+        interval = self.update_interval.total_seconds()
+        wait = self.phases.until_slot(self._phase_key, started, interval)
+        if min(wait, interval - wait) <= PHASE_TOLERANCE:
+            return
 
-    async def _async_update_data(self) -> dict:
-        realtime_data = {}
-        try:
-            realtime_data = await self.hass.async_add_executor_job(
-                self.read_modbus_realtime_data
+        polls = self._polls
+
+        @callback
+        def _poll_on_phase(_now: datetime) -> None:
+            self._unsub_phase = None
+            # nothing to move if the coordinator polled in the meantime
+            if self._polls == polls:
+                self.hass.async_create_task(self.async_refresh())
+
+        delay = max(started + wait - self.hass.loop.time(), 0)
+        self._unsub_phase = async_call_later(self.hass, delay, _poll_on_phase)
+
+    @property
+    def phase_offset(self) -> Optional[float]:
+        """Return the seconds the hub's polls are shifted into the interval."""
+        phase = self.phases.phase(self._phase_key)
+        if phase is None or self.update_interval is None:
+            return None
+        return phase * self.update_interval.total_seconds()
+
+    def read_soon(self, tiers: set[str]) -> None:
+        """Read tiers with the next scheduled poll."""
+        self.core.read_soon(tiers)
+
+    def mark_startup(self, name: str) -> None:
+        """Record how long after creating the hub it reached a milestone."""
+        if self.startup[name] is None:
+            self.startup[name] = time.monotonic() - self._created
+
+    async def async_restore(self) -> None:
+        """Serve the last saved snapshot until the first live poll."""
+        if self._store is None:
+            return
+        stored = await self._store.async_load()
+        if stored:
+            # keep the age of the saved values, so max_age still applies
+            self.data = self.core.restore(
+                stored["values"], max(time.time() - stored["saved_at"], 0)
             )
+            self._changed = None
+            self.async_update_listeners()
+        self.mark_startup("restored")
+
+    async def async_start(self) -> None:
+        """Import the transport stack and connect, off the setup path.
+
+        Polls that come earlier connect by themselves.
+        """
+        await self.hass.async_add_import_executor_job(
+            importlib.import_module, f"{__package__}.transport"
+        )
+        try:
+            await self.transport.async_connect()
+        except Exception as exception:  # pylint: disable=broad-except
+            _LOGGER.debug("%s: connecting failed: %s", self.name, exception)
+            return
+        self.mark_startup("connected")
+
+    def _save_data(self) -> dict:
+        return {
+            "saved_at": time.time(),
+            "values": self.core.saved_values(),
+        }
+
+    @callback
+    def close(self) -> None:
+        """Release the (possibly shared) bus connection."""
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self._unsub_phase is not None:
+            self._unsub_phase()
+            self._unsub_phase = None
+        self.phases.remove(self._phase_key)
+        # an unloaded hub must not keep the process-wide capture
+        self.telemetry.tracer.disable()
+        self.core.close()
+
+    async def _async_update_data(self) -> Snapshot:
+        started = time.monotonic()
+        # the phase grid is in event loop time
+        loop_started = self.hass.loop.time()
+        self._polls += 1
+        stale = self.stale
+        # every block of this poll must be on the wire before the next one
+        # is due, anything still queued by then is dropped by the scheduler
+        deadline = None
+        if self.update_interval is not None:
+            deadline = started + self.update_interval.total_seconds()
+        self.phases.load.start(started)
+        self.telemetry.tracer.poll_started()
+        try:
+            realtime_data = await self.core.async_poll(deadline)
         except Exception as exception:
             _LOGGER.error(f"update failed: {exception}")
+            self._changed = None
             raise UpdateFailed() from exception
+        finally:
+            self.phases.load.finish()
+            self._poll_traced()
+        if self.startup["first_poll"] is None:
+            self.mark_startup("first_poll")
+            _LOGGER.debug("%s: startup %s", self.name, self.startup)
 
-        return realtime_data
+        self.writer.verify(self.core.decoded)
+        if TIER_IDENTITY in self.core.read_tiers:
+            self._cache_identity(realtime_data)
+        if self.burst is not None and self.update_interval is not None:
+            seconds = self.burst.update(self.data, realtime_data, started)
+            if seconds != self.update_interval.total_seconds():
+                _LOGGER.debug("%s: polling every %.1fs", self.name, seconds)
+                self.update_interval = timedelta(seconds=seconds)
+        self._align_phase(loop_started)
+        if self.sampler is not None and self.update_interval is not None:
+            since = time.time() - self.update_interval.total_seconds()
+            realtime_data = self.core.update(self.sampler.aggregates(since))
 
-    def read_modbus_realtime_data(self) -> dict:
-        data = {}
+        if self._store is not None:
+            self._store.async_delay_save(self._save_data, STORE_DELAY)
 
-        # TODO: data can only be read 4 registers at a time,
-        # abstract this out so we don't need to keep calling _read()
-        resp = self._read(unit=1, address=0, count=4)
-        if resp.isError():
-            return {}
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            resp.registers, byteorder=Endian.Big, wordorder=Endian.Little
-        )
-        data["t1_temp_c"] = decoder.decode_16bit_int() / 10
-        data["t2_temp_c"] = decoder.decode_16bit_int() / 10
-        data["temp_diff_c"] = decoder.decode_16bit_int() / 10
-        data["don"] = decoder.decode_16bit_int() / 10
-
-        resp = self._read(unit=1, address=4, count=4)
-        if resp.isError():
-            return {}
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            resp.registers, byteorder=Endian.Big, wordorder=Endian.Little
-        )
-        data["doff"] = decoder.decode_16bit_int() / 10
-        # FIXME: account for decimal values?
-        data["ind"] = decoder.decode_16bit_int()
-        # FIXME: combine this into a single value
-        data["serial_high"] = decoder.decode_16bit_int()
-        data["serial_low"] = decoder.decode_16bit_int()
-
-        resp = self._read(unit=1, address=8, count=4)
-        if resp.isError():
-            return {}
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            resp.registers, byteorder=Endian.Big, wordorder=Endian.Little
-        )
-        data["ice"] = decoder.decode_16bit_int() / 10
-        data["ht1"] = decoder.decode_16bit_int() / 10
-        data["ht2"] = decoder.decode_16bit_int() / 10
-        data["hys"] = decoder.decode_16bit_int() / 10
-
-        resp = self._read(unit=1, address=12, count=4)
-        if resp.isError():
-            return {}
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            resp.registers, byteorder=Endian.Big, wordorder=Endian.Little
-        )
-        data["hy1"] = decoder.decode_16bit_int()
-        data["hy2"] = decoder.decode_16bit_int()
-        ihm = decoder.decode_16bit_int()
-        data["ihm_p1_out1"] = bool(ihm & 0x01)
-        data["ihm_p1_out2"] = bool(ihm & 0x02)
-        data["ihm_pv"] = bool(ihm & 0x04)
-        data["ihm_rx"] = bool(ihm & 0x08)
-        data["ihm_internal_4"] = bool(ihm & 0x10)
-        data["ihm_status_t1"] = bool(ihm & 0x20)
-        data["ihm_status_defrost"] = bool(ihm & 0x40)
-        data["ihm_status_t2"] = bool(ihm & 0x80)
-        data["ihm_internal_8"] = bool(ihm & 0x100)
-        data["ihm_internal_9"] = bool(ihm & 0x200)
-        data["ihm_value_has_decimal"] = bool(ihm & 0x400)
-        data["ihm_internal_11"] = bool(ihm & 0x800)
-        data["ihm_internal_12"] = bool(ihm & 0x1000)
-        data["ihm_internal_13"] = bool(ihm & 0x2000)
-        data["ihm_internal_14"] = bool(ihm & 0x4000)
-        data["ihm_internal_15"] = bool(ihm & 0x8000)
-        data["control_status"] = decoder.decode_16bit_int()
-
-        resp = self._read(unit=1, address=16, count=4)
-        if resp.isError():
-            return {}
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            resp.registers, byteorder=Endian.Big, wordorder=Endian.Little
-        )
-        # FIXME: divide when screen may contain decimal values
-        data["screen_display_value"] = decoder.decode_16bit_int()
-        # FIXME: extract both values
-        data["version_and_screen_n"] = decoder.decode_16bit_int()
-        data["of1"] = decoder.decode_16bit_int()
-        data["of2"] = decoder.decode_16bit_int()
-
-        resp = self._read(unit=1, address=20, count=1)
-        if resp.isError():
-            return {}
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            resp.registers, byteorder=Endian.Big, wordorder=Endian.Little
+        # entities show whether they are stale, so wake them when that flips
+        self._changed = self._diff(realtime_data) | (stale ^ self.stale)
+        self._changed |= self.core.flipped
+        self._changed.add(TELEMETRY_CONTEXT)
+
+        due = self.core.due
+        _LOGGER.debug(
+            "%s: polled %s (%d blocks, %d stale values) in %.3fs "
+            "(scheduling lag %.3fs)",
+            self.name,
+            "/".join(sorted(due)),
+            len(self.core.plans[due]),
+            len(self.stale),
+            self.telemetry.poll_latency.last,
+            self.transport.scheduler.device(self.unit_id).lag,
         )
-        # FIXME: extract values
-        r20 = decoder.decode_16bit_int()
-        data["ice_status"] = bool(r20 & 0x01)
-        data["ht1_status"] = bool(r20 & 0x02)
-        data["ht2_status"] = bool(r20 & 0x04)
+        return realtime_data
 
-        # sp1, b1y, and ac1 cause errors when read
+    def _poll_traced(self) -> None:
+        """Write a cProfile capture once its last poll finished."""
+        capture = self.telemetry.tracer.poll_finished()
+        if capture is not None:
+            self.hass.async_add_executor_job(dump_profile, *capture)
 
-        return data
+    def _cache_identity(self, data: Mapping) -> None:
+        """Persist the identity tier in the config entry."""
+        if self._entry is None:
+            return
+        identity = {
+            register.key: data[register.key]
+            for register in self.profile.registers.values()
+            if register.tier == TIER_IDENTITY and register.key in data
+        }
+        if identity != self._entry.data.get(ENTRY_IDENTITY):
+            self.hass.config_entries.async_update_entry(
+                self._entry, data={**self._entry.data, ENTRY_IDENTITY: identity}
+            )
+        if not self._detect_profile:
+            return
+        profile = select_profile(self.profile.version(data))
+        if profile is not self.profile:
+            _LOGGER.info(
+                "%s: version register selects the %s profile, reloading",
+                self.name,
+                profile.model,
+            )
+            self._detect_profile = False
+            self.hass.config_entries.async_update_entry(
+                self._entry, data={**self._entry.data, ENTRY_PROFILE: profile.model}
+            )
+            self.hass.config_entries.async_schedule_reload(self._entry.entry_id)
@@ -0,0 +1,436 @@
+"""Novus Modbus integration setup
+
+The package re-exports the entry points here, so the core and the
+headless runner import without Home Assistant.
+"""
+import asyncio
+import logging
+import math
+import sys
+import time
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import (
+    CONF_HOST,
+    CONF_NAME,
+    CONF_SCAN_INTERVAL,
+    EVENT_HOMEASSISTANT_STOP,
+)
+from homeassistant.core import (
+    Event,
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import entity_registry as er
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.typing import ConfigType
+from homeassistant.util import slugify
+import voluptuous as vol
+from datetime import timedelta
+
+from .const import (
+    CONF_BURST_DURATION,
+    CONF_BURST_INTERVAL,
+    CONF_BURST_TRIGGERS,
+    CONF_CAPTURE_MAX_BYTES,
+    CONF_CAPTURE_PATH,
+    CONF_DEADBAND,
+    CONF_MAX_AGE,
+    CONF_MAX_REGISTERS,
+    CONF_PIPELINE,
+    CONF_PROFILE,
+    CONF_REPLAY_SPEED,
+    CONF_RESTORE,
+    CONF_RETRIES,
+    CONF_SAMPLE_INTERVAL,
+    CONF_SAMPLE_WINDOW,
+    CONF_SLOW_INTERVAL,
+    CONF_TRANSPORT,
+    CONF_UNIT_ID,
+    DEFAULT_BURST_DURATION,
+    DEFAULT_BURST_INTERVAL,
+    DEFAULT_BURST_TRIGGERS,
+    DEFAULT_CAPTURE_MAX_BYTES,
+    DEFAULT_CAPTURE_PATH,
+    DEFAULT_DEADBAND,
+    DEFAULT_MAX_AGE,
+    DEFAULT_MAX_REGISTERS,
+    DEFAULT_NAME,
+    DEFAULT_PIPELINE,
+    DEFAULT_PROFILE,
+    DEFAULT_REPLAY_SPEED,
+    DEFAULT_RESTORE,
+    DEFAULT_RETRIES,
+    DEFAULT_SAMPLE_INTERVAL,
+    DEFAULT_SAMPLE_WINDOW,
+    DEFAULT_SCAN_INTERVAL,
+    DEFAULT_SLOW_INTERVAL,
+    DEFAULT_TRANSPORT,
+    DEFAULT_UNIT_ID,
+    DOMAIN,
+    ENTRY_PROFILE,
+    MODBUS_MAX_REGISTERS,
+    PROFILE_AUTO,
+    REGISTERS,
+    STORE_VERSION,
+    TRANSPORT_ASYNC,
+    TRANSPORT_REPLAY,
+    TRANSPORT_SYNC,
+)
+from .hub import NovusHub, store_key
+from .profile import async_load_profiles
+from .tracing import MAX_PROFILE_POLLS, ProfilerBusy
+
+# FIXME: use __package__?
+_LOGGER = logging.getLogger(__name__)
+
+NOVUS_MODBUS_SCHEMA = vol.Schema({
+    vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
+    vol.Required(CONF_HOST): cv.string,
+    vol.Optional(CONF_UNIT_ID, default=DEFAULT_UNIT_ID): vol.All(
+        vol.Coerce(int), vol.Range(min=1, max=247)
+    ),
+    vol.Optional(
+        CONF_SCAN_INTERVAL, default=DEFAULT_SCAN_INTERVAL
+    ): cv.positive_int,
+    vol.Optional(
+        CONF_SLOW_INTERVAL, default=DEFAULT_SLOW_INTERVAL
+    ): cv.positive_int,
+    vol.Optional(
+        CONF_MAX_REGISTERS, default=DEFAULT_MAX_REGISTERS
+    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=MODBUS_MAX_REGISTERS)),
+    vol.Optional(
+        CONF_TRANSPORT, default=DEFAULT_TRANSPORT
+    ): vol.In([TRANSPORT_ASYNC, TRANSPORT_SYNC, TRANSPORT_REPLAY]),
+    vol.Optional(CONF_PIPELINE, default=DEFAULT_PIPELINE): vol.All(
+        vol.Coerce(int), vol.Range(min=1, max=16)
+    ),
+    vol.Optional(CONF_DEADBAND, default=DEFAULT_DEADBAND): vol.All(
+        vol.Coerce(float), vol.Range(min=0)
+    ),
+    vol.Optional(CONF_RETRIES, default=DEFAULT_RETRIES): cv.positive_int,
+    vol.Optional(CONF_MAX_AGE, default=DEFAULT_MAX_AGE): cv.positive_int,
+    vol.Optional(
+        CONF_SAMPLE_INTERVAL, default=DEFAULT_SAMPLE_INTERVAL
+    ): cv.positive_float,
+    vol.Optional(
+        CONF_SAMPLE_WINDOW, default=DEFAULT_SAMPLE_WINDOW
+    ): cv.positive_int,
+    vol.Optional(
+        CONF_BURST_INTERVAL, default=DEFAULT_BURST_INTERVAL
+    ): cv.positive_float,
+    vol.Optional(
+        CONF_BURST_DURATION, default=DEFAULT_BURST_DURATION
+    ): cv.positive_int,
+    vol.Optional(CONF_CAPTURE_PATH, default=DEFAULT_CAPTURE_PATH): cv.string,
+    vol.Optional(
+        CONF_CAPTURE_MAX_BYTES, default=DEFAULT_CAPTURE_MAX_BYTES
+    ): cv.positive_int,
+    vol.Optional(
+        CONF_REPLAY_SPEED, default=DEFAULT_REPLAY_SPEED
+    ): cv.positive_float,
+    vol.Optional(CONF_PROFILE, default=PROFILE_AUTO): cv.string,
+    vol.Optional(CONF_RESTORE, default=DEFAULT_RESTORE): cv.boolean,
+    vol.Optional(
+        CONF_BURST_TRIGGERS, default=list(DEFAULT_BURST_TRIGGERS)
+    ): vol.All(
+        cv.ensure_list,
+        [vol.In([r.key for r in REGISTERS.values() if r.bit is not None])],
+    ),
+})
+
+CONFIG_SCHEMA = vol.Schema({
+    DOMAIN: vol.Schema({
+        cv.slug: NOVUS_MODBUS_SCHEMA
+    })
+}, extra=vol.ALLOW_EXTRA)
+
+PLATFORMS = ["sensor", "binary_sensor", "number"]
+
+# status bits that were sensors before version 2 entries made them binary
+# sensors, including ihm_p2_out2, the old name of ihm_p1_out2
+LEGACY_BIT_SENSORS = (
+    "ihm_p1_out1",
+    "ihm_p1_out2",
+    "ihm_p2_out2",
+    "ihm_pv",
+    "ihm_rx",
+    "ihm_internal_4",
+    "ihm_status_t1",
+    "ihm_status_defrost",
+    "ihm_status_t2",
+    "ihm_internal_8",
+    "ihm_internal_9",
+    "ihm_value_has_decimal",
+    "ihm_internal_11",
+    "ihm_internal_12",
+    "ihm_internal_13",
+    "ihm_internal_14",
+    "ihm_internal_15",
+    "ice_status",
+    "ht1_status",
+    "ht2_status",
+)
+
+SERVICE_DUMP_SAMPLES = "dump_samples"
+DUMP_SAMPLES_SCHEMA = vol.Schema({
+    vol.Optional(CONF_NAME): cv.string,
+    vol.Optional("seconds"): cv.positive_float,
+})
+
+SERVICE_SET_TRACING = "set_tracing"
+SET_TRACING_SCHEMA = vol.Schema({
+    vol.Optional(CONF_NAME): cv.string,
+    vol.Required("enabled"): cv.boolean,
+    vol.Optional("profile_polls"): vol.All(
+        vol.Coerce(int), vol.Range(min=1, max=MAX_PROFILE_POLLS)
+    ),
+})
+
+SERVICE_WRITE_REGISTER = "write_register"
+WRITE_REGISTER_SCHEMA = vol.Schema({
+    vol.Required(CONF_NAME): cv.string,
+    vol.Required("key"): cv.string,
+    vol.Required("value"): vol.Coerce(float),
+})
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    hass.data[DOMAIN] = {}
+    # validate and compile every controller profile once, up front
+    await async_load_profiles(hass, (DEFAULT_MAX_REGISTERS,))
+
+    def _close_transports(event: Event) -> None:
+        # nothing to close if no hub ever needed the transport stack
+        transport = sys.modules.get(f"{__package__}.transport")
+        if transport is not None:
+            transport.close_transports(in_use=True)
+
+    # neither lingering nor still used connections outlive Home Assistant
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _close_transports)
+
+    async def _dump_samples(call: ServiceCall) -> ServiceResponse:
+        """Return the raw sample window of the fast sampling hubs."""
+        since = -math.inf
+        if "seconds" in call.data:
+            since = time.time() - call.data["seconds"]
+        dumps = {}
+        for name, data in hass.data[DOMAIN].items():
+            sampler = data["hub"].sampler
+            if sampler is None:
+                continue
+            if call.data.get(CONF_NAME, name) != name:
+                continue
+            dumps[name] = sampler.dump(since)
+        return dumps
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_DUMP_SAMPLES,
+        _dump_samples,
+        schema=DUMP_SAMPLES_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def _set_tracing(call: ServiceCall) -> ServiceResponse:
+        """Switch poll tracing of hubs on or off, return their statistics."""
+        traces = {}
+        hubs = {
+            name: data["hub"]
+            for name, data in hass.data[DOMAIN].items()
+            if call.data.get(CONF_NAME, name) == name
+        }
+        profiling = call.data["enabled"] and "profile_polls" in call.data
+        if profiling and len(hubs) > 1:
+            raise HomeAssistantError("profile one controller at a time, pass its name")
+        for name, hub in hubs.items():
+            tracer = hub.telemetry.tracer
+            if not call.data["enabled"]:
+                tracer.disable()
+            elif profiling:
+                path = hass.config.path(
+                    DOMAIN, "traces", f"{slugify(name)}-{int(time.time())}.prof"
+                )
+                try:
+                    tracer.capture(path, call.data["profile_polls"])
+                except ProfilerBusy as exception:
+                    raise HomeAssistantError(
+                        f"cannot profile {name}: {exception}"
+                    ) from exception
+            elif not tracer.enabled:
+                tracer.enable()
+            traces[name] = tracer.as_dict()
+        return traces
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SET_TRACING,
+        _set_tracing,
+        schema=SET_TRACING_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def _write_register(call: ServiceCall) -> None:
+        """Write a setpoint through the hub's write queue."""
+        data = hass.data[DOMAIN].get(call.data[CONF_NAME])
+        if data is None:
+            raise HomeAssistantError(f"unknown controller {call.data[CONF_NAME]}")
+        await data["hub"].writer.async_write(call.data["key"], call.data["value"])
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_WRITE_REGISTER,
+        _write_register,
+        schema=WRITE_REGISTER_SCHEMA,
+    )
+    return True
+
+
+async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Migrate an entry of an earlier version, once."""
+    if entry.version == 1:
+        # bits are binary sensors now, drop the sensors they used to be
+        registry = er.async_get(hass)
+        name = entry.data[CONF_NAME]
+        for key in LEGACY_BIT_SENSORS:
+            entity_id = registry.async_get_entity_id("sensor", DOMAIN, f"{name}_{key}")
+            if entity_id is not None:
+                registry.async_remove(entity_id)
+        hass.config_entries.async_update_entry(entry, version=2)
+        _LOGGER.debug("%s: migrated to version 2", name)
+    return True
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Handle configuration via the UI.
+
+    Nothing here waits on the bus: entities come up with the last saved
+    snapshot and the connection opens in the background. Options override
+    the settings the entry was added with.
+    """
+    config = {**entry.data, **entry.options}
+    name = config[CONF_NAME]
+    host = config[CONF_HOST]
+    interval = timedelta(seconds=config[CONF_SCAN_INTERVAL])
+    max_registers = config.get(CONF_MAX_REGISTERS, DEFAULT_MAX_REGISTERS)
+    transport = config.get(CONF_TRANSPORT, DEFAULT_TRANSPORT)
+    unit_id = config.get(CONF_UNIT_ID, DEFAULT_UNIT_ID)
+    deadband = config.get(CONF_DEADBAND, DEFAULT_DEADBAND)
+    slow_interval = config.get(CONF_SLOW_INTERVAL, DEFAULT_SLOW_INTERVAL)
+    retries = config.get(CONF_RETRIES, DEFAULT_RETRIES)
+    max_age = config.get(CONF_MAX_AGE, DEFAULT_MAX_AGE)
+    sample_interval = config.get(CONF_SAMPLE_INTERVAL, DEFAULT_SAMPLE_INTERVAL)
+    sample_window = config.get(CONF_SAMPLE_WINDOW, DEFAULT_SAMPLE_WINDOW)
+    pipeline = config.get(CONF_PIPELINE, DEFAULT_PIPELINE)
+    burst_interval = config.get(CONF_BURST_INTERVAL, DEFAULT_BURST_INTERVAL)
+    burst_duration = config.get(CONF_BURST_DURATION, DEFAULT_BURST_DURATION)
+    burst_triggers = config.get(CONF_BURST_TRIGGERS, DEFAULT_BURST_TRIGGERS)
+    capture_path = config.get(CONF_CAPTURE_PATH, DEFAULT_CAPTURE_PATH)
+    capture_max_bytes = config.get(
+        CONF_CAPTURE_MAX_BYTES, DEFAULT_CAPTURE_MAX_BYTES
+    )
+    replay_speed = config.get(CONF_REPLAY_SPEED, DEFAULT_REPLAY_SPEED)
+    restore = config.get(CONF_RESTORE, DEFAULT_RESTORE)
+
+    profiles = await async_load_profiles(hass)
+    model = config.get(CONF_PROFILE, PROFILE_AUTO)
+    detect_profile = model == PROFILE_AUTO
+    if detect_profile:
+        model = config.get(ENTRY_PROFILE, DEFAULT_PROFILE)
+    if model not in profiles:
+        _LOGGER.error("%s: unknown profile %s, using %s", name, model, DEFAULT_PROFILE)
+        model = DEFAULT_PROFILE
+
+    _LOGGER.debug("setup %s.%s", DOMAIN, name)
+
+    # create and register the hub
+    hub = NovusHub(
+        hass,
+        name,
+        host,
+        interval,
+        max_registers=max_registers,
+        transport=transport,
+        unit_id=unit_id,
+        deadband=deadband,
+        slow_interval=slow_interval,
+        retries=retries,
+        max_age=max_age,
+        sample_interval=sample_interval,
+        sample_window=sample_window,
+        pipeline=pipeline,
+        burst_interval=burst_interval,
+        burst_duration=burst_duration,
+        burst_triggers=burst_triggers,
+        capture_path=capture_path,
+        capture_max_bytes=capture_max_bytes,
+        replay_speed=replay_speed,
+        restore=restore,
+        profile=profiles[model],
+        detect_profile=detect_profile,
+        entry=entry,
+    )
+    hub.join_phases()
+    hass.data[DOMAIN][name] = {"hub": hub, "options": dict(entry.options)}
+    ready = False
+    try:
+        await hub.async_restore()
+        hass.async_create_background_task(hub.async_start(), f"{name} connect")
+        if hub.sampler is not None:
+            hub.sampler.start()
+
+        for component in PLATFORMS:
+            hass.async_create_task(
+                hass.config_entries.async_forward_entry_setup(entry, component)
+            )
+        entry.async_on_unload(entry.add_update_listener(_async_entry_updated))
+        ready = True
+    finally:
+        if not ready:
+            # give the phase slot back, it would skew every other hub's
+            del hass.data[DOMAIN][name]
+            hub.close()
+    hub.mark_startup("setup")
+    return True
+
+
+async def _async_entry_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload once the options changed.
+
+    The hub updates the entry's data too, caching the identity and
+    detected profile, that alone needs no reload.
+    """
+    data = hass.data[DOMAIN].get(entry.data[CONF_NAME])
+    if data is not None and data["options"] != entry.options:
+        hass.config_entries.async_schedule_reload(entry.entry_id)
+
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Removes a configuration entry."""
+    unloaded = all(
+        await asyncio.gather(*[
+            hass.config_entries.async_forward_entry_unload(entry, component)
+            for component in PLATFORMS
+        ])
+    )
+
+    if not unloaded:
+        return False
+
+    hass.data[DOMAIN].pop(entry.data["name"])["hub"].close()
+    return True
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Delete the saved snapshot of a removed entry."""
+    await Store(hass, STORE_VERSION, store_key(entry.entry_id)).async_remove()
+
+
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload a configuration entry."""
+    await async_unload_entry(hass, entry)
+    await async_setup_entry(hass, entry)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import logging
+from typing import Optional
+
+from homeassistant.components.number import (
+    NumberDeviceClass,
+    NumberEntity,
+    NumberEntityDescription,
+    NumberMode,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_NAME, UnitOfTemperature
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .const import ATTR_MANUFACTURER, DOMAIN, NovusRegister, NovusTemperature
+from .hub import NovusHub
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+) -> bool:
+    hub_name = entry.data[CONF_NAME]
+    hub = hass.data[DOMAIN][hub_name]["hub"]
+
+    device_info: DeviceInfo = {
+        "identifiers": {(DOMAIN, hub_name)},
+        "name": hub_name,
+        "manufacturer": ATTR_MANUFACTURER,
+    }
+
+    async_add_entities(
+        NovusNumber(hub_name, hub, device_info, description)
+        for description in hub.profile.registers.values()
+        if description.writable
+    )
+    return True
+
+
+class NovusNumber(CoordinatorEntity, NumberEntity):
+    """Represents a writable setpoint register on the controller"""
+
+    _attr_mode = NumberMode.BOX
+
+    def __init__(
+        self,
+        platform_name: str,
+        hub: NovusHub,
+        device_info: DeviceInfo,
+        description: NovusRegister,
+    ) -> None:
+        self._platform_name = platform_name
+        self._attr_device_info = device_info
+        if isinstance(description, NovusTemperature):
+            self.entity_description = NumberEntityDescription(
+                key=description.key,
+                name=description.name,
+                entity_registry_enabled_default=description.enabled,
+                device_class=NumberDeviceClass.TEMPERATURE,
+                native_unit_of_measurement=UnitOfTemperature.CELSIUS,
+                icon="mdi:thermometer",
+            )
+        else:
+            self.entity_description = NumberEntityDescription(
+                key=description.key,
+                name=description.name,
+                entity_registry_enabled_default=description.enabled,
+            )
+
+        # the whole int16 range of the register, in engineering units
+        scale = description.scale
+        self._attr_native_min_value = -0x8000 / scale
+        self._attr_native_max_value = 0x7FFF / scale
+        self._attr_native_step = 1 / scale
+        # slot of the value in the hub's snapshots
+        self._index = hub.layout.index[description.key]
+
+        super().__init__(coordinator=hub, context=description.key)
+
+    @property
+    def name(self) -> str:
+        """Returns the number name."""
+        return f"{self._platform_name} {self.entity_description.name}"
+
+    @property
+    def unique_id(self) -> Optional[str]:
+        """Returns the number's unique ID"""
+        return f"{self._platform_name}_{self.entity_description.key}"
+
+    @property
+    def native_value(self) -> Optional[float]:
+        """Return the setpoint."""
+        return self.coordinator.data.slots[self._index]
+
+    async def async_set_native_value(self, value: float) -> None:
+        """Queue a write of the setpoint."""
+        await self.coordinator.writer.async_write(self.entity_description.key, value)
@@ -0,0 +1,130 @@
+"""Novus Modbus poll phase allocation
+
+Every hub polls on a grid of its scan interval shifted by its phase, a
+fraction of the interval. The phases of all hubs are spread evenly, so
+hubs set up together do not hit the executor, the gateways and the event
+loop in the same instant.
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional
+import zlib
+
+# a hub's phase moves up to this fraction of a slot off the even grid,
+# so hubs do not poll in lockstep with other integrations' round seconds
+PHASE_JITTER = 0.2
+# a re-spread never brings a poll closer than this fraction of the
+# interval to the previous one
+MIN_GAP = 0.5
+# seconds a hub's poll may start off its phase before it is moved back,
+# Home Assistant's coordinators schedule polls on whole seconds
+PHASE_TOLERANCE = 1.0
+# seconds of poll starts kept by the load curve
+LOAD_WINDOW = 60
+
+
+def _jitter(key: str) -> float:
+    """Return a per key offset in [-0.5, 0.5), stable across restarts."""
+    return zlib.crc32(key.encode()) / 2**32 - 0.5
+
+
+class LoadCurve:
+    """Poll starts per second over the last window seconds"""
+
+    __slots__ = ("window", "active", "peak_active", "_counts", "_seconds")
+
+    def __init__(self, window: int = LOAD_WINDOW):
+        self.window = window
+        # polls running right now, and the most ever running at once
+        self.active = 0
+        self.peak_active = 0
+        self._counts = [0] * window
+        # the second each bin was last counted in
+        self._seconds = [-1] * window
+
+    def start(self, now: float) -> None:
+        second = int(now)
+        i = second % self.window
+        if self._seconds[i] != second:
+            self._seconds[i] = second
+            self._counts[i] = 0
+        self._counts[i] += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+
+    def finish(self) -> None:
+        self.active -= 1
+
+    def curve(self, now: float) -> list[int]:
+        """Return the poll starts of each of the last window seconds."""
+        second = int(now)
+        curve = []
+        for ago in range(self.window - 1, -1, -1):
+            i = (second - ago) % self.window
+            curve.append(self._counts[i] if self._seconds[i] == second - ago else 0)
+        return curve
+
+    def as_dict(self, now: float) -> dict:
+        curve = self.curve(now)
+        return {
+            "peak": max(curve),
+            "mean": sum(curve) / len(curve),
+            "active": self.active,
+            "peak_active": self.peak_active,
+            "curve": curve,
+        }
+
+
+class PhaseAllocator:
+    """Spreads the polls of many hubs evenly over their scan interval.
+
+    Hubs are ordered by key, so an entry keeps its offset across
+    restarts as long as the set of entries is the same. Adding or
+    removing a hub re-spreads every phase, running hubs move to theirs
+    with their next poll.
+    """
+
+    def __init__(self, jitter: float = PHASE_JITTER):
+        self.jitter = jitter
+        self.load = LoadCurve()
+        self.spreads = 0
+        self._phases: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._phases)
+
+    def add(self, key: str) -> None:
+        self._phases[key] = 0.0
+        self._spread()
+
+    def remove(self, key: str) -> None:
+        if self._phases.pop(key, None) is not None:
+            self._spread()
+
+    def _spread(self) -> None:
+        count = len(self._phases)
+        for slot, key in enumerate(sorted(self._phases)):
+            self._phases[key] = ((slot + self.jitter * _jitter(key)) / count) % 1.0
+        self.spreads += 1
+
+    def phase(self, key: str) -> Optional[float]:
+        """Return key's phase as a fraction of the interval."""
+        return self._phases.get(key)
+
+    def until_slot(self, key: str, now: float, interval: float) -> float:
+        """Return the seconds from now to key's next slot on the grid."""
+        offset = (self._phases.get(key) or 0.0) * interval
+        return (offset - now) % interval
+
+    def next_poll(self, key: str, now: float, interval: float) -> float:
+        """Return the time key polls next, now and the result in loop time."""
+        offset = (self._phases.get(key) or 0.0) * interval
+        due = offset + math.ceil((now - offset) / interval) * interval
+        if due - now < interval * MIN_GAP:
+            due += interval
+        return due
+
+
+# shared by every hub of the running instance
+POLL_PHASES = PhaseAllocator()
@@ -0,0 +1,75 @@
+"""Novus Modbus read planner"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from .const import NovusRegister
+
+
+@dataclass(frozen=True)
+class ReadBlock:
+    """A single contiguous holding register read"""
+
+    address: int
+    count: int
+    registers: tuple[NovusRegister, ...]
+
+    def offset(self, register: NovusRegister) -> int:
+        """Return the position of one of the block's registers in it."""
+        if register.address is None:
+            raise ValueError(f"{register.key} is not read from a register")
+        return register.address - self.address
+
+
+def plan_reads(
+    registers: Iterable[NovusRegister],
+    max_count: int,
+    unreadable: Iterable[int] = (),
+) -> tuple[ReadBlock, ...]:
+    """Compile a register map into the smallest set of contiguous reads.
+
+    Blocks may span addresses nobody asked for (one longer request is
+    cheaper than an extra round trip) but never an unreadable address and
+    never more than max_count registers.
+    """
+    if max_count < 1:
+        raise ValueError(f"max_count must be positive, got {max_count}")
+
+    blocked = set(unreadable)
+    by_address: dict[int, list[NovusRegister]] = {}
+    for register in registers:
+        if register.address is None:
+            continue
+        if register.address in blocked:
+            raise ValueError(
+                f"{register.key} maps to unreadable register r{register.address}"
+            )
+        by_address.setdefault(register.address, []).append(register)
+
+    blocks = []
+    addresses = sorted(by_address)
+    i = 0
+    while i < len(addresses):
+        start = addresses[i]
+        end = start
+        i += 1
+        # greedily extend the block while the next wanted address fits
+        while i < len(addresses):
+            candidate = addresses[i]
+            if candidate - start >= max_count:
+                break
+            if any(a in blocked for a in range(end + 1, candidate)):
+                break
+            end = candidate
+            i += 1
+
+        members = tuple(
+            register
+            for address in range(start, end + 1)
+            for register in by_address.get(address, ())
+        )
+        blocks.append(ReadBlock(start, end - start + 1, members))
+
+    return tuple(blocks)
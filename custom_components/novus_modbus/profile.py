@@ -0,0 +1,256 @@
+"""Novus Modbus controller profiles
+
+A profile is one controller model's register map kept as a JSON data
+file, see profiles/differential.json. Profiles are validated and compiled
+once, when the integration loads, and every hub of that model shares the
+result: its register descriptions and the read plans per max_registers.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Iterable, Mapping, Optional
+
+import voluptuous as vol
+
+from .const import (
+    DATA_TYPES,
+    DEFAULT_PROFILE,
+    PROFILES_CONFIG_DIR,
+    PROFILES_DIR,
+    TIER_IDENTITY,
+    TIER_LIVE,
+    TIER_SLOW,
+    TIERS,
+    NovusBit,
+    NovusRegister,
+    register_description,
+)
+from .decoder import BlockDecoder, compile_decoders
+from .planner import plan_reads
+
+if TYPE_CHECKING:
+    from homeassistant.core import HomeAssistant
+
+_LOGGER = logging.getLogger(__name__)
+
+WORD = vol.All(int, vol.Range(min=0, max=0xFFFF))
+
+REGISTER_SCHEMA = vol.Schema(
+    {
+        vol.Required("key"): vol.Match(r"^[a-z0-9_]+$"),
+        vol.Required("name"): str,
+        vol.Optional("kind"): vol.In(["temperature"]),
+        vol.Required("address"): WORD,
+        vol.Optional("data_type"): vol.In(DATA_TYPES),
+        vol.Optional("scale"): vol.All(int, vol.Range(min=1)),
+        vol.Optional("bit"): vol.All(int, vol.Range(min=0, max=15)),
+        vol.Optional("deadband"): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional("tier"): vol.In(TIERS),
+        vol.Optional("writable"): bool,
+        # entity enabled when the controller is added
+        vol.Optional("enabled"): bool,
+    }
+)
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Required("model"): vol.Match(r"^[a-z0-9_]+$"),
+        vol.Required("name"): str,
+        # register holding the firmware version, and the versions (after
+        # masking) that select this profile automatically
+        vol.Optional("version_register"): str,
+        vol.Optional("versions", default=list): [
+            {vol.Optional("mask", default=0xFFFF): WORD, vol.Required("value"): WORD}
+        ],
+        vol.Optional("unreadable", default=list): [WORD],
+        vol.Required("registers"): vol.All({str: REGISTER_SCHEMA}, vol.Length(min=1)),
+    }
+)
+
+# every combination of due tiers a poll can ask for
+DUE_TIERS = tuple(
+    frozenset(due)
+    for due in (
+        {TIER_LIVE},
+        {TIER_LIVE, TIER_SLOW},
+        {TIER_LIVE, TIER_IDENTITY},
+        {TIER_LIVE, TIER_SLOW, TIER_IDENTITY},
+    )
+)
+
+# model: compiled profile, filled by load_profiles()
+_PROFILES: dict[str, Profile] = {}
+
+
+class Profile:
+    """A validated controller profile"""
+
+    __slots__ = (
+        "model", "name", "registers", "bits", "unreadable", "version_key",
+        "versions", "_plans",
+    )
+
+    def __init__(self, data: dict):
+        self.model: str = data["model"]
+        self.name: str = data["name"]
+        self.registers: dict[str, NovusRegister] = {
+            register_id: register_description(spec)
+            for register_id, spec in data["registers"].items()
+        }
+        # the bit registers, as binary sensors of their status word
+        self.bits: tuple[NovusBit, ...] = tuple(
+            NovusBit(
+                key=register.key,
+                name=register.name,
+                address=register.address,
+                bit=register.bit,
+                enabled=register.enabled,
+            )
+            for register in self.registers.values()
+            if register.bit is not None and register.address is not None
+        )
+        self.unreadable: tuple[int, ...] = tuple(data["unreadable"])
+        self.versions: tuple[tuple[int, int], ...] = tuple(
+            (version["mask"], version["value"]) for version in data["versions"]
+        )
+        self.version_key: Optional[str] = None
+        if "version_register" in data:
+            self.version_key = self.registers[data["version_register"]].key
+        # max_registers: {due tiers: decoders}
+        self._plans: dict[int, dict[frozenset[str], tuple[BlockDecoder, ...]]] = {}
+
+    def __repr__(self) -> str:
+        return f"<Profile {self.model}>"
+
+    def plans(
+        self, max_registers: int
+    ) -> dict[frozenset[str], tuple[BlockDecoder, ...]]:
+        """Return the read plan of every combination of due tiers."""
+        plans = self._plans.get(max_registers)
+        if plans is None:
+            plans = self._plans[max_registers] = {
+                due: compile_decoders(
+                    plan_reads(
+                        (r for r in self.registers.values() if r.tier in due),
+                        max_registers,
+                        self.unreadable,
+                    )
+                )
+                for due in DUE_TIERS
+            }
+        return plans
+
+    def version(self, data: Mapping) -> Optional[int]:
+        """Return the raw version register out of decoded data."""
+        if self.version_key is None:
+            return None
+        return data.get(self.version_key)
+
+    def matches(self, version: int) -> bool:
+        return any(version & mask == value for mask, value in self.versions)
+
+
+def compile_profile(data: dict, max_registers: Iterable[int] = ()) -> Profile:
+    """Validate a profile's data and compile it, raises vol.Invalid."""
+    data = PROFILE_SCHEMA(data)
+    registers = data["registers"]
+
+    keys: set[str] = set()
+    bits: set[tuple[int, int]] = set()
+    for register_id, spec in registers.items():
+        if spec["key"] in keys:
+            raise vol.Invalid(f"duplicate key {spec['key']}", path=[register_id])
+        keys.add(spec["key"])
+        if "bit" in spec:
+            if (spec["address"], spec["bit"]) in bits:
+                raise vol.Invalid(
+                    f"bit {spec['bit']} of r{spec['address']} mapped twice",
+                    path=[register_id],
+                )
+            bits.add((spec["address"], spec["bit"]))
+            if spec.get("writable"):
+                raise vol.Invalid("bits are not writable", path=[register_id])
+        if spec["address"] in data["unreadable"]:
+            raise vol.Invalid(
+                f"r{spec['address']} is unreadable", path=[register_id]
+            )
+    version_register = data.get("version_register")
+    if version_register is not None and version_register not in registers:
+        raise vol.Invalid(f"unknown version register {version_register}")
+
+    profile = Profile(data)
+    for count in max_registers:
+        try:
+            profile.plans(count)
+        except ValueError as exception:
+            raise vol.Invalid(str(exception)) from exception
+    return profile
+
+
+def load_profile(path: str, max_registers: Iterable[int] = ()) -> Profile:
+    """Read and compile one profile file."""
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    return compile_profile(data, max_registers)
+
+
+def load_profiles(
+    directories: Iterable[str] = (PROFILES_DIR,), max_registers: Iterable[int] = ()
+) -> dict[str, Profile]:
+    """Load every profile of directories into the registry.
+
+    A later directory's profile replaces a built-in one of the same model.
+    Broken files are logged and skipped. Does blocking I/O.
+    """
+    max_registers = tuple(max_registers)
+    profiles = {}
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                profile = load_profile(path, max_registers)
+            except (OSError, ValueError, vol.Invalid) as exception:
+                _LOGGER.error("ignoring profile %s: %s", path, exception)
+                continue
+            profiles[profile.model] = profile
+    _PROFILES.clear()
+    _PROFILES.update(profiles)
+    return dict(_PROFILES)
+
+
+async def async_load_profiles(
+    hass: HomeAssistant, max_registers: Iterable[int] = ()
+) -> dict[str, Profile]:
+    """Load the built-in and user profiles once per run."""
+    if not _PROFILES:
+        await hass.async_add_executor_job(
+            load_profiles,
+            (PROFILES_DIR, hass.config.path(PROFILES_CONFIG_DIR)),
+            tuple(max_registers),
+        )
+    return dict(_PROFILES)
+
+
+def get_profile(model: str = DEFAULT_PROFILE) -> Profile:
+    """Return a loaded profile, raises KeyError if there is none."""
+    if not _PROFILES:
+        # outside of a running integration, e.g. tests and benchmarks
+        load_profiles()
+    return _PROFILES[model]
+
+
+def select_profile(version: Optional[int]) -> Profile:
+    """Return the profile matching a version register, the default if none."""
+    if not _PROFILES:
+        load_profiles()
+    if version is not None:
+        for profile in _PROFILES.values():
+            if profile.matches(version):
+                return profile
+    return _PROFILES[DEFAULT_PROFILE]
@@ -0,0 +1,321 @@
+"""Novus Modbus headless runner
+
+Polls the controllers of a JSON config file with NovusCore, without a
+running Home Assistant, so polling can move to other processes or hosts
+and the core can be profiled on its own. Each poll is streamed as one
+line of JSON on stdout, or the latest values are served as Prometheus
+text metrics:
+
+    python -m custom_components.novus_modbus.runner controllers.json
+    python -m custom_components.novus_modbus.runner controllers.json --metrics 9105
+
+with a config file like
+
+    {
+      "scan_interval": 10,
+      "controllers": [
+        {"name": "cooler", "host": "gateway.local:502", "unit_id": 1},
+        {"name": "freezer", "host": "gateway.local:502", "unit_id": 2}
+      ]
+    }
+
+Controllers on one gateway share its connection and are polled on
+evenly spread phases of the interval, like hubs in Home Assistant.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+from typing import Callable, Iterable, Optional
+
+import voluptuous as vol
+
+from .const import (
+    CONF_MAX_AGE,
+    CONF_MAX_REGISTERS,
+    CONF_PIPELINE,
+    CONF_PROFILE,
+    CONF_RETRIES,
+    CONF_SLOW_INTERVAL,
+    CONF_TRANSPORT,
+    CONF_UNIT_ID,
+    DEFAULT_MAX_AGE,
+    DEFAULT_MAX_REGISTERS,
+    DEFAULT_PIPELINE,
+    DEFAULT_PROFILE,
+    DEFAULT_RETRIES,
+    DEFAULT_SCAN_INTERVAL,
+    DEFAULT_SLOW_INTERVAL,
+    DEFAULT_TRANSPORT,
+    DEFAULT_UNIT_ID,
+    MODBUS_MAX_REGISTERS,
+    PROFILES_DIR,
+    TIER_IDENTITY,
+    TIER_LIVE,
+    TIER_SLOW,
+    TRANSPORT_ASYNC,
+    TRANSPORT_SYNC,
+)
+from .core import NovusCore
+from .phase import PhaseAllocator
+from .profile import get_profile, load_profiles
+from .snapshot import Snapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_CONTROLLERS = "controllers"
+CONF_HOST = "host"
+CONF_NAME = "name"
+CONF_PROFILES = "profiles"
+CONF_SCAN_INTERVAL = "scan_interval"
+
+CONTROLLER_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_NAME): str,
+        vol.Required(CONF_HOST): str,
+        vol.Optional(CONF_UNIT_ID, default=DEFAULT_UNIT_ID): vol.All(
+            int, vol.Range(min=1, max=247)
+        ),
+        vol.Optional(CONF_PROFILE, default=DEFAULT_PROFILE): str,
+        vol.Optional(CONF_TRANSPORT, default=DEFAULT_TRANSPORT): vol.In(
+            [TRANSPORT_ASYNC, TRANSPORT_SYNC]
+        ),
+        vol.Optional(CONF_PIPELINE, default=DEFAULT_PIPELINE): vol.All(
+            int, vol.Range(min=1, max=16)
+        ),
+        vol.Optional(CONF_MAX_REGISTERS, default=DEFAULT_MAX_REGISTERS): vol.All(
+            int, vol.Range(min=1, max=MODBUS_MAX_REGISTERS)
+        ),
+        vol.Optional(CONF_SLOW_INTERVAL, default=DEFAULT_SLOW_INTERVAL): vol.All(
+            int, vol.Range(min=1)
+        ),
+        vol.Optional(CONF_RETRIES, default=DEFAULT_RETRIES): vol.All(
+            int, vol.Range(min=0)
+        ),
+        vol.Optional(CONF_MAX_AGE, default=DEFAULT_MAX_AGE): vol.All(
+            int, vol.Range(min=0)
+        ),
+    }
+)
+
+RUNNER_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_SCAN_INTERVAL, default=DEFAULT_SCAN_INTERVAL): vol.All(
+            vol.Coerce(float), vol.Range(min=0.1)
+        ),
+        # directory of profiles besides the built-in ones
+        vol.Optional(CONF_PROFILES): str,
+        vol.Required(CONF_CONTROLLERS): vol.All(
+            [CONTROLLER_SCHEMA], vol.Length(min=1)
+        ),
+    }
+)
+
+
+def create_core(config: dict) -> NovusCore:
+    """Create the core of one validated controller config."""
+    return NovusCore(
+        config[CONF_NAME],
+        config[CONF_HOST],
+        get_profile(config[CONF_PROFILE]),
+        {
+            TIER_LIVE: 0,
+            TIER_SLOW: config[CONF_SLOW_INTERVAL],
+            TIER_IDENTITY: None,
+        },
+        config[CONF_MAX_REGISTERS],
+        config[CONF_TRANSPORT],
+        config[CONF_UNIT_ID],
+        config[CONF_RETRIES],
+        config[CONF_MAX_AGE],
+        pipeline=config[CONF_PIPELINE],
+    )
+
+
+def poll_record(
+    core: NovusCore, snapshot: Optional[Snapshot], error: Optional[Exception]
+) -> dict:
+    """Return the JSON record of one poll."""
+    record = {"name": core.name, "unit_id": core.unit_id, "time": time.time()}
+    if snapshot is None:
+        record["error"] = str(error) or type(error).__name__
+    else:
+        record["values"] = dict(snapshot)
+        record["stale"] = sorted(core.stale)
+    return record
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_metrics(cores: Iterable[NovusCore]) -> str:
+    """Return the latest values and telemetry of cores as Prometheus text."""
+    values = ["# TYPE novus_value gauge"]
+    stale = ["# TYPE novus_stale gauge"]
+    polls = ["# TYPE novus_polls_total counter"]
+    failed = ["# TYPE novus_failed_polls_total counter"]
+    latency = ["# TYPE novus_poll_seconds gauge"]
+    for core in cores:
+        controller = f'controller="{_label(core.name)}"'
+        for key, value in core.snapshot().items():
+            if isinstance(value, (bool, int, float)) and math.isfinite(value):
+                values.append(
+                    f'novus_value{{{controller},key="{key}"}} {float(value)!r}'
+                )
+        telemetry = core.telemetry
+        stale.append(f"novus_stale{{{controller}}} {len(core.stale)}")
+        polls.append(f"novus_polls_total{{{controller}}} {telemetry.polls}")
+        failed.append(
+            f"novus_failed_polls_total{{{controller}}} {telemetry.failed_polls}"
+        )
+        if telemetry.poll_latency.last is not None:
+            latency.append(
+                f"novus_poll_seconds{{{controller}}} {telemetry.poll_latency.last!r}"
+            )
+    return "\n".join(values + stale + polls + failed + latency) + "\n"
+
+
+async def async_poll_forever(
+    core: NovusCore,
+    interval: float,
+    phases: PhaseAllocator,
+    emit: Callable[[NovusCore, Optional[Snapshot], Optional[Exception]], None],
+) -> None:
+    """Poll core on its phase of interval and emit every result."""
+    loop = asyncio.get_running_loop()
+    phases.add(core.name)
+    try:
+        while True:
+            due = phases.next_poll(core.name, loop.time(), interval)
+            await asyncio.sleep(due - loop.time())
+            try:
+                snapshot = await core.async_poll(time.monotonic() + interval)
+            except Exception as exception:  # pylint: disable=broad-except
+                _LOGGER.debug("%s: poll failed: %s", core.name, exception)
+                emit(core, None, exception)
+            else:
+                emit(core, snapshot, None)
+    finally:
+        phases.remove(core.name)
+
+
+def _write_ndjson(
+    core: NovusCore, snapshot: Optional[Snapshot], error: Optional[Exception]
+) -> None:
+    sys.stdout.write(json.dumps(poll_record(core, snapshot, error)) + "\n")
+    sys.stdout.flush()
+
+
+def _discard(
+    core: NovusCore, snapshot: Optional[Snapshot], error: Optional[Exception]
+) -> None:
+    pass
+
+
+async def async_serve_metrics(cores: list[NovusCore], port: int) -> asyncio.Server:
+    """Serve format_metrics() to any HTTP request on port."""
+
+    async def _handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            # the request line and headers, the path does not matter
+            while (await reader.readline()).strip():
+                pass
+            body = format_metrics(cores).encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(_handle, port=port)
+
+
+async def async_run(config: dict, metrics_port: Optional[int] = None) -> None:
+    """Poll every controller of a validated config until cancelled."""
+    cores = [create_core(controller) for controller in config[CONF_CONTROLLERS]]
+    phases = PhaseAllocator()
+    server = None
+    emit = _write_ndjson
+    if metrics_port is not None:
+        server = await async_serve_metrics(cores, metrics_port)
+        # metrics are pulled, the polls only update the cores
+        emit = _discard
+    try:
+        await asyncio.gather(
+            *(
+                async_poll_forever(core, config[CONF_SCAN_INTERVAL], phases, emit)
+                for core in cores
+            )
+        )
+    finally:
+        if server is not None:
+            server.close()
+        for core in cores:
+            core.close()
+        # imported by the first poll
+        from .transport import close_transports
+
+        close_transports()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Poll Novus controllers without Home Assistant."
+    )
+    parser.add_argument("config", help="JSON file listing the controllers")
+    parser.add_argument(
+        "--metrics",
+        type=int,
+        metavar="PORT",
+        help="serve Prometheus metrics on PORT instead of writing JSON lines",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.WARNING, stream=sys.stderr
+    )
+
+    try:
+        with open(args.config, encoding="utf-8") as file:
+            config = RUNNER_SCHEMA(json.load(file))
+    except (OSError, ValueError, vol.Invalid) as exception:
+        parser.error(f"{args.config}: {exception}")
+    names = [controller[CONF_NAME] for controller in config[CONF_CONTROLLERS]]
+    if len(set(names)) != len(names):
+        parser.error(f"{args.config}: controller names must be unique")
+    directories = [PROFILES_DIR]
+    if CONF_PROFILES in config:
+        directories.append(config[CONF_PROFILES])
+    profiles = load_profiles(directories)
+    for controller in config[CONF_CONTROLLERS]:
+        if controller[CONF_PROFILE] not in profiles:
+            parser.error(f"{controller[CONF_NAME]}: unknown profile")
+
+    try:
+        asyncio.run(async_run(config, args.metrics))
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        # the reader of the stream went away, e.g. head, keep the
+        # interpreter from failing to flush stdout on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Novus Modbus high rate sampling of the temperature probes"""
+from __future__ import annotations
+
+from array import array
+import asyncio
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+
+from .const import SAMPLED_REGISTERS, SAMPLE_STATS
+from .decoder import BlockDecoder
+from .planner import ReadBlock
+from .scheduler import DeadlineExceeded, DeviceBackoff
+
+if TYPE_CHECKING:
+    from .hub import NovusHub
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """Fixed size buffer of (timestamp, value) samples.
+
+    Both columns live in preallocated arrays of doubles, appending
+    overwrites the oldest sample once the buffer is full.
+    """
+
+    __slots__ = ("capacity", "count", "_head", "_times", "_values")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self.count = 0
+        # index the next sample is written to
+        self._head = 0
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: float, value: float) -> None:
+        head = self._head
+        self._times[head] = timestamp
+        self._values[head] = value
+        self._head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _newest_first(self, since: float) -> Iterator[int]:
+        """Yield the indices of samples taken at or after since."""
+        times = self._times
+        i = self._head
+        for _ in range(self.count):
+            i = (i - 1) % self.capacity
+            if times[i] < since:
+                return
+            yield i
+
+    def window(self, since: float = -math.inf) -> list[tuple[float, float]]:
+        """Return the samples taken at or after since, oldest first."""
+        times, values = self._times, self._values
+        samples = [(times[i], values[i]) for i in self._newest_first(since)]
+        samples.reverse()
+        return samples
+
+    def aggregate(self, since: float = -math.inf) -> Optional[dict[str, float]]:
+        """Return min/max/mean/last of the window, None if it is empty."""
+        values = self._values
+        count = 0
+        total = 0.0
+        low = math.inf
+        high = -math.inf
+        last = None
+        for i in self._newest_first(since):
+            value = values[i]
+            if last is None:
+                last = value
+            count += 1
+            total += value
+            if value < low:
+                low = value
+            if value > high:
+                high = value
+        if last is None:
+            return None
+        return {"min": low, "max": high, "mean": total / count, "last": last}
+
+
+class FastSampler:
+    """Reads the temperature probes of one hub at a high rate.
+
+    Samples go into one ring buffer per probe, the hub publishes their
+    aggregates at its regular scan interval.
+    """
+
+    def __init__(self, hub: NovusHub, interval: float, window: float):
+        self._hub = hub
+        self.interval = interval
+        registers = tuple(
+            hub.profile.registers[key] for key in SAMPLED_REGISTERS
+        )
+        addresses = [
+            register.address for register in registers if register.address is not None
+        ]
+        first, last = min(addresses), max(addresses)
+        self._decoder = BlockDecoder(ReadBlock(first, last - first + 1, registers))
+        capacity = max(1, math.ceil(window / interval))
+        self.channels = {
+            register.key: RingBuffer(capacity) for register in registers
+        }
+        self.samples = 0
+        self.missed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = self._hub.hass.async_create_background_task(
+                self._run(), f"{self._hub.name} fast sampler"
+            )
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        due = time.monotonic()
+        while True:
+            due += self.interval
+            await self.async_sample(due)
+            delay = due - time.monotonic()
+            if delay < 0:
+                # fell behind, skip the samples that are already late
+                due -= math.floor(delay / self.interval) * self.interval
+                delay = due - time.monotonic()
+            await asyncio.sleep(delay)
+
+    async def async_sample(self, deadline: Optional[float] = None) -> bool:
+        """Take one sample of every channel, returns False if it failed."""
+        hub = self._hub
+        block = self._decoder.block
+        try:
+            resp = await hub.transport.scheduler.async_read(
+                hub.unit_id, block.address, block.count, deadline, hub.telemetry
+            )
+        except (DeviceBackoff, DeadlineExceeded, asyncio.TimeoutError):
+            resp = None
+        except Exception as exception:
+            _LOGGER.debug("%s: sampling failed: %s", hub.name, exception)
+            resp = None
+        if resp is None or resp.isError() or len(resp.registers) < block.count:
+            self.missed += 1
+            return False
+
+        # words beyond the block are dropped
+        registers = resp.registers[: block.count]
+        if hub.recorder is not None:
+            hub.recorder.record(hub.unit_id, block.address, registers)
+        data: dict[str, Any] = {}
+        self._decoder.decode_into(registers, data)
+        now = time.time()
+        for key, value in data.items():
+            self.channels[key].append(now, value)
+        self.samples += 1
+        return True
+
+    def aggregates(self, since: float) -> dict[str, float]:
+        """Return the windowed aggregates keyed like the aggregate sensors."""
+        data = {}
+        for key, buffer in self.channels.items():
+            stats = buffer.aggregate(since)
+            if stats is None:
+                continue
+            for stat in SAMPLE_STATS:
+                data[f"{key}_{stat}"] = round(stats[stat], 2)
+        return data
+
+    def dump(self, since: float = -math.inf) -> dict[str, list[tuple[float, float]]]:
+        """Return the raw samples of every channel taken at or after since."""
+        return {key: buffer.window(since) for key, buffer in self.channels.items()}
@@ -0,0 +1,300 @@
+"""Novus Modbus bus scheduler"""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+import logging
+import random
+import time
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+if TYPE_CHECKING:
+    from pymodbus.pdu import ModbusResponse
+    from pymodbus.register_read_message import ReadHoldingRegistersResponse
+    from pymodbus.register_write_message import WriteMultipleRegistersResponse
+
+    from .telemetry import PollTelemetry
+    from .transport import NovusTransport
+
+_LOGGER = logging.getLogger(__name__)
+
+# a device that misses BACKOFF_THRESHOLD answers in a row is skipped for
+# about BACKOFF_MIN seconds, doubling on every further failure up to
+# BACKOFF_MAX.
+# A single lost frame (CRC error) is left to the caller's retry.
+BACKOFF_THRESHOLD = 2
+BACKOFF_MIN = 5.0
+BACKOFF_MAX = 300.0
+
+
+def backoff_delay(attempt: int, minimum: float, maximum: float) -> float:
+    """Return the jittered exponential delay before retry number attempt.
+
+    Half the delay is fixed and half random, so devices and links that
+    failed together do not all come back in the same instant.
+    """
+    delay = min(minimum * 2**attempt, maximum)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class DeviceBackoff(Exception):
+    """The device is not answering and is being skipped for now"""
+
+
+class DeadlineExceeded(Exception):
+    """The request waited on the bus past its deadline"""
+
+
+@dataclass
+class DeviceState:
+    """Scheduling state and statistics of one unit on the bus"""
+
+    failures: int = 0
+    backoff_until: float = 0.0
+    lag: float = 0.0
+    max_lag: float = 0.0
+    requests: int = 0
+    skipped: int = 0
+
+    def in_backoff(self, now: float) -> bool:
+        return now < self.backoff_until
+
+
+@dataclass
+class _Request:
+    address: int
+    count: int
+    deadline: Optional[float]
+    future: asyncio.Future
+    telemetry: Optional[PollTelemetry]
+    # registers to write, None for a read
+    values: Optional[list[int]] = None
+    # answer timeout overriding the transport's, reads only. It starts
+    # when the request is sent, time spent queued does not count.
+    timeout: Optional[float] = None
+    queued: float = field(default_factory=time.monotonic)
+
+
+class BusScheduler:
+    """Owns every transaction on one bus.
+
+    Each unit has its own request queue and the worker serves one request
+    per unit in turn, so a device polling many blocks cannot starve the
+    others and a device in timeout backoff is skipped instead of holding
+    the line for its timeout.
+    """
+
+    def __init__(self, transport: NovusTransport):
+        self._transport = transport
+        self._queues: dict[int, deque[_Request]] = {}
+        self._devices: dict[int, DeviceState] = {}
+        self._worker: Optional[asyncio.Task] = None
+        # requests on the wire when the transport pipelines
+        self._inflight: set[asyncio.Task] = set()
+
+    @property
+    def depth(self) -> int:
+        """Return the requests queued and not yet sent."""
+        return sum(len(requests) for requests in self._queues.values())
+
+    def device(self, unit: int) -> DeviceState:
+        """Return the scheduling state of unit."""
+        return self._devices.setdefault(unit, DeviceState())
+
+    async def async_read(
+        self,
+        unit: int,
+        address: int,
+        count: int,
+        deadline: Optional[float] = None,
+        telemetry: Optional[PollTelemetry] = None,
+        timeout: Optional[float] = None,
+    ) -> ReadHoldingRegistersResponse:
+        """Queue a holding register read and wait for its turn on the bus.
+
+        deadline is a time.monotonic() value after which the request is
+        dropped rather than sent. The transaction is recorded in telemetry.
+        timeout shortens the wait for the answer once the request is on
+        the wire, however long it queued behind others, see NovusTransport.
+        """
+        return await self._submit(
+            unit, address, count, deadline, telemetry, timeout=timeout
+        )
+
+    async def async_write(
+        self,
+        unit: int,
+        address: int,
+        values: list[int],
+        deadline: Optional[float] = None,
+        telemetry: Optional[PollTelemetry] = None,
+    ) -> WriteMultipleRegistersResponse:
+        """Queue a write of consecutive holding registers, like async_read."""
+        return await self._submit(
+            unit, address, len(values), deadline, telemetry, values
+        )
+
+    async def _submit(
+        self,
+        unit: int,
+        address: int,
+        count: int,
+        deadline: Optional[float],
+        telemetry: Optional[PollTelemetry],
+        values: Optional[list[int]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        device = self.device(unit)
+        if device.in_backoff(time.monotonic()):
+            device.skipped += 1
+            raise DeviceBackoff(f"unit {unit} is in backoff")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(unit, deque()).append(
+            _Request(address, count, deadline, future, telemetry, values, timeout)
+        )
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+        return await future
+
+    async def _run(self) -> None:
+        """Serve queued requests round-robin until every queue is empty.
+
+        Requests are sent in the same order whether or not the transport
+        pipelines, with a window above 1 the next one simply goes out
+        before the answer to the previous one is in.
+        """
+        inflight = self._inflight
+        while self._queues or inflight:
+            if not self._queues:
+                await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            for unit in list(self._queues):
+                queue = self._queues.get(unit)
+                if not queue:
+                    continue
+                request = queue.popleft()
+                if not queue:
+                    del self._queues[unit]
+                if request.future.done():
+                    continue
+                if self._transport.window <= 1:
+                    if inflight:
+                        await asyncio.wait(inflight)
+                    await self._serve(unit, request)
+                    continue
+                while len(inflight) >= self._transport.window:
+                    await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                task = asyncio.create_task(self._serve(unit, request))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+
+    async def _serve(self, unit: int, request: _Request) -> None:
+        # pymodbus is only imported once a transport exists
+        from pymodbus.exceptions import ModbusIOException
+
+        device = self.device(unit)
+        now = time.monotonic()
+
+        if device.in_backoff(now):
+            device.skipped += 1
+            request.future.set_exception(DeviceBackoff(f"unit {unit} is in backoff"))
+            return
+        if request.deadline is not None and now > request.deadline:
+            request.future.set_exception(
+                DeadlineExceeded(f"unit {unit} r{request.address} missed its deadline")
+            )
+            return
+
+        device.lag = now - request.queued
+        device.max_lag = max(device.max_lag, device.lag)
+        device.requests += 1
+
+        resp: ModbusResponse
+        try:
+            if request.values is None:
+                resp = await self._transport.async_read(
+                    unit, request.address, request.count, request.timeout
+                )
+            else:
+                resp = await self._transport.async_write(
+                    unit, request.address, request.values
+                )
+        except asyncio.CancelledError:
+            request.future.cancel()
+            raise
+        except Exception as exception:
+            self._record(request, now, exception)
+            self._failed(unit, device)
+            if not request.future.done():
+                request.future.set_exception(exception)
+            return
+
+        self._record(request, now, resp)
+
+        # an exception response still proves the device is alive,
+        # only a missing answer counts towards backoff
+        if isinstance(resp, ModbusIOException):
+            self._failed(unit, device)
+        else:
+            device.failures = 0
+        if not request.future.done():
+            request.future.set_result(resp)
+
+    def _record(
+        self,
+        request: _Request,
+        sent_at: float,
+        result: Union[ModbusResponse, Exception],
+    ) -> None:
+        if request.telemetry is None:
+            return
+        if request.values is None:
+            sent, received = self._transport.frame_sizes(request.count)
+        else:
+            sent, received = self._transport.write_frame_sizes(request.count)
+        if isinstance(result, Exception):
+            received = 0
+        elif result.isError():
+            # an exception response is as long as an empty read
+            received = self._transport.frame_sizes(0)[1]
+        request.telemetry.record_request(
+            time.monotonic() - sent_at,
+            result,
+            sent,
+            received,
+            sent_at - request.queued,
+        )
+
+    def _failed(self, unit: int, device: DeviceState) -> None:
+        device.failures += 1
+        if device.failures < BACKOFF_THRESHOLD:
+            return
+        delay = backoff_delay(
+            device.failures - BACKOFF_THRESHOLD, BACKOFF_MIN, BACKOFF_MAX
+        )
+        device.backoff_until = time.monotonic() + delay
+        _LOGGER.debug("unit %d not answering, backing off %.0fs", unit, delay)
+
+        # fail the rest of its queue now instead of timing out on each
+        for request in self._queues.pop(unit, ()):
+            if not request.future.done():
+                device.skipped += 1
+                request.future.set_exception(
+                    DeviceBackoff(f"unit {unit} is in backoff")
+                )
+
+    def close(self) -> None:
+        """Stop the worker and fail everything still queued."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in self._inflight:
+            task.cancel()
+        for queue in self._queues.values():
+            for request in queue:
+                if not request.future.done():
+                    request.future.cancel()
+        self._queues.clear()
@@ -1,46 +1,215 @@
 from __future__ import annotations
 
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 import logging
-from typing import Optional
+import time
+from typing import Any, Callable, Optional
 
-from homeassistant.components.sensor import SensorEntity
-from homeassistant.const import CONF_NAME
-from homeassistant.core import callback
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import (
+    CONF_NAME,
+    EntityCategory,
+    UnitOfInformation,
+    UnitOfTemperature,
+    UnitOfTime,
+)
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 import homeassistant.util.dt as dt_util
 
 from .const import (
     ATTR_MANUFACTURER,
     DOMAIN,
-    REGISTERS,
+    TELEMETRY_CONTEXT,
     NovusRegister,
+    NovusTemperature,
 )
 from .hub import NovusHub
 
 _LOGGER = logging.getLogger(__name__)
 
 
-async def async_setup_entry(hass, entry, async_add_entities):
+def register_entity_description(register: NovusRegister) -> SensorEntityDescription:
+    """Return the sensor description of a register."""
+    if isinstance(register, NovusTemperature):
+        return SensorEntityDescription(
+            key=register.key,
+            name=register.name,
+            entity_registry_enabled_default=register.enabled,
+            device_class=SensorDeviceClass.TEMPERATURE,
+            state_class=SensorStateClass.MEASUREMENT,
+            native_unit_of_measurement=UnitOfTemperature.CELSIUS,
+            icon="mdi:thermometer",
+        )
+    return SensorEntityDescription(
+        key=register.key,
+        name=register.name,
+        entity_registry_enabled_default=register.enabled,
+    )
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+@dataclass
+class NovusDiagnostic(SensorEntityDescription):
+    """Poll telemetry of a hub, value is computed from the hub"""
+
+    value: Callable[[Any], Any] = lambda hub: None
+    entity_category: Optional[EntityCategory] = EntityCategory.DIAGNOSTIC
+    entity_registry_enabled_default: bool = False
+
+
+@dataclass
+class NovusLatency(NovusDiagnostic):
+    """Latencies in milliseconds"""
+
+    device_class: Optional[str] = SensorDeviceClass.DURATION
+    state_class: Optional[str] = SensorStateClass.MEASUREMENT
+    native_unit_of_measurement: Optional[str] = UnitOfTime.MILLISECONDS
+
+
+@dataclass
+class NovusCounter(NovusDiagnostic):
+    """Ever increasing event counts"""
+
+    state_class: Optional[str] = SensorStateClass.TOTAL_INCREASING
+
+
+@dataclass
+class NovusTraffic(NovusCounter):
+    """Bytes on the wire"""
+
+    device_class: Optional[str] = SensorDeviceClass.DATA_SIZE
+    native_unit_of_measurement: Optional[str] = UnitOfInformation.BYTES
+
+
+DIAGNOSTICS: tuple[NovusDiagnostic, ...] = (
+    NovusLatency(
+        key="poll_latency",
+        name="Poll latency",
+        value=lambda hub: _ms(hub.telemetry.poll_latency.last),
+    ),
+    NovusLatency(
+        key="poll_latency_p99",
+        name="Poll latency (p99)",
+        value=lambda hub: _ms(hub.telemetry.poll_latency.percentile(0.99)),
+    ),
+    NovusLatency(
+        key="request_rtt",
+        name="Request round trip time",
+        value=lambda hub: _ms(hub.telemetry.request_rtt.mean),
+    ),
+    NovusLatency(
+        key="scheduling_lag",
+        name="Bus scheduling lag",
+        value=lambda hub: _ms(hub.transport.scheduler.device(hub.unit_id).lag),
+    ),
+    NovusCounter(
+        key="timeouts",
+        name="Timeouts",
+        value=lambda hub: hub.telemetry.timeouts,
+    ),
+    NovusCounter(
+        key="crc_errors",
+        name="CRC errors",
+        value=lambda hub: hub.telemetry.crc_errors,
+    ),
+    NovusCounter(
+        key="exception_responses",
+        name="Exception responses",
+        value=lambda hub: hub.telemetry.exception_responses,
+    ),
+    NovusCounter(
+        key="errors",
+        name="Errors",
+        value=lambda hub: hub.telemetry.errors,
+    ),
+    NovusCounter(
+        key="reconnects",
+        name="Bus reconnects",
+        value=lambda hub: max(hub.transport.connects - 1, 0),
+    ),
+    NovusTraffic(
+        key="bytes_sent",
+        name="Bytes sent",
+        value=lambda hub: hub.telemetry.bytes_sent,
+    ),
+    NovusTraffic(
+        key="bytes_received",
+        name="Bytes received",
+        value=lambda hub: hub.telemetry.bytes_received,
+    ),
+    NovusDiagnostic(
+        key="bus_queue_depth",
+        name="Bus queue depth",
+        state_class=SensorStateClass.MEASUREMENT,
+        value=lambda hub: hub.transport.queue_depth,
+    ),
+    NovusDiagnostic(
+        key="poll_phase",
+        name="Poll phase offset",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        value=lambda hub: None
+        if hub.phase_offset is None
+        else round(hub.phase_offset, 2),
+    ),
+    NovusDiagnostic(
+        key="peak_polls_per_second",
+        name="Peak polls per second (all controllers)",
+        state_class=SensorStateClass.MEASUREMENT,
+        value=lambda hub: max(hub.phases.load.curve(time.monotonic())),
+    ),
+)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+) -> bool:
     hub_name = entry.data[CONF_NAME]
     hub = hass.data[DOMAIN][hub_name]["hub"]
 
-    device_info = {
+    device_info: DeviceInfo = {
         "identifiers": {(DOMAIN, hub_name)},
         "name": hub_name,
         "manufacturer": ATTR_MANUFACTURER,
     }
 
     entities = []
-    for sensor_description in REGISTERS.values():
+    for register in hub.profile.registers.values():
+        if register.bit is not None:
+            continue
         sensor = NovusSensor(
             hub_name,
             hub,
             device_info,
-            sensor_description,
+            register_entity_description(register),
         )
         entities.append(sensor)
 
+    for register in hub.aggregates:
+        entities.append(
+            NovusSensor(
+                hub_name, hub, device_info, register_entity_description(register)
+            )
+        )
+
+    for description in DIAGNOSTICS:
+        entities.append(
+            NovusDiagnosticSensor(hub_name, hub, device_info, description)
+        )
+
     async_add_entities(entities)
     return True
 
@@ -52,18 +221,21 @@ class NovusSensor(CoordinatorEntity, SensorEntity):
         self,
         platform_name: str,
         hub: NovusHub,
-        device_info,
-        description: NovusRegister,
-    ):
+        device_info: DeviceInfo,
+        description: SensorEntityDescription,
+    ) -> None:
         # initialize sensor
         self._platform_name = platform_name
         self._attr_device_info = device_info
-        self.entity_description: NovusRegister = description
+        self.entity_description = description
+        # slot of the value in the hub's snapshots
+        self._index = hub.layout.index[description.key]
 
-        super().__init__(coordinator=hub)
+        # the hub only wakes entities whose key changed
+        super().__init__(coordinator=hub, context=description.key)
 
     @property
-    def name(self):
+    def name(self) -> str:
         """Returns the sensor name."""
         return f"{self._platform_name} {self.entity_description.name}"
 
@@ -73,10 +245,55 @@ class NovusSensor(CoordinatorEntity, SensorEntity):
         return f"{self._platform_name}_{self.entity_description.key}"
 
     @property
-    def native_value(self):
+    def extra_state_attributes(self) -> Optional[dict[str, Any]]:
+        """Flag values served from the last good read."""
+        key = self.entity_description.key
+        if key not in self.coordinator.stale:
+            return None
+        age = self.coordinator.value_age(key)
+        return {
+            "stale": True,
+            "last_read": dt_util.utcnow() - timedelta(seconds=age),
+        }
+
+    @property
+    def native_value(self) -> Any:
         """Return the sensor's state."""
-        return (
-            self.coordinator.data[self.entity_description.key]
-            if self.entity_description.key in self.coordinator.data
-            else None
-        )
+        return self.coordinator.data.slots[self._index]
+
+
+class NovusDiagnosticSensor(CoordinatorEntity, SensorEntity):
+    """Represents the hub's poll telemetry"""
+
+    def __init__(
+        self,
+        platform_name: str,
+        hub: NovusHub,
+        device_info: DeviceInfo,
+        description: NovusDiagnostic,
+    ) -> None:
+        self._platform_name = platform_name
+        self._attr_device_info = device_info
+        self.entity_description: NovusDiagnostic = description
+
+        super().__init__(coordinator=hub, context=TELEMETRY_CONTEXT)
+
+    @property
+    def name(self) -> str:
+        """Returns the sensor name."""
+        return f"{self._platform_name} {self.entity_description.name}"
+
+    @property
+    def unique_id(self) -> Optional[str]:
+        """Returns the sensor's unique ID"""
+        return f"{self._platform_name}_{self.entity_description.key}"
+
+    @property
+    def available(self) -> bool:
+        """Telemetry is available even while polls fail."""
+        return True
+
+    @property
+    def native_value(self) -> Any:
+        """Return the sensor's state."""
+        return self.entity_description.value(self.coordinator)
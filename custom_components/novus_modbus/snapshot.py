@@ -0,0 +1,84 @@
+"""Novus Modbus poll snapshots"""
+from __future__ import annotations
+
+from collections.abc import Mapping
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+
+class SnapshotLayout:
+    """Key to slot index table of a hub's snapshots, built once"""
+
+    __slots__ = ("keys", "index", "_getter")
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys: tuple[str, ...] = tuple(dict.fromkeys(keys))
+        self.index: dict[str, int] = {key: i for i, key in enumerate(self.keys)}
+        self._getter: Callable[[Mapping], tuple]
+        if len(self.keys) > 1:
+            self._getter = itemgetter(*self.keys)
+        else:
+            # itemgetter returns a bare value for a single key
+            self._getter = lambda values: tuple(values[key] for key in self.keys)
+
+    def values(self) -> dict:
+        """Return a dict of every key of the layout without a value."""
+        return dict.fromkeys(self.keys)
+
+    def snapshot(self, values: Mapping) -> Snapshot:
+        """Freeze the values of the layout's keys, other keys are dropped.
+
+        Fastest when values holds every key, e.g. starting from values().
+        """
+        try:
+            slots = self._getter(values)
+        except KeyError:
+            slots = tuple(map(values.get, self.keys))
+        return Snapshot(self, slots)
+
+
+class Snapshot(Mapping):
+    """Immutable values of one poll, a tuple slot per key of the layout.
+
+    Entities resolve their index in the layout once and read
+    slots[index]. For everything else it is a read only mapping of the
+    keys holding a value, a slot holding None has no value.
+    """
+
+    __slots__ = ("layout", "slots")
+
+    def __init__(self, layout: SnapshotLayout, slots: tuple):
+        self.layout = layout
+        self.slots = slots
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.slots[self.layout.index[key]]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        index = self.layout.index.get(key)
+        if index is None:
+            return default
+        value = self.slots[index]
+        return default if value is None else value
+
+    def __contains__(self, key: object) -> bool:
+        if not isinstance(key, str):
+            return False
+        index = self.layout.index.get(key)
+        return index is not None and self.slots[index] is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (
+            key
+            for key, value in zip(self.layout.keys, self.slots)
+            if value is not None
+        )
+
+    def __len__(self) -> int:
+        return len(self.slots) - self.slots.count(None)
+
+    def __repr__(self) -> str:
+        return f"Snapshot({dict(self)!r})"
@@ -0,0 +1,139 @@
+"""Novus Modbus poll telemetry"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass, field
+import math
+from typing import TYPE_CHECKING, Optional, Union
+
+from .tracing import STAGE_WAIT, STAGE_WIRE, PollTracer
+
+if TYPE_CHECKING:
+    from pymodbus.pdu import ModbusResponse
+
+# histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf
+)
+
+
+class Histogram:
+    """Fixed bucket latency histogram"""
+
+    __slots__ = ("buckets", "counts", "count", "total", "last")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.last: Optional[float] = None
+
+    def record(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.last = value
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Return the upper bound of the bucket holding the percentile."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "last": self.last,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "buckets": {
+                str(bound): count for bound, count in zip(self.buckets, self.counts)
+            },
+        }
+
+
+@dataclass
+class PollTelemetry:
+    """Request and poll statistics of one hub"""
+
+    request_rtt: Histogram = field(default_factory=Histogram)
+    poll_latency: Histogram = field(default_factory=Histogram)
+    requests: int = 0
+    timeouts: int = 0
+    crc_errors: int = 0
+    exception_responses: int = 0
+    errors: int = 0
+    polls: int = 0
+    failed_polls: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    # opt-in spans of the poll pipeline, see tracing
+    tracer: PollTracer = field(default_factory=PollTracer)
+
+    def record_request(
+        self,
+        rtt: float,
+        result: Union[ModbusResponse, Exception],
+        sent: int,
+        received: int,
+        wait: float = 0.0,
+    ) -> None:
+        """Record one transaction, result is the response or exception.
+
+        wait is how long the request was queued before it was sent.
+        """
+        # pymodbus is only imported once a transport exists
+        from pymodbus.exceptions import ModbusIOException
+
+        self.requests += 1
+        self.request_rtt.record(rtt)
+        if self.tracer.enabled:
+            self.tracer.span(STAGE_WAIT, wait)
+            self.tracer.span(STAGE_WIRE, rtt)
+        self.bytes_sent += sent
+        self.bytes_received += received
+
+        if isinstance(result, (ModbusIOException, TimeoutError)):
+            # pymodbus drops frames failing the CRC and reports them as
+            # missing answers, its message is all that tells them apart
+            if "crc" in str(result).lower():
+                self.crc_errors += 1
+            else:
+                self.timeouts += 1
+        elif isinstance(result, Exception):
+            self.errors += 1
+        elif result.isError():
+            self.exception_responses += 1
+
+    def record_poll(self, latency: float, success: bool) -> None:
+        self.polls += 1
+        self.poll_latency.record(latency)
+        if not success:
+            self.failed_polls += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "request_rtt": self.request_rtt.as_dict(),
+            "poll_latency": self.poll_latency.as_dict(),
+            "requests": self.requests,
+            "timeouts": self.timeouts,
+            "crc_errors": self.crc_errors,
+            "exception_responses": self.exception_responses,
+            "errors": self.errors,
+            "polls": self.polls,
+            "failed_polls": self.failed_polls,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
@@ -0,0 +1,166 @@
+"""Novus Modbus poll tracing
+
+Opt-in instrumentation of the poll pipeline, switched on at runtime by
+the set_tracing service. Each stage of a poll is timed as a span:
+
+wait: a request queued on the bus scheduler, which serialises the bus
+wire: the request and its answer, the transport's own lock included
+decode: the responses of a poll decoded into its snapshot
+notify: the coordinator's listeners woken after a poll
+
+Disabled, the hub and scheduler only test the enabled flag.
+"""
+from __future__ import annotations
+
+from collections import deque
+import cProfile
+import logging
+import os
+import time
+from typing import Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+STAGE_WAIT = "wait"
+STAGE_WIRE = "wire"
+STAGE_DECODE = "decode"
+STAGE_NOTIFY = "notify"
+STAGES = (STAGE_WAIT, STAGE_WIRE, STAGE_DECODE, STAGE_NOTIFY)
+
+# spans kept per stage for the rolling statistics
+TRACE_WINDOW = 1000
+# most polls a single cProfile capture may cover
+MAX_PROFILE_POLLS = 100
+
+
+class ProfilerBusy(Exception):
+    """Another hub's cProfile capture is running"""
+
+
+# the tracer whose capture is running. cProfile profiles the whole
+# thread, so captures of concurrently polling hubs would see each other's
+# work, only one runs at a time in the process.
+_capturing: Optional[PollTracer] = None
+
+
+class SpanStats:
+    """Rolling statistics of the last window spans of one stage"""
+
+    __slots__ = ("spans", "count", "total")
+
+    def __init__(self, window: int = TRACE_WINDOW):
+        self.spans: deque[float] = deque(maxlen=window)
+        # since tracing was enabled, not only the window
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.spans.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def as_dict(self) -> dict:
+        spans = sorted(self.spans)
+        if not spans:
+            return {"count": self.count}
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": sum(spans) / len(spans),
+            "p50": spans[len(spans) // 2],
+            "p99": spans[min(int(len(spans) * 0.99), len(spans) - 1)],
+            "max": spans[-1],
+        }
+
+
+class PollTracer:
+    """Per stage spans of one hub's polls, and an optional cProfile capture"""
+
+    __slots__ = ("enabled", "stages", "profile_path", "_profiler", "_polls_left")
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.stages: dict[str, SpanStats] = {}
+        # file the running capture is dumped to, None without a capture
+        self.profile_path: Optional[str] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._polls_left = 0
+
+    def enable(self) -> None:
+        """Start tracing with fresh statistics."""
+        self.stages = {stage: SpanStats() for stage in STAGES}
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stop tracing, a running capture is dropped."""
+        self.enabled = False
+        self._stop_profiler()
+
+    def _stop_profiler(self) -> None:
+        global _capturing
+        if self._profiler is not None:
+            self._profiler.disable()
+        self._profiler = None
+        self.profile_path = None
+        if _capturing is self:
+            _capturing = None
+
+    def span(self, stage: str, seconds: float) -> None:
+        """Record a span, callers check enabled first."""
+        self.stages[stage].record(seconds)
+
+    def capture(self, path: str, polls: int) -> None:
+        """Profile the next polls with cProfile and dump them to path.
+
+        cProfile sees everything the event loop runs while a poll waits
+        on the bus, not only the hub's own code. Raises ProfilerBusy while
+        another tracer's capture runs.
+        """
+        global _capturing
+        if _capturing is not None and _capturing is not self:
+            raise ProfilerBusy(f"a capture to {_capturing.profile_path} is running")
+        if not self.enabled:
+            self.enable()
+        self._stop_profiler()
+        _capturing = self
+        self._profiler = cProfile.Profile()
+        self._polls_left = max(1, min(polls, MAX_PROFILE_POLLS))
+        self.profile_path = path
+
+    def poll_started(self) -> None:
+        if self._profiler is None:
+            return
+        try:
+            self._profiler.enable()
+        except ValueError:
+            # a profiler outside the integration is running
+            _LOGGER.debug("profiler busy, poll not captured")
+
+    def poll_finished(self) -> Optional[tuple[cProfile.Profile, str]]:
+        """Stop profiling a poll, return the capture and path once complete."""
+        if self._profiler is None or self.profile_path is None:
+            return None
+        self._profiler.disable()
+        self._polls_left -= 1
+        if self._polls_left > 0:
+            return None
+        done = (self._profiler, self.profile_path)
+        self._stop_profiler()
+        return done
+
+    def as_dict(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "profiling": self.profile_path,
+            "stages": {stage: stats.as_dict() for stage, stats in self.stages.items()},
+        }
+
+
+def dump_profile(profiler: cProfile.Profile, path: str) -> None:
+    """Write a finished capture for pstats or snakeviz, does blocking I/O."""
+    started = time.monotonic()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profiler.dump_stats(path)
+    _LOGGER.info(
+        "profile written to %s in %.3fs", path, time.monotonic() - started
+    )
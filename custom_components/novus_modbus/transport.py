@@ -0,0 +1,675 @@
+"""Novus Modbus transports"""
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import Future
+from contextlib import contextmanager
+import logging
+import queue
+import socket
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterator, Optional, Union
+from urllib.parse import urlparse
+
+from pymodbus.client import (
+    AsyncModbusSerialClient,
+    AsyncModbusTcpClient,
+    ModbusSerialClient,
+    ModbusTcpClient,
+)
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+from pymodbus.pdu import ModbusExceptions, ModbusRequest
+from pymodbus.register_read_message import (
+    ReadHoldingRegistersRequest,
+    ReadHoldingRegistersResponse,
+)
+from pymodbus.register_write_message import (
+    WriteMultipleRegistersRequest,
+    WriteMultipleRegistersResponse,
+)
+
+from .const import DEFAULT_PORT, TRANSPORT_ASYNC, TRANSPORT_REPLAY, TRANSPORT_SYNC
+from .scheduler import BusScheduler, backoff_delay
+
+_LOGGER = logging.getLogger(__name__)
+
+# request timeouts follow the link's measured round trip time,
+# MAX_TIMEOUT is also the timeout until the first answer arrives
+MIN_TIMEOUT = 0.25
+MAX_TIMEOUT = 5.0
+# failed connection attempts are retried with jittered exponential backoff
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 120.0
+# seconds a transport nobody uses stays connected, so a reloaded entry
+# picks up the warm connection
+LINGER = 60.0
+# a pipelining gateway that times out or reports busy this many times in
+# a row while other requests were in flight is sent one request at a time
+PIPELINE_STRIKES = 3
+# TCP keepalive probes detect a dead gateway between polls
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+# blocking requests queued on a bus's worker thread before submitters wait
+WORKER_QUEUE = 8
+
+
+def _client_kwargs(hostname: str) -> tuple[bool, dict]:
+    """Split a configured hostname into serial or TCP client arguments.
+
+    If it's not a URL it might be a serial port.
+    This logic is tested to work with linux and windows serial port names.
+    """
+    parsed = urlparse(f"//{hostname}")
+    if (parsed.port is None) and (
+        (parsed.hostname is None) or (parsed.hostname[0:3] == "com")
+    ):
+        return True, {
+            "method": "rtu",
+            "port": parsed.path + parsed.netloc,
+            "baudrate": 9600,
+            "stopbits": 1,
+            "bytesize": 8,
+            "timeout": MAX_TIMEOUT,
+            # failed reads are retried by the hub, one block at a time
+            "retries": 0,
+        }
+
+    port = DEFAULT_PORT if parsed.port is None else parsed.port
+    return False, {
+        "host": parsed.hostname,
+        "port": port,
+        "timeout": MAX_TIMEOUT,
+        "retries": 0,
+    }
+
+
+def is_serial_bus(hostname: str) -> bool:
+    """Return whether hostname names a serial port rather than a TCP host."""
+    return _client_kwargs(hostname)[0]
+
+
+def bus_key(hostname: str) -> str:
+    """Return the registry key of the bus hostname refers to."""
+    serial, kwargs = _client_kwargs(hostname)
+    if serial:
+        return kwargs["port"]
+    return f"{kwargs['host']}:{kwargs['port']}"
+
+
+def _keepalive(sock: Optional[socket.socket]) -> None:
+    """Enable TCP keepalive on a connected socket."""
+    if sock is None:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (
+        ("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+        ("TCP_KEEPCNT", KEEPALIVE_COUNT),
+    ):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def supports_pipelining(client: Any) -> bool:
+    """Return whether client exposes the pymodbus internals pipelining uses.
+
+    These are not public API and have moved between pymodbus releases,
+    without them a connection sends one request at a time.
+    """
+    transaction = getattr(client, "transaction", None)
+    framer = getattr(client, "framer", None)
+    return (
+        callable(getattr(client, "build_response", None))
+        and callable(getattr(client, "send", None))
+        and callable(getattr(transaction, "getNextTID", None))
+        and callable(getattr(transaction, "getTransaction", None))
+        and callable(getattr(framer, "buildPacket", None))
+    )
+
+
+class RttEstimator:
+    """Smoothed round trip time and derived timeout of a link (RFC 6298)"""
+
+    __slots__ = ("srtt", "rttvar", "timeout")
+
+    def __init__(self) -> None:
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.timeout = MAX_TIMEOUT
+
+    def sample(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.timeout = min(max(self.srtt + 4 * self.rttvar, MIN_TIMEOUT), MAX_TIMEOUT)
+
+    def timed_out(self) -> None:
+        """Back the timeout off until the next answer."""
+        self.timeout = min(self.timeout * 2, MAX_TIMEOUT)
+
+
+class NovusTransport(ABC):
+    """Serialized access to a modbus client"""
+
+    mode: str
+    key: str = ""
+    users: int = 0
+    scheduler: BusScheduler
+    serial: bool = False
+    # connections opened so far, anything past the first is a reconnect
+    connects: int = 0
+    # transactions the scheduler may have in flight at once
+    window: int = 1
+
+    def __init__(self) -> None:
+        self.rtt = RttEstimator()
+        self._connect_failures = 0
+        self._reconnect_at = 0.0
+        self._linger: Optional[asyncio.TimerHandle] = None
+
+    def _check_reconnect(self) -> None:
+        """Fail fast while a reconnect is backing off."""
+        wait = self._reconnect_at - time.monotonic()
+        if wait > 0:
+            raise ConnectionException(f"{self.key}: reconnecting in {wait:.1f}s")
+        self.connects += 1
+
+    def _connected(self, connected: bool) -> None:
+        """Record the outcome of a connection attempt."""
+        if connected:
+            self._connect_failures = 0
+            return
+        delay = backoff_delay(self._connect_failures, RECONNECT_MIN, RECONNECT_MAX)
+        self._connect_failures += 1
+        self._reconnect_at = time.monotonic() + delay
+        _LOGGER.debug("%s: connect failed, retrying in %.1fs", self.key, delay)
+        raise ConnectionException(f"{self.key}: connect failed")
+
+    def frame_sizes(self, count: int) -> tuple[int, int]:
+        """Return the request and response bytes on the wire of a read."""
+        if self.serial:
+            # unit, function, address, count, crc / unit, function, length, crc
+            return 8, 5 + 2 * count
+        # 7 byte MBAP header plus the PDU
+        return 12, 9 + 2 * count
+
+    def write_frame_sizes(self, count: int) -> tuple[int, int]:
+        """Return the request and response bytes on the wire of a write."""
+        if self.serial:
+            # unit, function, address, count, length, data, crc / echo, crc
+            return 9 + 2 * count, 8
+        return 13 + 2 * count, 12
+
+    @abstractmethod
+    async def async_read(
+        self, unit: int, address: int, count: int, timeout: Optional[float] = None
+    ) -> ReadHoldingRegistersResponse:
+        """Read modbus holding registers.
+
+        timeout caps the wait for this one answer, e.g. for discovery
+        probes, without feeding the round trip time estimate.
+        """
+
+    @abstractmethod
+    async def async_write(
+        self, unit: int, address: int, values: list[int]
+    ) -> WriteMultipleRegistersResponse:
+        """Write consecutive modbus holding registers"""
+
+    @property
+    def queue_depth(self) -> int:
+        """Return the requests waiting for the bus."""
+        return self.scheduler.depth
+
+    async def async_connect(self) -> None:
+        """Open the connection ahead of the first request."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Disconnect client."""
+
+
+class BusWorker:
+    """Runs the blocking requests of one bus on a thread of its own.
+
+    A wedged serial port only ever holds this thread, never Home
+    Assistant's shared executor. At most max_queue requests are queued
+    or running, further submitters wait for a slot.
+    """
+
+    def __init__(self, name: str, max_queue: int = WORKER_QUEUE):
+        self.name = name
+        self.max_queue = max_queue
+        self.depth = 0
+        self.peak_depth = 0
+        self.jobs = 0
+        # submitters that found the queue full
+        self.waits = 0
+        # seconds the thread spent running requests
+        self.busy = 0.0
+        self._jobs: queue.SimpleQueue = queue.SimpleQueue()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    async def async_run(self, target: Callable[..., Any], *args: Any) -> Any:
+        """Run target(*args) on the worker thread and return its result."""
+        if self._closed:
+            raise ConnectionException(f"{self.name}: worker closed")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+        slots = self._slots
+        if slots.locked():
+            self.waits += 1
+        await slots.acquire()
+
+        loop = asyncio.get_running_loop()
+        future: Future = Future()
+        # the slot frees once the job ran or was cancelled before running
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._release, slots)
+        )
+        self.depth += 1
+        self.peak_depth = max(self.peak_depth, self.depth)
+        self.jobs += 1
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name=self.name, daemon=True
+            )
+            self._thread.start()
+        self._jobs.put((future, target, args))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, slots: asyncio.Semaphore) -> None:
+        self.depth -= 1
+        slots.release()
+
+    def _run(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            future, target, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            try:
+                result = target(*args)
+            except BaseException as exception:  # pylint: disable=broad-except
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+            self.busy += time.monotonic() - started
+
+    def close(self, target: Optional[Callable] = None) -> None:
+        """Stop the thread once queued requests are done, running target last.
+
+        Returns without waiting, the thread may be stuck in a request.
+        """
+        self._closed = True
+        if self._thread is None:
+            if target is not None:
+                target()
+            return
+        if target is not None:
+            self._jobs.put((Future(), target, ()))
+        self._jobs.put(None)
+
+    def as_dict(self) -> dict:
+        return {
+            "depth": self.depth,
+            "peak_depth": self.peak_depth,
+            "max_queue": self.max_queue,
+            "jobs": self.jobs,
+            "waits": self.waits,
+            "busy": round(self.busy, 3),
+        }
+
+
+class SyncTransport(NovusTransport):
+    """Blocking pymodbus client driven from the bus's worker thread"""
+
+    mode = TRANSPORT_SYNC
+
+    def __init__(self, hostname: str):
+        super().__init__()
+        self.serial, kwargs = _client_kwargs(hostname)
+        self._client: Union[ModbusSerialClient, ModbusTcpClient]
+        if self.serial:
+            self._client = ModbusSerialClient(**kwargs)
+        else:
+            self._client = ModbusTcpClient(**kwargs)
+        # the only thread touching the client
+        self.worker = BusWorker(f"novus_modbus {hostname}")
+
+    @property
+    def queue_depth(self) -> int:
+        return self.scheduler.depth + self.worker.depth
+
+    async def async_read(
+        self, unit: int, address: int, count: int, timeout: Optional[float] = None
+    ) -> ReadHoldingRegistersResponse:
+        """Read modbus holding registers"""
+        return await self.worker.async_run(
+            self._request,
+            self._client.read_holding_registers,
+            unit,
+            address,
+            count,
+            timeout,
+        )
+
+    async def async_write(
+        self, unit: int, address: int, values: list[int]
+    ) -> WriteMultipleRegistersResponse:
+        """Write consecutive modbus holding registers"""
+        return await self.worker.async_run(
+            self._request, self._client.write_registers, unit, address, values
+        )
+
+    async def async_connect(self) -> None:
+        await self.worker.async_run(self._connect)
+
+    def _connect(self) -> None:
+        if not self._client.connected:
+            self._check_reconnect()
+            self._connected(self._client.connect())
+            if not self.serial:
+                _keepalive(self._client.socket)
+
+    def _request(
+        self,
+        method: Callable[..., Any],
+        unit: int,
+        address: int,
+        arg: Any,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        self._connect()
+        kwargs = {"slave": unit}
+
+        started = time.monotonic()
+        if timeout is None:
+            resp = method(address, arg, **kwargs)
+        else:
+            with self._timeout(timeout):
+                resp = method(address, arg, **kwargs)
+        if not isinstance(resp, ModbusIOException):
+            self.rtt.sample(time.monotonic() - started)
+        return resp
+
+    @contextmanager
+    def _timeout(self, timeout: float) -> Iterator[None]:
+        """Shorten the answer timeout of the requests run inside.
+
+        The blocking clients read their timeout on every receive, the
+        serial port's own read timeout is set when it opens.
+        """
+        params = self._client.comm_params
+        default = params.timeout_connect
+        params.timeout_connect = timeout
+        # a pyserial port, not the socket pymodbus declares
+        port: Any = self._client.socket if self.serial else None
+        if port is not None:
+            port.timeout = timeout
+        try:
+            yield
+        finally:
+            params.timeout_connect = default
+            if port is not None:
+                port.timeout = default
+
+    def close(self) -> None:
+        """Disconnect client once the worker is idle."""
+        self.worker.close(self._client.close)
+
+
+class AsyncTransport(NovusTransport):
+    """Native asyncio pymodbus client, requests serialized on the event loop.
+
+    With a window above 1 a TCP connection carries that many transactions
+    at once, answers are matched to requests by MBAP transaction id.
+    """
+
+    mode = TRANSPORT_ASYNC
+
+    def __init__(self, hostname: str, window: int = 1):
+        super().__init__()
+        self.serial, kwargs = _client_kwargs(hostname)
+        # reconnecting is up to us, not the client's background task
+        kwargs["reconnect_delay"] = 0
+        self._client: Union[AsyncModbusSerialClient, AsyncModbusTcpClient]
+        if self.serial:
+            self._client = AsyncModbusSerialClient(**kwargs)
+        else:
+            self._client = AsyncModbusTcpClient(**kwargs)
+        self._lock = asyncio.Lock()
+        # RTU has no transaction ids to match answers by
+        self.window = 1 if self.serial else max(window, 1)
+        if self.window > 1 and not supports_pipelining(self._client):
+            _LOGGER.warning(
+                "%s: this pymodbus version cannot pipeline, "
+                "sending one request at a time",
+                hostname,
+            )
+            self.window = 1
+        self._inflight = 0
+        self._strikes = 0
+
+    async def async_read(
+        self, unit: int, address: int, count: int, timeout: Optional[float] = None
+    ) -> ReadHoldingRegistersResponse:
+        """Read modbus holding registers"""
+        if self.window > 1:
+            return await self._pipelined(
+                ReadHoldingRegistersRequest(address, count, slave=unit), timeout
+            )
+        return await self._request(
+            self._client.read_holding_registers, unit, address, count, timeout
+        )
+
+    async def async_write(
+        self, unit: int, address: int, values: list[int]
+    ) -> WriteMultipleRegistersResponse:
+        """Write consecutive modbus holding registers"""
+        if self.window > 1:
+            return await self._pipelined(
+                WriteMultipleRegistersRequest(address, values, slave=unit), None
+            )
+        return await self._request(self._client.write_registers, unit, address, values)
+
+    async def async_connect(self) -> None:
+        async with self._lock:
+            await self._connect()
+
+    async def _connect(self) -> None:
+        if not self._client.connected:
+            self._check_reconnect()
+            self._connected(await self._client.connect())
+            if not self.serial and self._client.transport is not None:
+                _keepalive(self._client.transport.get_extra_info("socket"))
+
+    async def _pipelined(self, request: ModbusRequest, timeout: Optional[float]) -> Any:
+        """Send request without waiting for the transactions in flight."""
+        client = self._client
+        async with self._lock:
+            await self._connect()
+
+        tid = request.transaction_id = client.transaction.getNextTID()
+        answer = client.build_response(tid)
+        others = self._inflight
+        self._inflight += 1
+        started = time.monotonic()
+        try:
+            client.send(client.framer.buildPacket(request))
+            resp = await asyncio.wait_for(
+                answer, self.rtt.timeout if timeout is None else timeout
+            )
+        except asyncio.TimeoutError:
+            # forget the transaction, a late answer is dropped as unrequested
+            client.transaction.getTransaction(tid)
+            if timeout is None:
+                self.rtt.timed_out()
+                self._misbehaved(others, "timed out")
+            raise
+        finally:
+            self._inflight -= 1
+
+        busy = ModbusExceptions.SlaveBusy
+        if resp.isError() and getattr(resp, "exception_code", None) == busy:
+            self._misbehaved(others, "reported busy")
+        else:
+            self._strikes = 0
+            if timeout is None:
+                self.rtt.sample(time.monotonic() - started)
+        return resp
+
+    def _misbehaved(self, others: int, what: str) -> None:
+        """Fall back to one request at a time if pipelining upsets the gateway."""
+        if not others:
+            # nothing else was in flight, not pipelining's fault
+            return
+        self._strikes += 1
+        if self._strikes >= PIPELINE_STRIKES and self.window > 1:
+            _LOGGER.warning(
+                "%s %s %d times with requests in flight, "
+                "sending one request at a time",
+                self.key,
+                what,
+                self._strikes,
+            )
+            self.window = 1
+
+    async def _request(
+        self,
+        method: Callable[..., Awaitable[Any]],
+        unit: int,
+        address: int,
+        arg: Any,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        async with self._lock:
+            await self._connect()
+
+            if timeout is not None:
+                return await asyncio.wait_for(
+                    method(address, arg, slave=unit), min(timeout, self.rtt.timeout)
+                )
+
+            started = time.monotonic()
+            try:
+                resp = await asyncio.wait_for(
+                    method(address, arg, slave=unit), self.rtt.timeout
+                )
+            except asyncio.TimeoutError:
+                self.rtt.timed_out()
+                raise
+            if not isinstance(resp, ModbusIOException):
+                self.rtt.sample(time.monotonic() - started)
+            return resp
+
+    def close(self) -> None:
+        """Disconnect client."""
+        self._client.close()
+
+
+def create_transport(
+    hostname: str, mode: str = TRANSPORT_ASYNC, window: int = 1
+) -> NovusTransport:
+    """Create the transport selected by mode for hostname."""
+    if mode == TRANSPORT_SYNC:
+        return SyncTransport(hostname)
+    if mode == TRANSPORT_ASYNC:
+        return AsyncTransport(hostname, window)
+    if mode == TRANSPORT_REPLAY:
+        # capture builds on this module
+        from .capture import ReplayTransport
+
+        return ReplayTransport(hostname)
+    raise ValueError(f"unknown transport: {mode}")
+
+
+# process-wide registry of open transports, keyed by bus (host:port or
+# serial device) so controllers sharing a gateway or RS-485 line share
+# one connection.
+_TRANSPORTS: dict[str, NovusTransport] = {}
+
+
+def acquire_transport(
+    hostname: str, mode: str = TRANSPORT_ASYNC, window: int = 1
+) -> NovusTransport:
+    """Return the shared transport for hostname's bus, creating it if needed.
+
+    The first user decides mode and pipelining window of a shared bus.
+    """
+    key = bus_key(hostname)
+    transport = _TRANSPORTS.get(key)
+    if transport is not None and transport._linger is not None:
+        transport._linger.cancel()
+        transport._linger = None
+    if transport is None:
+        transport = create_transport(hostname, mode, window)
+        transport.key = key
+        transport.scheduler = BusScheduler(transport)
+        _TRANSPORTS[key] = transport
+    elif transport.mode != mode:
+        _LOGGER.warning(
+            "%s is already open as a %s transport, sharing it instead of %s",
+            key,
+            transport.mode,
+            mode,
+        )
+
+    transport.users += 1
+    return transport
+
+
+def release_transport(transport: NovusTransport, linger: float = LINGER) -> None:
+    """Drop a reference to a shared transport.
+
+    The connection outlives its last user by linger seconds, so a reload
+    finds it still open.
+    """
+    transport.users -= 1
+    # nothing to do for one force closed at shutdown
+    if transport.users > 0 or _TRANSPORTS.get(transport.key) is not transport:
+        return
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if linger > 0 and loop is not None:
+        transport._linger = loop.call_later(linger, _close_transport, transport)
+    else:
+        _close_transport(transport)
+
+
+def _close_transport(transport: NovusTransport) -> None:
+    transport._linger = None
+    if transport.users > 0:
+        return
+    if _TRANSPORTS.get(transport.key) is transport:
+        del _TRANSPORTS[transport.key]
+    transport.scheduler.close()
+    transport.close()
+
+
+def close_transports(in_use: bool = False) -> None:
+    """Close every transport nobody is using any more.
+
+    in_use also closes those still held by a hub, on shutdown.
+    """
+    for transport in list(_TRANSPORTS.values()):
+        if in_use:
+            transport.users = 0
+        if transport.users <= 0:
+            if transport._linger is not None:
+                transport._linger.cancel()
+            _close_transport(transport)
@@ -0,0 +1,176 @@
+"""Novus Modbus setpoint writes"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Optional
+
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import NovusRegister
+
+if TYPE_CHECKING:
+    from .hub import NovusHub
+
+_LOGGER = logging.getLogger(__name__)
+
+# seconds edits are collected before they are written, further edits of
+# the same register within the window only send the last value
+WRITE_DELAY = 0.5
+
+
+def encode(register: NovusRegister, value: float) -> int:
+    """Return the raw register word of value."""
+    raw = round(value * register.scale)
+    if register.data_type == "uint16":
+        low, high = 0, 0xFFFF
+    else:
+        low, high = -0x8000, 0x7FFF
+    if not low <= raw <= high:
+        raise ValueError(f"{value} out of range for {register.key}")
+    return raw & 0xFFFF
+
+
+def write_runs(
+    pending: dict[int, int], max_count: int
+) -> list[tuple[int, list[int]]]:
+    """Group pending {address: word} writes into consecutive runs."""
+    runs: list[tuple[int, list[int]]] = []
+    for address in sorted(pending):
+        if runs:
+            start, words = runs[-1]
+            if start + len(words) == address and len(words) < max_count:
+                words.append(pending[address])
+                continue
+        runs.append((address, [pending[address]]))
+    return runs
+
+
+class WriteQueue:
+    """Coalescing setpoint writer of one hub.
+
+    Edits are collected for WRITE_DELAY seconds, the last value of each
+    register wins and adjacent registers go out in one write multiple
+    registers request. Writes are not read back on their own, the next
+    scheduled poll of the register's tier verifies them.
+    """
+
+    def __init__(self, hub: NovusHub, max_count: int, delay: float = WRITE_DELAY):
+        self._hub = hub
+        self._max_count = max_count
+        self.delay = delay
+        self._by_key = {
+            register.key: register
+            for register in hub.profile.registers.values()
+            if register.writable
+        }
+        self._by_address = {
+            register.address: register for register in self._by_key.values()
+        }
+        self._pending: dict[int, int] = {}
+        self._values: dict[int, float] = {}
+        self._flushed: Optional[asyncio.Future] = None
+        # address: value written, waiting for the next read
+        self._verify: dict[int, float] = {}
+        self.writes = 0
+        self.requests = 0
+        self.mismatches = 0
+
+    @property
+    def keys(self) -> frozenset[str]:
+        return frozenset(self._by_key)
+
+    async def async_write(self, key: str, value: float) -> None:
+        """Queue a setpoint write and wait until it is on the wire."""
+        register = self._by_key.get(key)
+        if register is None or register.address is None:
+            raise HomeAssistantError(f"{key} is not a writable register")
+        try:
+            raw = encode(register, value)
+        except ValueError as exception:
+            raise HomeAssistantError(str(exception)) from exception
+
+        self.writes += 1
+        self._pending[register.address] = raw
+        # the value as it will read back, rounded to the register's scale
+        written = round(value * register.scale) / register.scale
+        self._values[register.address] = written
+        self._hub.async_set_value(key, written)
+
+        if self._flushed is None:
+            self._flushed = asyncio.get_running_loop().create_future()
+            self._hub.hass.async_create_background_task(
+                self._async_flush_later(), f"{self._hub.name} setpoint writes"
+            )
+        # every edit waiting on this flush sees its outcome
+        await asyncio.shield(self._flushed)
+
+    async def _async_flush_later(self) -> None:
+        await asyncio.sleep(self.delay)
+        flushed, self._flushed = self._flushed, None
+        if flushed is None:
+            return
+        try:
+            await self.async_flush()
+        except Exception as exception:
+            flushed.set_exception(exception)
+        else:
+            flushed.set_result(None)
+
+    async def async_flush(self) -> None:
+        """Write every pending edit."""
+        pending, self._pending = self._pending, {}
+        values, self._values = self._values, {}
+        if not pending:
+            return
+
+        hub = self._hub
+        scheduler = hub.transport.scheduler
+        failed = []
+        for address, words in write_runs(pending, self._max_count):
+            self.requests += 1
+            error: Optional[object] = None
+            try:
+                resp = await scheduler.async_write(
+                    hub.unit_id, address, words, telemetry=hub.telemetry
+                )
+            except Exception as exception:
+                error = exception
+            else:
+                if resp.isError():
+                    error = resp
+            if error is not None:
+                _LOGGER.error(
+                    "%s: writing r%d-r%d failed: %s",
+                    hub.name,
+                    address,
+                    address + len(words) - 1,
+                    error,
+                )
+                failed.append(f"r{address}")
+                continue
+            for offset in range(len(words)):
+                self._verify[address + offset] = values[address + offset]
+
+        # read the written tiers back with the next poll, which also puts
+        # the real value of a failed write back on the entity
+        hub.read_soon({self._by_address[address].tier for address in pending})
+        if failed:
+            raise HomeAssistantError(f"writing {', '.join(failed)} failed")
+
+    def verify(self, data: dict) -> None:
+        """Compare freshly read values against the writes they follow."""
+        for address, value in list(self._verify.items()):
+            key = self._by_address[address].key
+            if key not in data:
+                continue
+            del self._verify[address]
+            if data[key] != value:
+                self.mismatches += 1
+                _LOGGER.warning(
+                    "%s: %s reads back %s after writing %s",
+                    self._hub.name,
+                    key,
+                    data[key],
+                    value,
+                )
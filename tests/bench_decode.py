@@ -0,0 +1,98 @@
+"""Decode microbenchmark
+
+Compares the precompiled struct decoders against the previous
+per-register BinaryPayloadDecoder implementation on a full r0-r20 frame.
+
+    python -m tests.bench_decode
+"""
+import timeit
+
+from pymodbus.constants import Endian
+from pymodbus.payload import BinaryPayloadDecoder
+
+from custom_components.novus_modbus.const import REGISTERS, UNREADABLE_REGISTERS
+from custom_components.novus_modbus.decoder import compile_decoders
+from custom_components.novus_modbus.planner import plan_reads
+
+from .test_decoder import FRAME
+
+# pymodbus renamed the Endian members in 3.5
+BIG = getattr(Endian, "BIG", None) or Endian.Big
+LITTLE = getattr(Endian, "LITTLE", None) or Endian.Little
+
+IHM_BITS = (
+    "ihm_p1_out1", "ihm_p1_out2", "ihm_pv", "ihm_rx", "ihm_internal_4",
+    "ihm_status_t1", "ihm_status_defrost", "ihm_status_t2", "ihm_internal_8",
+    "ihm_internal_9", "ihm_value_has_decimal", "ihm_internal_11",
+    "ihm_internal_12", "ihm_internal_13", "ihm_internal_14", "ihm_internal_15",
+)
+
+
+def _legacy_decoder(registers):
+    return BinaryPayloadDecoder.fromRegisters(
+        registers, byteorder=BIG, wordorder=LITTLE
+    )
+
+
+def legacy_decode(frame):
+    """The hand written decoding read_modbus_realtime_data used to do."""
+    data = {}
+    decoder = _legacy_decoder(frame[0:4])
+    data["t1_temp_c"] = decoder.decode_16bit_int() / 10
+    data["t2_temp_c"] = decoder.decode_16bit_int() / 10
+    data["temp_diff_c"] = decoder.decode_16bit_int() / 10
+    data["don"] = decoder.decode_16bit_int() / 10
+    decoder = _legacy_decoder(frame[4:8])
+    data["doff"] = decoder.decode_16bit_int() / 10
+    data["ind"] = decoder.decode_16bit_int()
+    data["serial_high"] = decoder.decode_16bit_int()
+    data["serial_low"] = decoder.decode_16bit_int()
+    decoder = _legacy_decoder(frame[8:12])
+    data["ice"] = decoder.decode_16bit_int() / 10
+    data["ht1"] = decoder.decode_16bit_int() / 10
+    data["ht2"] = decoder.decode_16bit_int() / 10
+    data["hys"] = decoder.decode_16bit_int() / 10
+    decoder = _legacy_decoder(frame[12:16])
+    data["hy1"] = decoder.decode_16bit_int()
+    data["hy2"] = decoder.decode_16bit_int()
+    ihm = decoder.decode_16bit_int()
+    for bit, key in enumerate(IHM_BITS):
+        data[key] = bool(ihm & (1 << bit))
+    data["control_status"] = decoder.decode_16bit_int()
+    decoder = _legacy_decoder(frame[16:20])
+    data["screen_display_value"] = decoder.decode_16bit_int()
+    data["version_and_screen_n"] = decoder.decode_16bit_int()
+    data["of1"] = decoder.decode_16bit_int()
+    data["of2"] = decoder.decode_16bit_int()
+    decoder = _legacy_decoder(frame[20:21])
+    r20 = decoder.decode_16bit_int()
+    data["ice_status"] = bool(r20 & 0x01)
+    data["ht1_status"] = bool(r20 & 0x02)
+    data["ht2_status"] = bool(r20 & 0x04)
+    return data
+
+
+def main(number: int = 20000) -> None:
+    decoders = compile_decoders(
+        plan_reads(REGISTERS.values(), 4, UNREADABLE_REGISTERS)
+    )
+    blocks = [
+        FRAME[d.block.address:d.block.address + d.block.count] for d in decoders
+    ]
+
+    def compiled_decode():
+        data = {}
+        for decoder, registers in zip(decoders, blocks):
+            decoder.decode_into(registers, data)
+        return data
+
+    assert compiled_decode() == legacy_decode(FRAME)
+
+    for name, func in (("legacy", lambda: legacy_decode(FRAME)),
+                       ("compiled", compiled_decode)):
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:>9}: {best / number * 1e6:8.2f} us/frame")
+
+
+if __name__ == "__main__":
+    main()
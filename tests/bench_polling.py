@@ -0,0 +1,102 @@
+"""Polling load benchmark
+
+Drives NovusHub against 1..N simulated controllers sharing one gateway
+and reports polls/sec, p50/p99 poll latency, executor jobs and threads
+and memory per hub. Not collected by the normal test run:
+
+    pytest tests/bench_polling.py -s --no-cov
+
+NOVUS_BENCH_DEVICES (default "1,8,32"), NOVUS_BENCH_POLLS (default 20)
+and NOVUS_BENCH_LATENCY (seconds per transaction, default 0) tune it.
+"""
+import asyncio
+from datetime import timedelta
+import os
+import statistics
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from custom_components.novus_modbus.const import TRANSPORT_ASYNC, TRANSPORT_SYNC
+from custom_components.novus_modbus.hub import NovusHub
+
+from .simulator import SimulatedController, SimulatedGateway
+
+DEVICES = [int(n) for n in os.environ.get("NOVUS_BENCH_DEVICES", "1,8,32").split(",")]
+POLLS = int(os.environ.get("NOVUS_BENCH_POLLS", "20"))
+LATENCY = float(os.environ.get("NOVUS_BENCH_LATENCY", "0"))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+@pytest.mark.parametrize("transport", [TRANSPORT_ASYNC, TRANSPORT_SYNC])
+@pytest.mark.parametrize("devices", DEVICES)
+async def test_bench_polling(hass, socket_enabled, devices, transport):
+    gateway = SimulatedGateway(
+        {
+            unit: SimulatedController(latency=LATENCY)
+            for unit in range(1, devices + 1)
+        }
+    )
+    port = await gateway.start()
+
+    executor_jobs = 0
+    async_add_executor_job = hass.async_add_executor_job
+
+    def counting_executor_job(target, *args):
+        nonlocal executor_jobs
+        executor_jobs += 1
+        return async_add_executor_job(target, *args)
+
+    hass.async_add_executor_job = counting_executor_job
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    hubs = [
+        NovusHub(
+            hass,
+            f"bench_{unit}",
+            f"127.0.0.1:{port}",
+            timedelta(seconds=10),
+            transport=transport,
+            unit_id=unit,
+        )
+        for unit in range(1, devices + 1)
+    ]
+    await asyncio.gather(*(hub._async_update_data() for hub in hubs))
+    memory = (tracemalloc.get_traced_memory()[0] - before) / devices
+    tracemalloc.stop()
+
+    latencies = []
+    threads = threading.active_count()
+
+    async def poll(hub):
+        started = time.perf_counter()
+        await hub._async_update_data()
+        latencies.append(time.perf_counter() - started)
+
+    executor_jobs = 0
+    started = time.perf_counter()
+    for _ in range(POLLS):
+        await asyncio.gather(*(poll(hub) for hub in hubs))
+        threads = max(threads, threading.active_count())
+    elapsed = time.perf_counter() - started
+
+    for hub in hubs:
+        hub.close()
+    await gateway.stop()
+
+    print(
+        f"\n{transport:>5} x{devices:<3} "
+        f"{len(latencies) / elapsed:8.1f} polls/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+        f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms  "
+        f"executor jobs {executor_jobs:5d}  threads {threads:3d}  "
+        f"{memory / 1024:6.1f} KiB/hub"
+    )
+    assert len(latencies) == POLLS * devices
@@ -0,0 +1,89 @@
+"""Decode and notify benchmark over a recorded capture
+
+Replays a capture file (see capture_path) through NovusHub as fast as
+possible, with a listener per register, and reports polls/sec and the
+listeners woken per poll. Not collected by the normal test run:
+
+    NOVUS_BENCH_CAPTURE=/config/novus.bin pytest tests/bench_replay.py -s --no-cov
+
+Without NOVUS_BENCH_CAPTURE a capture of NOVUS_BENCH_POLLS (default 1000)
+polls of a slowly warming controller is generated first.
+"""
+from datetime import timedelta
+import os
+import time
+
+from custom_components.novus_modbus.capture import FrameRecorder, read_frames
+from custom_components.novus_modbus.const import (
+    DEFAULT_MAX_REGISTERS,
+    REGISTERS,
+    TRANSPORT_REPLAY,
+    UNREADABLE_REGISTERS,
+)
+from custom_components.novus_modbus.hub import NovusHub
+from custom_components.novus_modbus.planner import plan_reads
+
+from .test_decoder import FRAME
+
+CAPTURE = os.environ.get("NOVUS_BENCH_CAPTURE")
+POLLS = int(os.environ.get("NOVUS_BENCH_POLLS", "1000"))
+
+
+def _generate(path: str) -> None:
+    recorder = FrameRecorder(path, 1 << 30, max_pending=1 << 20)
+    plan = plan_reads(REGISTERS.values(), DEFAULT_MAX_REGISTERS, UNREADABLE_REGISTERS)
+    registers = list(FRAME)
+    for poll in range(POLLS):
+        registers[0] = (registers[0] + (poll % 3 == 0)) & 0xFFFF
+        registers[14] ^= 1 if poll % 50 == 0 else 0
+        for block in plan:
+            recorder.record(1, block.address, registers[block.address:][: block.count])
+    recorder.close()
+    recorder.join()
+
+
+async def test_bench_replay(hass, tmp_path):
+    path = CAPTURE
+    if path is None:
+        path = str(tmp_path / "capture.bin")
+        _generate(path)
+    units = {frame.unit for frame in read_frames(path)}
+
+    for unit in sorted(units):
+        hub = NovusHub(
+            hass,
+            f"replay_{unit}",
+            path,
+            timedelta(seconds=10),
+            transport=TRANSPORT_REPLAY,
+            unit_id=unit,
+            replay_speed=0,
+        )
+        woken = 0
+
+        def wake():
+            nonlocal woken
+            woken += 1
+
+        for register in REGISTERS.values():
+            hub.async_add_listener(wake, register.key)
+
+        polls = 0
+        started = time.perf_counter()
+        while True:
+            try:
+                hub.data = await hub._async_update_data()
+            except Exception:  # capture exhausted
+                break
+            hub.async_update_listeners()
+            polls += 1
+        elapsed = time.perf_counter() - started
+
+        print(
+            f"\nunit {unit}: {polls} polls in {elapsed:.3f}s "
+            f"{polls / elapsed:9.1f} polls/s  "
+            f"{woken / max(polls, 1):5.2f} listeners woken/poll"
+        )
+        await hub.async_shutdown()
+        hub.close()
+        assert polls > 0
@@ -0,0 +1,71 @@
+"""Snapshot microbenchmark
+
+Compares building a fresh dict per poll and reading it the way the
+entities used to (key in data, then data[key]) against the slot backed
+snapshot read by precomputed index.
+
+    python -m tests.bench_snapshot
+"""
+import sys
+import timeit
+import tracemalloc
+
+from custom_components.novus_modbus.const import REGISTERS, UNREADABLE_REGISTERS
+from custom_components.novus_modbus.decoder import compile_decoders
+from custom_components.novus_modbus.planner import plan_reads
+from custom_components.novus_modbus.snapshot import SnapshotLayout
+
+from .test_decoder import FRAME
+
+
+def _values() -> dict:
+    data = {}
+    for decoder in compile_decoders(
+        plan_reads(REGISTERS.values(), 4, UNREADABLE_REGISTERS)
+    ):
+        block = decoder.block
+        decoder.decode_into(FRAME[block.address:block.address + block.count], data)
+    return data
+
+
+def _retained(build, polls: int = 1000) -> float:
+    """Return the bytes each kept snapshot holds on to."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build() for _ in range(polls)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used / polls
+
+
+def main(number: int = 20000) -> None:
+    values = _values()
+    keys = [register.key for register in REGISTERS.values()]
+    layout = SnapshotLayout(keys)
+    indices = [layout.index[key] for key in keys]
+
+    def dict_poll():
+        data = dict(values)
+        return [data[key] if key in data else None for key in keys]
+
+    def snapshot_poll():
+        snapshot = layout.snapshot(values)
+        return [snapshot.slots[i] for i in indices]
+
+    assert dict_poll() == snapshot_poll()
+
+    for name, func, build in (
+        ("dict", dict_poll, lambda: dict(values)),
+        ("snapshot", snapshot_poll, lambda: layout.snapshot(values)),
+    ):
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(
+            f"{name:>9}: {best / number * 1e6:8.2f} us/poll  "
+            f"{sys.getsizeof(build()):5d} B shallow  "
+            f"{_retained(build):7.1f} B retained ({len(keys)} keys)"
+        )
+
+
+if __name__ == "__main__":
+    main()
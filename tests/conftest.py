@@ -1,2 +1,13 @@
+import pytest
+
+from custom_components.novus_modbus.transport import close_transports
+
 # Import the required Home Assistant fixtures, such as 'hass'
 pytest_plugins = ["pytest_homeassistant_custom_component"]
+
+
+@pytest.fixture(autouse=True)
+def close_lingering_transports():
+    """Close connections kept warm for reloads after each test."""
+    yield
+    close_transports()
@@ -0,0 +1,198 @@
+"""Simulated Novus controllers behind a Modbus TCP gateway
+
+A small asyncio Modbus TCP server answering read holding registers and
+write multiple registers for any number of unit ids. Each simulated
+controller serves r0-r20, answers requests touching r21-r23 with an
+illegal address exception like the real hardware, and can inject
+latency, jitter, dropped frames and exception responses. Requests are
+served one at a time, as on the RS-485 line behind a real gateway.
+
+It frames MBAP itself rather than building on pymodbus.server and a
+datastore: the faults are decided per answer and per unit, which the
+datastore callbacks cannot express. A datastore can only return values
+or raise, so it cannot stay silent to simulate a dropped frame, delay
+one unit's answer while holding the shared bus, or reject a block just
+because it touches an unreadable register. Keeping the server apart from
+pymodbus also means the client under test is never checked only against
+its own framing.
+
+    python -m tests.simulator --units 4 --port 5020 --latency 0.02
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import random
+import struct
+from typing import Optional
+
+from .test_decoder import FRAME
+
+READ_HOLDING_REGISTERS = 0x03
+WRITE_MULTIPLE_REGISTERS = 0x10
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+SERVER_DEVICE_FAILURE = 0x04
+
+MBAP = struct.Struct(">HHHB")
+
+
+@dataclass
+class SimulatedController:
+    """One Novus controller on the simulated bus"""
+
+    registers: list[int] = field(default_factory=lambda: list(FRAME))
+    unreadable: frozenset[int] = frozenset((21, 22, 23))
+    # seconds per transaction, plus uniform +/- jitter
+    latency: float = 0.0
+    jitter: float = 0.0
+    # probability of not answering at all / answering with an exception
+    drop_rate: float = 0.0
+    error_rate: float = 0.0
+    requests: int = 0
+
+    def read(self, address: int, count: int) -> tuple[int, bytes]:
+        """Return (exception code, payload) for a holding register read."""
+        end = address + count
+        if count < 1 or end > len(self.registers) or any(
+            a in self.unreadable for a in range(address, end)
+        ):
+            return ILLEGAL_DATA_ADDRESS, b""
+        words = self.registers[address:end]
+        return 0, struct.pack(f">B{count}H", 2 * count, *words)
+
+    def write(self, address: int, words: tuple[int, ...]) -> tuple[int, bytes]:
+        """Return (exception code, payload) for a holding register write."""
+        end = address + len(words)
+        if not words or end > len(self.registers) or any(
+            a in self.unreadable for a in range(address, end)
+        ):
+            return ILLEGAL_DATA_ADDRESS, b""
+        self.registers[address:end] = words
+        return 0, struct.pack(">HH", address, len(words))
+
+
+class SimulatedGateway:
+    """Modbus TCP gateway in front of simulated controllers"""
+
+    def __init__(
+        self,
+        controllers: dict[int, SimulatedController],
+        seed: Optional[int] = None,
+        pipelining: bool = True,
+    ):
+        self.controllers = controllers
+        # a gateway without pipelining silently drops requests arriving
+        # while the connection still waits for an answer
+        self.pipelining = pipelining
+        self.requests = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._bus = asyncio.Lock()
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start listening, returns the bound port."""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self.port
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer) -> None:
+        pending = set()
+        try:
+            while True:
+                header = await reader.readexactly(MBAP.size)
+                tid, pid, length, unit = MBAP.unpack(header)
+                pdu = await reader.readexactly(length - 1)
+                if pending and not self.pipelining:
+                    continue
+                self.max_in_flight = max(self.max_in_flight, len(pending) + 1)
+                # transactions are read ahead and answered in order,
+                # like a gateway queueing requests for its serial line
+                task = asyncio.create_task(self._answer(writer, tid, unit, pdu))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+    async def _answer(self, writer, tid: int, unit: int, pdu: bytes) -> None:
+        controller = self.controllers.get(unit)
+        if controller is None:
+            # nobody on the line answers, the client times out
+            return
+
+        async with self._bus:
+            self.requests += 1
+            controller.requests += 1
+            delay = controller.latency
+            if controller.jitter:
+                delay += self._random.uniform(-controller.jitter, controller.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._random.random() < controller.drop_rate:
+                return
+            function = pdu[0]
+            if self._random.random() < controller.error_rate:
+                code, payload = SERVER_DEVICE_FAILURE, b""
+            elif function == READ_HOLDING_REGISTERS and len(pdu) == 5:
+                address, count = struct.unpack(">HH", pdu[1:5])
+                code, payload = controller.read(address, count)
+            elif function == WRITE_MULTIPLE_REGISTERS and len(pdu) >= 6:
+                address, count, length = struct.unpack(">HHB", pdu[1:6])
+                words = struct.unpack(f">{length // 2}H", pdu[6:6 + length])
+                code, payload = controller.write(address, words)
+            else:
+                code, payload = ILLEGAL_FUNCTION, b""
+
+        if code:
+            response = struct.pack(">BB", function | 0x80, code)
+        else:
+            response = bytes((function,)) + payload
+        writer.write(MBAP.pack(tid, 0, len(response) + 1, unit) + response)
+
+
+async def _serve(args) -> None:
+    controllers = {
+        unit: SimulatedController(
+            latency=args.latency,
+            jitter=args.jitter,
+            drop_rate=args.drop_rate,
+            error_rate=args.error_rate,
+        )
+        for unit in range(1, args.units + 1)
+    }
+    gateway = SimulatedGateway(controllers, seed=args.seed)
+    port = await gateway.start(args.host, args.port)
+    print(f"serving units 1-{args.units} on {args.host}:{port}")
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--units", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    asyncio.run(_serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
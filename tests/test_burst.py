@@ -0,0 +1,23 @@
+"""Tests for burst polling"""
+from custom_components.novus_modbus.burst import BurstPolicy
+
+
+def test_burst_and_decay():
+    """A trigger flip polls fast for the duration, then decays to base."""
+    policy = BurstPolicy(10, 1, 5, ["ihm_p1_out1"])
+    on = {"ihm_p1_out1": True, "t1_temp_c": 20.0}
+    off = {"ihm_p1_out1": False, "t1_temp_c": 21.0}
+
+    assert policy.update({}, off, 0) == 10
+    assert policy.update(off, off, 1) == 10
+    assert policy.update(off, on, 2) == 1
+    assert policy.active and policy.bursts == 1
+    # non trigger changes do not extend it
+    assert policy.update(on, {**on, "t1_temp_c": 25.0}, 6) == 1
+    assert policy.update(on, on, 7) == 2
+    assert policy.update(on, on, 9) == 4
+    assert policy.update(on, on, 13) == 8
+    assert policy.update(on, on, 21) == 10
+    assert not policy.active
+    assert policy.update(on, off, 31) == 1
+    assert policy.bursts == 2
@@ -0,0 +1,96 @@
+"""Tests for frame capture and replay"""
+from datetime import timedelta
+import os
+
+from pymodbus.exceptions import ModbusIOException
+import pytest
+
+from custom_components.novus_modbus.capture import (
+    HEADER,
+    RECORD,
+    FrameRecorder,
+    ReplayTransport,
+    read_frames,
+)
+from custom_components.novus_modbus.const import TRANSPORT_REPLAY
+from custom_components.novus_modbus.hub import NovusHub
+
+from .test_hub import FakeScheduler
+
+
+def test_record_and_rotate(tmp_path):
+    """Frames are read back in order and the file rotates at max_bytes."""
+    path = str(tmp_path / "capture.bin")
+    frame_size = RECORD.size + 2 * 4
+    recorder = FrameRecorder(path, len(HEADER) + 3 * frame_size)
+    for i in range(5):
+        recorder.record(1, 4 * i, [i, i + 1, 0xFFFF, 0])
+    recorder.close()
+    recorder.join()
+
+    rotated = list(read_frames(f"{path}.1"))
+    current = list(read_frames(path))
+    assert [frame.address for frame in rotated] == [0, 4, 8]
+    assert [frame.address for frame in current] == [12, 16]
+    assert current[-1].registers == (4, 5, 0xFFFF, 0)
+    assert current[-1].unit == 1
+
+
+def test_record_leaves_io_to_writer_thread(tmp_path):
+    """Records past max_pending are dropped, close() flushes the rest."""
+    path = str(tmp_path / "capture.bin")
+    recorder = FrameRecorder(path, 1 << 20, max_pending=0)
+    recorder.record(1, 0, [1, 2])
+    assert recorder.dropped == 1
+    assert not os.path.exists(path)
+
+    recorder.max_pending = 8
+    recorder.record(1, 0, [1, 2])
+    recorder.close()
+    # nothing is recorded after close
+    recorder.record(1, 4, [3, 4])
+    recorder.join(1)
+    assert [frame.address for frame in read_frames(path)] == [0]
+    assert recorder.frames == 1
+
+
+async def test_replay_loads_lazily(tmp_path):
+    """The capture is read in the executor, not in the constructor."""
+    path = str(tmp_path / "missing.bin")
+    replay = ReplayTransport(path)
+    with pytest.raises(FileNotFoundError):
+        await replay.async_read(1, 0, 4)
+
+
+async def test_replay_exhausted_raises(tmp_path):
+    """Reading past the end of a capture fails like a missing answer."""
+    path = tmp_path / "capture.bin"
+    path.write_bytes(HEADER + RECORD.pack(1000.0, 1, 0, 1) + b"\x00\x07")
+    replay = ReplayTransport(str(path), speed=0)
+    assert (await replay.async_read(1, 0, 1)).registers == [7]
+    with pytest.raises(ModbusIOException):
+        await replay.async_read(1, 0, 1)
+
+
+async def test_replay_reproduces_poll(hass, tmp_path):
+    """A replayed capture decodes to the data it was recorded from."""
+    path = str(tmp_path / "capture.bin")
+    live = NovusHub(
+        hass, "live", "localhost:5020", timedelta(seconds=10), capture_path=path
+    )
+    live.transport.scheduler = FakeScheduler()
+    recorded = await live._async_update_data()
+    recorder = live.recorder
+    live.close()
+    recorder.join()
+
+    replay = NovusHub(
+        hass,
+        "replay",
+        path,
+        timedelta(seconds=10),
+        transport=TRANSPORT_REPLAY,
+        replay_speed=0,
+    )
+    assert await replay._async_update_data() == recorded
+    replay.close()
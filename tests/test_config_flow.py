@@ -0,0 +1,151 @@
+"""Tests for the config flow"""
+import asyncio
+from unittest.mock import patch
+
+from homeassistant import config_entries
+from homeassistant.const import CONF_HOST, CONF_NAME, CONF_SCAN_INTERVAL
+from homeassistant.helpers import entity_registry as er
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+import voluptuous as vol
+
+from custom_components.novus_modbus import async_migrate_entry
+from custom_components.novus_modbus.config_flow import options_schema, valid_bus
+from custom_components.novus_modbus.const import (
+    CONF_DISCOVER,
+    CONF_MAX_REGISTERS,
+    CONF_TRANSPORT,
+    DEFAULT_MAX_REGISTERS,
+    DOMAIN,
+    TRANSPORT_REPLAY,
+)
+from custom_components.novus_modbus.discovery import DiscoveredUnit
+
+
+def test_valid_bus():
+    for host in (
+        "localhost",
+        "gateway.local:5020",
+        "192.168.1.20:502",
+        "/dev/ttyUSB0",
+        "/dev/serial/by-id/usb-FTDI-if00-port0",
+        "COM3",
+    ):
+        assert valid_bus(host), host
+    for host in ("", "gateway.local:0", "gateway.local:http", "http://gateway", "a b"):
+        assert not valid_bus(host), host
+
+
+async def test_replay_needs_capture_file(hass, enable_custom_integrations, tmp_path):
+    """A replay's host is the path of an existing capture file."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    path = tmp_path / "capture.bin"
+    user_input = {CONF_HOST: str(path), CONF_TRANSPORT: TRANSPORT_REPLAY}
+
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], user_input
+    )
+    assert result["errors"] == {CONF_HOST: "capture_not_found"}
+
+    path.write_bytes(b"")
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], user_input
+    )
+    assert result["type"] == "create_entry"
+    assert result["data"][CONF_HOST] == str(path)
+
+
+async def test_discovery_shows_progress(hass, enable_custom_integrations):
+    """The bus scan runs as a progress step, the flow stays responsive."""
+    scanned = asyncio.Event()
+
+    async def discover(hass, host):
+        await scanned.wait()
+        return [DiscoveredUnit(3, 1, 2, None)]
+
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    with patch(
+        "custom_components.novus_modbus.config_flow.async_discover", discover
+    ):
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {CONF_HOST: "/dev/ttyUSB0", CONF_DISCOVER: True}
+        )
+        assert result["type"] == "progress"
+        assert result["progress_action"] == "discover"
+
+        scanned.set()
+        await hass.async_block_till_done()
+        result = await hass.config_entries.flow.async_configure(result["flow_id"])
+    assert result["type"] == "form"
+    assert result["step_id"] == "units"
+    assert result["data_schema"]({}) == {"units": ["3"]}
+
+
+async def test_discovery_without_units_aborts(hass, enable_custom_integrations):
+    async def discover(hass, host):
+        return []
+
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    with patch(
+        "custom_components.novus_modbus.config_flow.async_discover", discover
+    ):
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {CONF_HOST: "/dev/ttyUSB0", CONF_DISCOVER: True}
+        )
+        await hass.async_block_till_done()
+        result = await hass.config_entries.flow.async_configure(result["flow_id"])
+    assert result["type"] == "abort"
+    assert result["reason"] == "no_units_found"
+
+
+def test_options_schema_bounds_max_registers():
+    schema = options_schema({})
+    assert schema({})[CONF_MAX_REGISTERS] == DEFAULT_MAX_REGISTERS
+    assert schema({CONF_MAX_REGISTERS: 125})[CONF_MAX_REGISTERS] == 125
+    for count in (0, 126):
+        with pytest.raises(vol.Invalid):
+            schema({CONF_MAX_REGISTERS: count})
+
+
+async def test_options_flow(hass, enable_custom_integrations):
+    """Options start out as the entry's settings and are saved as options."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={CONF_NAME: "cooler", CONF_HOST: "localhost", CONF_SCAN_INTERVAL: 30},
+    )
+    entry.add_to_hass(hass)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["step_id"] == "init"
+    defaults = result["data_schema"]({})
+    assert defaults[CONF_SCAN_INTERVAL] == 30
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {**defaults, CONF_MAX_REGISTERS: 8}
+    )
+    assert result["type"] == "create_entry"
+    assert entry.options[CONF_MAX_REGISTERS] == 8
+    assert entry.options[CONF_SCAN_INTERVAL] == 30
+
+
+async def test_migrate_removes_bit_sensors(hass):
+    """Version 1 entries lose the sensors their status bits used to be."""
+    entry = MockConfigEntry(
+        domain=DOMAIN, version=1, data={CONF_NAME: "cooler", CONF_HOST: "localhost"}
+    )
+    entry.add_to_hass(hass)
+    registry = er.async_get(hass)
+    for key in ("ihm_p2_out2", "ice_status", "t1_temp_c"):
+        registry.async_get_or_create("sensor", DOMAIN, f"cooler_{key}")
+
+    assert await async_migrate_entry(hass, entry)
+    assert entry.version == 2
+    assert registry.async_get_entity_id("sensor", DOMAIN, "cooler_ihm_p2_out2") is None
+    assert registry.async_get_entity_id("sensor", DOMAIN, "cooler_ice_status") is None
+    assert registry.async_get_entity_id("sensor", DOMAIN, "cooler_t1_temp_c")
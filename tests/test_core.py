@@ -0,0 +1,142 @@
+"""Tests for the polling core, without Home Assistant"""
+import struct
+import time
+
+import pytest
+
+from custom_components.novus_modbus.capture import HEADER, RECORD
+from custom_components.novus_modbus.const import (
+    TIER_IDENTITY,
+    TIER_LIVE,
+    TIER_SLOW,
+    TRANSPORT_REPLAY,
+)
+from custom_components.novus_modbus.core import CoreClosed, NovusCore, PollFailed
+from custom_components.novus_modbus.profile import get_profile
+
+from .test_decoder import FRAME
+from .test_hub import FakeScheduler
+
+
+def _core(hostname="localhost:5020", transport="async", **kwargs):
+    core = NovusCore(
+        "test",
+        hostname,
+        get_profile(),
+        {TIER_LIVE: 0, TIER_SLOW: 3600, TIER_IDENTITY: None},
+        max_registers=4,
+        transport=transport,
+        unit_id=1,
+        retries=0,
+        max_age=60,
+        **kwargs,
+    )
+    if transport != TRANSPORT_REPLAY:
+        core.transport.scheduler = FakeScheduler()
+    return core
+
+
+async def test_poll_tiers():
+    """A core polls its due tiers into snapshots on a bare event loop."""
+    core = _core()
+    scheduler = core.transport.scheduler
+
+    first = await core.async_poll()
+    assert first["serial_high"] == 123
+    assert core.read_tiers == {TIER_LIVE, TIER_SLOW, TIER_IDENTITY}
+    assert core.status_words == {14: FRAME[14], 20: FRAME[20]}
+    assert core.telemetry.polls == 1
+
+    scheduler.reads.clear()
+    second = await core.async_poll()
+    assert second == first
+    assert core.due == {TIER_LIVE}
+    assert scheduler.reads == [0, 5, 14, 20]
+    assert core.flipped == set()
+
+    core.close()
+
+
+async def test_failed_poll_rereads_every_tier():
+    core = _core()
+    await core.async_poll()
+    core.transport.scheduler.failing.update({0, 5, 14, 20})
+
+    with pytest.raises(PollFailed):
+        await core.async_poll()
+    assert core.telemetry.failed_polls == 1
+    assert core.due_tiers(0) == {TIER_LIVE, TIER_SLOW, TIER_IDENTITY}
+
+    core.close()
+
+
+async def test_oversized_response_is_truncated():
+    """Words beyond a block are neither decoded nor recorded."""
+    recorded = []
+
+    class Recorder:
+        def record(self, unit, address, registers):
+            recorded.append(list(registers))
+
+    core = _core(recorder=Recorder())
+    scheduler = core.transport.scheduler
+    real_read = scheduler.async_read
+
+    async def oversized(unit, address, count, deadline=None, telemetry=None):
+        return await real_read(unit, address, count + 2, deadline, telemetry)
+
+    scheduler.async_read = oversized
+    snapshot = await core.async_poll()
+    assert snapshot["t1_temp_c"] == -20.0
+    assert all(len(registers) <= 4 for registers in recorded)
+    assert core.stale == set()
+
+    core.close()
+
+
+async def test_restore_marks_stale():
+    """Restored values are stale, except tiers read once per connection."""
+    core = _core()
+    snapshot = core.restore(
+        {"t1_temp_c": 21.5, "serial_high": 123, "ihm_p1_out1": True}, 10
+    )
+    assert snapshot["t1_temp_c"] == 21.5
+    assert core.stale == {"t1_temp_c", "ihm_p1_out1"}
+    assert core.value_age("t1_temp_c") == pytest.approx(10, abs=1)
+    # a status word is only rebuilt from a complete set of bits
+    assert core.status_words == {}
+
+    core.close()
+
+
+async def test_closed_core_keeps_bus_released():
+    """Reading the transport after close() does not reopen the bus."""
+    core = _core()
+    transport = core.transport
+    assert transport.users == 1
+    core.close()
+    assert transport.users == 0
+    with pytest.raises(CoreClosed):
+        core.transport
+    assert transport.users == 0
+
+
+async def test_replay_speed_zero_does_not_sleep(tmp_path):
+    """Speed 0 answers a capture at once, whatever its recorded pace."""
+    path = tmp_path / "capture.bin"
+    path.write_bytes(
+        HEADER
+        + b"".join(
+            RECORD.pack(1000.0 + 5 * i, 1, 0, 2) + struct.pack(">2H", i, i)
+            for i in range(3)
+        )
+    )
+    core = _core(str(path), TRANSPORT_REPLAY, replay_speed=0)
+    assert core.transport.speed == 0
+
+    started = time.monotonic()
+    for _ in range(3):
+        await core.transport.async_read(1, 0, 2)
+    assert time.monotonic() - started < 1
+
+    core.close()
@@ -0,0 +1,52 @@
+"""Tests for the block decoders"""
+from custom_components.novus_modbus.const import REGISTERS, UNREADABLE_REGISTERS
+from custom_components.novus_modbus.decoder import compile_decoders
+from custom_components.novus_modbus.planner import plan_reads
+
+# r0..r20 as returned by pymodbus (unsigned words)
+FRAME = [
+    0xFF38, 215, 0xFC7C, 60, 30, 215, 123, 456, 40, 900,
+    950, 20, 5, 0xFFFE, 0b1000_0100_0010_0001, 1, 215, 0x0312, 0xFFFB, 3,
+    0b101,
+]
+
+
+def _decode(max_registers):
+    data = {}
+    for decoder in compile_decoders(
+        plan_reads(REGISTERS.values(), max_registers, UNREADABLE_REGISTERS)
+    ):
+        block = decoder.block
+        decoder.decode_into(FRAME[block.address:block.address + block.count], data)
+    return data
+
+
+def test_decode_frame():
+    """Values are signed, scaled and expanded into bits like before."""
+    data = _decode(4)
+
+    assert data["t1_temp_c"] == -20.0
+    assert data["t2_temp_c"] == 21.5
+    assert data["temp_diff_c"] == -90.0
+    assert data["ind"] == 215
+    assert data["serial_high"] == 123
+    assert data["serial_low"] == 456
+    assert data["hy2"] == -2
+    assert data["version_and_screen_n"] == 0x0312
+    assert data["of1"] == -5
+
+    assert data["ihm_p1_out1"] is True
+    assert data["ihm_p1_out2"] is False
+    assert data["ihm_status_t1"] is True
+    assert data["ihm_value_has_decimal"] is True
+    assert data["ihm_internal_15"] is True
+    assert data["ice_status"] is True
+    assert data["ht1_status"] is False
+    assert data["ht2_status"] is True
+
+    assert set(data) == {register.key for register in REGISTERS.values()}
+
+
+def test_decode_independent_of_plan():
+    """Coalesced blocks decode to the same frame."""
+    assert _decode(125) == _decode(4)
@@ -0,0 +1,72 @@
+"""Tests for bus discovery"""
+import asyncio
+import subprocess
+import sys
+import time
+
+from custom_components.novus_modbus.const import TRANSPORT_ASYNC
+from custom_components.novus_modbus.discovery import (
+    DiscoveredUnit,
+    async_discover,
+    async_probe,
+)
+from custom_components.novus_modbus.transport import (
+    acquire_transport,
+    release_transport,
+)
+
+from .simulator import SimulatedController, SimulatedGateway
+
+
+async def test_discover_tcp_gateway(hass, socket_enabled):
+    """Only the units that answer are found, with their fingerprints."""
+    second = SimulatedController()
+    second.registers[6:8] = [7, 8]
+    gateway = SimulatedGateway({3: SimulatedController(), 200: second})
+    port = await gateway.start()
+
+    found = await async_discover(
+        hass, f"127.0.0.1:{port}", units=range(1, 248), timeout=0.05
+    )
+    await gateway.stop()
+
+    assert found == [
+        DiscoveredUnit(3, 123, 456, 0x0312),
+        DiscoveredUnit(200, 7, 8, 0x0312),
+    ]
+    assert str(found[1]) == "unit 200 (serial 7-8, version 0x0312)"
+
+
+async def test_probe_timeout_starts_on_the_wire(hass, socket_enabled):
+    """A probe queued behind a slow poll on a shared bus is still answered."""
+    gateway = SimulatedGateway(
+        {1: SimulatedController(latency=0.2), 3: SimulatedController()}
+    )
+    port = await gateway.start()
+    transport = acquire_transport(f"127.0.0.1:{port}", TRANSPORT_ASYNC)
+    scheduler = transport.scheduler
+
+    def read(unit, address, count, timeout):
+        return scheduler.async_read(unit, address, count, timeout=timeout)
+
+    poll = asyncio.create_task(scheduler.async_read(1, 0, 2))
+    await asyncio.sleep(0)
+    started = time.monotonic()
+    found = await async_probe(read, 3, timeout=0.1)
+    assert time.monotonic() - started > 0.1
+    assert found == DiscoveredUnit(3, 123, 456, 0x0312)
+
+    await poll
+    release_transport(transport, linger=0)
+    await gateway.stop()
+
+
+def test_import_leaves_transport_stack_alone():
+    """The config flow imports discovery on the event loop, pymodbus is not."""
+    code = (
+        "import sys\n"
+        "from custom_components.novus_modbus import discovery\n"
+        "assert 'pymodbus' not in sys.modules\n"
+        "assert 'custom_components.novus_modbus.transport' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
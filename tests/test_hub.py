@@ -0,0 +1,292 @@
+"""Tests for the Novus hub"""
+from datetime import timedelta
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.novus_modbus.const import DOMAIN, ENTRY_IDENTITY, STORE_VERSION
+from custom_components.novus_modbus.hub import NovusHub, store_key
+from custom_components.novus_modbus.integration import async_setup_entry
+from custom_components.novus_modbus.phase import POLL_PHASES, PhaseAllocator
+from custom_components.novus_modbus.scheduler import DeviceState
+
+from .test_decoder import FRAME
+
+
+class FakeResponse:
+    def __init__(self, registers, error=False):
+        self.registers = registers
+        self.error = error
+
+    def isError(self):
+        return self.error
+
+
+class FakeScheduler:
+    """Serves FRAME and records the blocks read"""
+
+    def __init__(self):
+        self.registers = list(FRAME)
+        self.reads = []
+        self.writes = []
+        self.failing = set()
+
+    async def async_read(self, unit, address, count, deadline=None, telemetry=None):
+        self.reads.append(address)
+        return FakeResponse(
+            self.registers[address:address + count], address in self.failing
+        )
+
+    async def async_write(self, unit, address, values, deadline=None, telemetry=None):
+        self.writes.append((address, values))
+        self.registers[address:address + len(values)] = values
+        return FakeResponse([], address in self.failing)
+
+    def device(self, unit):
+        return DeviceState()
+
+    def close(self):
+        pass
+
+
+def _hub(hass, **kwargs):
+    hub = NovusHub(hass, "test", "localhost:5020", timedelta(seconds=10), **kwargs)
+    hub.last_update_success = True
+    return hub
+
+
+async def test_tiered_polling(hass):
+    """Only the live tier is read again until the others fall due."""
+    entry = MockConfigEntry(domain=DOMAIN, data={})
+    entry.add_to_hass(hass)
+    hub = _hub(hass, max_registers=4, entry=entry)
+    scheduler = hub.transport.scheduler = FakeScheduler()
+
+    first = await hub._async_update_data()
+    assert first["serial_high"] == 123
+    assert first["don"] == 6.0
+    assert entry.data[ENTRY_IDENTITY] == {
+        "serial_high": 123,
+        "serial_low": 456,
+        "version_and_screen_n": 0x0312,
+    }
+
+    scheduler.reads.clear()
+    second = await hub._async_update_data()
+    assert second == first
+    # r0-r2, r5, r14-r16 and r20 only
+    assert scheduler.reads == [0, 5, 14, 20]
+
+    hub.close()
+
+
+async def test_notify_changed_only(hass):
+    """Only listeners of changed keys are woken after a poll."""
+    hub = _hub(hass, deadband=0.5)
+    woken = []
+    for key in ("t1_temp_c", "serial_high"):
+        hub.async_add_listener(lambda key=key: woken.append(key), key)
+
+    hub._changed = hub._diff({"t1_temp_c": 20.0, "serial_high": 123})
+    hub.async_update_listeners()
+    assert sorted(woken) == ["serial_high", "t1_temp_c"]
+
+    woken.clear()
+    hub._changed = hub._diff({"t1_temp_c": 20.3, "serial_high": 123})
+    hub.async_update_listeners()
+    assert woken == []
+
+    hub._changed = hub._diff({"t1_temp_c": 20.6, "serial_high": 123})
+    hub.async_update_listeners()
+    assert woken == ["t1_temp_c"]
+
+    await hub.async_shutdown()
+    hub.close()
+
+
+async def test_notify_all_on_availability_change(hass):
+    """Every listener is woken when the hub goes unavailable."""
+    hub = _hub(hass)
+    woken = []
+    for key in ("t1_temp_c", "serial_high"):
+        hub.async_add_listener(lambda key=key: woken.append(key), key)
+
+    hub._changed = hub._diff({"t1_temp_c": 20.0, "serial_high": 123})
+    hub.async_update_listeners()
+    woken.clear()
+
+    hub.last_update_success = False
+    hub.async_update_listeners()
+    assert sorted(woken) == ["serial_high", "t1_temp_c"]
+
+    await hub.async_shutdown()
+    hub.close()
+
+
+async def test_failed_block_served_from_last_good(hass):
+    """A failing block keeps its last values until they expire."""
+    hub = _hub(hass, max_registers=4, retries=1, max_age=60)
+    scheduler = hub.transport.scheduler = FakeScheduler()
+
+    await hub._async_update_data()
+    scheduler.failing.add(0)
+    scheduler.reads.clear()
+
+    data = await hub._async_update_data()
+    assert scheduler.reads == [0, 0, 5, 14, 20]
+    assert data["t1_temp_c"] == -20.0
+    assert hub.stale == {"t1_temp_c", "t2_temp_c", "temp_diff_c"}
+
+    hub.core.max_age = 0
+    data = await hub._async_update_data()
+    assert "t1_temp_c" not in data
+    assert data["ind"] == 215
+    assert hub.stale == set()
+
+    hub.close()
+
+
+async def test_status_bits_flip(hass):
+    """Only the bits that flipped in a status word wake their listeners."""
+    hub = _hub(hass, max_registers=4)
+    scheduler = hub.transport.scheduler = FakeScheduler()
+    woken = []
+    for key in ("ihm_p1_out1", "ihm_pv", "ihm_internal_4"):
+        hub.async_add_listener(lambda key=key: woken.append(key), key)
+
+    await hub._async_update_data()
+    hub.async_update_listeners()
+    assert hub.status_words[14] == FRAME[14]
+
+    woken.clear()
+    scheduler.registers[14] ^= 0b10100
+    await hub._async_update_data()
+    hub.async_update_listeners()
+    assert sorted(woken) == ["ihm_internal_4", "ihm_pv"]
+    assert hub.status_words[14] == FRAME[14] ^ 0b10100
+
+    # an expired word is unknown, every bit of it changes
+    scheduler.failing.add(14)
+    hub.core.max_age = 0
+    woken.clear()
+    await hub._async_update_data()
+    hub.async_update_listeners()
+    assert 14 not in hub.status_words
+    assert sorted(woken) == ["ihm_internal_4", "ihm_p1_out1", "ihm_pv"]
+
+    await hub.async_shutdown()
+    hub.close()
+
+
+async def test_burst_on_pump_start(hass):
+    """A pump turning on shortens the scan interval."""
+    hub = _hub(hass, burst_interval=1, burst_duration=30)
+    scheduler = hub.transport.scheduler = FakeScheduler()
+
+    hub.data = await hub._async_update_data()
+    assert hub.update_interval == timedelta(seconds=10)
+
+    scheduler.registers[14] ^= 1  # ihm_p1_out1
+    hub.data = await hub._async_update_data()
+    assert hub.update_interval == timedelta(seconds=1)
+
+    hub.close()
+
+
+async def test_polls_move_back_onto_phase(hass):
+    """A poll off the hub's phase schedules one at its next slot."""
+    hub = _hub(hass)
+    hub.transport.scheduler = FakeScheduler()
+    hub.phases = PhaseAllocator(jitter=0)
+    hub.phases.add("other")
+    hub.join_phases()
+    # "test" polls 5s into each 10s interval
+    assert hub.phase_offset == 5
+
+    calls = []
+
+    def call_later(hass, delay, action):
+        calls.append((delay, action))
+        return lambda: calls.remove((delay, action))
+
+    now = hass.loop.time()
+    started = now + (2 - now) % 10
+    with patch("custom_components.novus_modbus.hub.async_call_later", call_later):
+        hub._align_phase(started + 3)
+        assert calls == []
+
+        hub._align_phase(started)
+        [(delay, action)] = calls
+        assert delay == pytest.approx(started + 3 - hass.loop.time(), abs=0.1)
+        # one alignment at a time
+        hub._align_phase(started)
+        assert len(calls) == 1
+
+    polls = hub._polls
+    action(None)
+    await hass.async_block_till_done()
+    assert hub._polls == polls + 1
+
+    hub._align_phase(started)
+    hub.close()
+    assert hub.phases.phase("test") is None
+
+
+async def test_failed_setup_leaves_phases(hass):
+    """A hub whose setup fails does not keep its phase slot."""
+    hass.data[DOMAIN] = {}
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={"name": "test", "host": "localhost:5020", "scan_interval": 10},
+    )
+    entry.add_to_hass(hass)
+
+    with patch.object(NovusHub, "async_restore", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            await async_setup_entry(hass, entry)
+    assert POLL_PHASES.phase(entry.entry_id) is None
+    assert "test" not in hass.data[DOMAIN]
+
+
+async def test_restore_saved_snapshot(hass, hass_storage):
+    """Entities start out with the saved values, flagged stale."""
+    entry = MockConfigEntry(domain=DOMAIN, data={})
+    entry.add_to_hass(hass)
+    hass_storage[store_key(entry.entry_id)] = {
+        "version": STORE_VERSION,
+        "minor_version": 1,
+        "key": store_key(entry.entry_id),
+        "data": {
+            "saved_at": time.time() - 30,
+            "values": {"t1_temp_c": 19.5, "serial_high": 123, "gone": 1},
+        },
+    }
+    hub = _hub(hass, entry=entry)
+    await hub.async_restore()
+
+    assert hub.data == {"t1_temp_c": 19.5, "serial_high": 123}
+    assert hub.stale == {"t1_temp_c"}
+    assert 29 < hub.value_age("t1_temp_c") < 40
+    assert hub.startup["restored"] is not None
+
+    hub.transport.scheduler = FakeScheduler()
+    hub.data = await hub._async_update_data()
+    assert hub.data["t1_temp_c"] == -20.0
+    assert hub.stale == set()
+    assert hub.startup["first_poll"] is not None
+
+    hub.close()
+    await hub.async_shutdown()
+
+
+def test_hub_import_defers_pymodbus():
+    """pymodbus is only imported once a hub needs its transport."""
+    code = (
+        "import sys, custom_components.novus_modbus.hub; "
+        "sys.exit('pymodbus' in sys.modules)"
+    )
+    assert subprocess.run([sys.executable, "-c", code], check=False).returncode == 0
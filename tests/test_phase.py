@@ -0,0 +1,66 @@
+"""Tests for the poll phase allocator"""
+import pytest
+
+from custom_components.novus_modbus.phase import LoadCurve, PhaseAllocator
+
+
+def test_phases_spread_evenly():
+    """Hubs get evenly spaced, deterministic phases, whatever the order."""
+    phases = PhaseAllocator(jitter=0)
+    for key in ("c", "a", "d", "b"):
+        phases.add(key)
+    assert [phases.phase(key) for key in "abcd"] == [0.0, 0.25, 0.5, 0.75]
+
+    jittered = PhaseAllocator()
+    for key in ("b", "a"):
+        jittered.add(key)
+    again = PhaseAllocator()
+    for key in ("a", "b"):
+        again.add(key)
+    assert jittered.phase("a") == again.phase("a")
+    assert jittered.phase("b") == again.phase("b")
+
+
+def test_respread_on_remove():
+    phases = PhaseAllocator(jitter=0)
+    for key in "abcd":
+        phases.add(key)
+    phases.remove("b")
+    phases.remove("unknown")
+    assert [phases.phase(key) for key in "acd"] == pytest.approx([0, 1 / 3, 2 / 3])
+    assert phases.phase("b") is None
+
+
+def test_next_poll_on_phase_grid():
+    """Polls land on the interval grid shifted by the phase."""
+    phases = PhaseAllocator(jitter=0)
+    phases.add("a")
+    phases.add("b")
+    # b polls at 5, 15, 25...
+    assert phases.next_poll("b", 99.0, 10) == 105
+    assert phases.next_poll("b", 105.1, 10) == 115
+    # a phase moved right behind the last poll waits for the next slot
+    assert phases.next_poll("a", 107.0, 10) == 120
+
+
+def test_until_slot():
+    phases = PhaseAllocator(jitter=0)
+    phases.add("a")
+    phases.add("b")
+    assert phases.until_slot("b", 99.0, 10) == 6
+    assert phases.until_slot("b", 105.0, 10) == 0
+    assert phases.until_slot("a", 107.5, 10) == 2.5
+
+
+def test_load_curve():
+    load = LoadCurve(window=5)
+    load.start(10.1)
+    load.start(10.9)
+    load.finish()
+    load.start(12.0)
+    assert load.curve(12.5) == [0, 0, 2, 0, 1]
+    # bins older than the window are dropped
+    assert load.curve(16.0) == [1, 0, 0, 0, 0]
+    stats = load.as_dict(12.5)
+    assert stats["peak"] == 2
+    assert stats["active"] == 2 and stats["peak_active"] == 2
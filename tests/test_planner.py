@@ -0,0 +1,41 @@
+"""Tests for the register read planner"""
+import pytest
+
+from custom_components.novus_modbus.const import (
+    REGISTERS,
+    UNREADABLE_REGISTERS,
+    NovusRegister,
+)
+from custom_components.novus_modbus.planner import plan_reads
+
+
+def _spans(plan):
+    return [(block.address, block.count) for block in plan]
+
+
+def test_plan_default_register_map():
+    """The stock map needs six reads at 4 registers per request."""
+    plan = plan_reads(REGISTERS.values(), 4, UNREADABLE_REGISTERS)
+    assert _spans(plan) == [(0, 4), (4, 4), (8, 4), (12, 4), (16, 4), (20, 1)]
+
+    planned = {register.key for block in plan for register in block.registers}
+    assert planned == {register.key for register in REGISTERS.values()}
+
+
+def test_plan_coalesces_up_to_limit():
+    """Larger requests coalesce the whole map into a single read."""
+    plan = plan_reads(REGISTERS.values(), 125, UNREADABLE_REGISTERS)
+    assert _spans(plan) == [(0, 21)]
+
+
+def test_plan_never_spans_unreadable():
+    """Blocks are split around addresses that must not be read."""
+    registers = [
+        NovusRegister(key="a", address=0),
+        NovusRegister(key="b", address=3),
+        NovusRegister(key="c", address=30),
+    ]
+    assert _spans(plan_reads(registers, 125, (2,))) == [(0, 1), (3, 28)]
+
+    with pytest.raises(ValueError):
+        plan_reads(registers, 125, (3,))
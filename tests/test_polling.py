@@ -0,0 +1,124 @@
+"""End to end polling against simulated controllers"""
+import contextlib
+from datetime import timedelta
+
+from homeassistant.helpers.update_coordinator import UpdateFailed
+import pytest
+
+from custom_components.novus_modbus.const import TRANSPORT_ASYNC, TRANSPORT_SYNC
+from custom_components.novus_modbus.hub import NovusHub
+
+from .simulator import SimulatedController, SimulatedGateway
+
+
+@pytest.fixture
+async def gateway(socket_enabled):
+    gateway = SimulatedGateway(
+        {1: SimulatedController(), 2: SimulatedController()}, seed=1
+    )
+    await gateway.start()
+    yield gateway
+    await gateway.stop()
+
+
+@pytest.mark.parametrize("transport", [TRANSPORT_ASYNC, TRANSPORT_SYNC])
+async def test_poll_simulated_controller(hass, gateway, transport):
+    """A full poll decodes r0-r20 without touching r21-r23."""
+    hub = NovusHub(
+        hass,
+        "test",
+        f"127.0.0.1:{gateway.port}",
+        timedelta(seconds=10),
+        transport=transport,
+        unit_id=2,
+    )
+
+    data = await hub._async_update_data()
+    assert data["t1_temp_c"] == -20.0
+    assert data["serial_low"] == 456
+    assert data["ht2_status"] is True
+    assert hub.stale == set()
+    assert gateway.controllers[1].requests == 0
+    assert gateway.controllers[2].requests == 6
+
+    telemetry = hub.telemetry
+    assert telemetry.polls == 1
+    assert telemetry.requests == 6
+    assert telemetry.timeouts == telemetry.errors == 0
+    assert telemetry.bytes_sent == 6 * 12
+    assert telemetry.bytes_received == 5 * (9 + 8) + (9 + 2)
+    assert hub.transport.connects == 1
+
+    hub.close()
+
+
+@pytest.mark.parametrize("transport", [TRANSPORT_ASYNC, TRANSPORT_SYNC])
+async def test_write_simulated_controller(hass, gateway, transport):
+    """A setpoint write reaches the controller as one write request."""
+    hub = NovusHub(
+        hass,
+        "test",
+        f"127.0.0.1:{gateway.port}",
+        timedelta(seconds=10),
+        transport=transport,
+    )
+    hub.writer.delay = 0
+
+    await hub.writer.async_write("hys", -1.5)
+    assert gateway.controllers[1].registers[11] == 0xFFF1
+    assert gateway.controllers[1].requests == 1
+    data = await hub._async_update_data()
+    assert data["hys"] == -1.5
+    assert hub.writer.mismatches == 0
+
+    await hub.async_shutdown()
+    hub.close()
+
+
+async def test_pipelined_poll(hass, gateway):
+    """With a window the blocks of a poll are in flight together."""
+    gateway.controllers[2].latency = 0.01
+    hub = NovusHub(
+        hass,
+        "test",
+        f"127.0.0.1:{gateway.port}",
+        timedelta(seconds=10),
+        unit_id=2,
+        pipeline=4,
+    )
+
+    data = await hub._async_update_data()
+    assert data["t1_temp_c"] == -20.0
+    assert hub.stale == set()
+    assert gateway.max_in_flight == 4
+    assert hub.transport.window == 4
+
+    hub.close()
+
+
+async def test_pipelining_fallback(hass, gateway):
+    """A gateway dropping pipelined requests is sent one at a time."""
+    gateway.pipelining = False
+    hub = NovusHub(
+        hass,
+        "test",
+        f"127.0.0.1:{gateway.port}",
+        timedelta(seconds=10),
+        unit_id=2,
+        pipeline=4,
+    )
+    transport = hub.transport
+    # learn a short timeout before the dropped requests start
+    await transport.async_read(2, 0, 1)
+    transport.window = 4
+
+    while transport.window > 1:
+        with contextlib.suppress(UpdateFailed):
+            await hub._async_update_data()
+        # the dropped requests also put the unit in backoff
+        transport.scheduler.device(2).backoff_until = 0
+    data = await hub._async_update_data()
+    assert hub.stale == set()
+    assert data["ht2_status"] is True
+
+    hub.close()
@@ -0,0 +1,85 @@
+"""Tests for the controller profiles"""
+import json
+
+import pytest
+import voluptuous as vol
+
+from custom_components.novus_modbus.const import (
+    PROFILES_DIR,
+    REGISTERS,
+    UNREADABLE_REGISTERS,
+)
+from custom_components.novus_modbus.planner import plan_reads
+from custom_components.novus_modbus.profile import (
+    compile_profile,
+    get_profile,
+    load_profiles,
+    select_profile,
+)
+
+
+def _variant(**changes):
+    with open(f"{PROFILES_DIR}/differential.json", encoding="utf-8") as file:
+        data = json.load(file)
+    data.update(model="variant", **changes)
+    return data
+
+
+def test_builtin_profile_matches_register_map():
+    """The built-in profile compiles to the stock map and plans."""
+    profile = get_profile()
+    assert profile.registers == REGISTERS
+    assert profile.unreadable == UNREADABLE_REGISTERS
+    assert profile.version({"version_and_screen_n": 0x1203}) == 0x1203
+    # bits are binary sensors, the controller's internal ones disabled
+    assert {bit.key for bit in profile.bits} == {
+        register.key for register in REGISTERS.values() if register.bit is not None
+    }
+    assert all(
+        bit.enabled == (not bit.key.startswith("ihm_internal"))
+        for bit in profile.bits
+    )
+
+    plans = profile.plans(4)
+    full = plans[max(plans, key=len)]
+    expected = plan_reads(REGISTERS.values(), 4, UNREADABLE_REGISTERS)
+    assert [decoder.block for decoder in full] == list(expected)
+    # compiled once, shared by every hub
+    assert profile.plans(4) is plans
+
+
+@pytest.mark.parametrize(
+    "changes, error",
+    [
+        ({"registers": {}}, "length"),
+        ({"unreadable": [0]}, "unreadable"),
+        ({"version_register": "r99"}, "version register"),
+    ],
+)
+def test_invalid_profiles(changes, error):
+    """Broken maps are refused before any hub polls them."""
+    with pytest.raises(vol.Invalid, match=error):
+        compile_profile(_variant(**changes))
+
+
+def test_duplicate_bits_refused():
+    data = _variant()
+    data["registers"]["ihm_pv"]["bit"] = 0
+    with pytest.raises(vol.Invalid, match="mapped twice"):
+        compile_profile(data)
+
+
+def test_select_profile_by_version(tmp_path):
+    """A user profile claiming a firmware version wins over the default."""
+    variant = _variant(versions=[{"mask": 0xFF00, "value": 0x2000}])
+    (tmp_path / "variant.json").write_text(json.dumps(variant))
+    (tmp_path / "broken.json").write_text("{")
+
+    try:
+        profiles = load_profiles((PROFILES_DIR, str(tmp_path)), (4,))
+        assert set(profiles) == {"differential", "variant"}
+        assert select_profile(0x2013).model == "variant"
+        assert select_profile(0x1013).model == "differential"
+        assert select_profile(None).model == "differential"
+    finally:
+        load_profiles()
@@ -0,0 +1,103 @@
+"""Tests for the headless runner"""
+import asyncio
+import json
+import subprocess
+import sys
+
+import pytest
+import voluptuous as vol
+
+from custom_components.novus_modbus.phase import PhaseAllocator
+from custom_components.novus_modbus.runner import (
+    RUNNER_SCHEMA,
+    async_poll_forever,
+    create_core,
+    format_metrics,
+    main,
+    poll_record,
+)
+
+from .test_hub import FakeScheduler
+
+
+def _config(**changes):
+    return RUNNER_SCHEMA(
+        {
+            "scan_interval": 0.1,
+            "controllers": [
+                {"name": "cooler", "host": "localhost:5020", **changes}
+            ],
+        }
+    )
+
+
+def test_config_defaults():
+    config = _config()
+    controller = config["controllers"][0]
+    assert controller["unit_id"] == 1
+    assert controller["profile"] == "differential"
+    with pytest.raises(vol.Invalid):
+        _config(unit_id=0)
+    with pytest.raises(vol.Invalid):
+        _config(max_registers=126)
+    with pytest.raises(vol.Invalid):
+        RUNNER_SCHEMA({"controllers": []})
+
+
+async def test_poll_stream_and_metrics():
+    """Polls are streamed as JSON records and exported as metrics."""
+    core = create_core(_config(max_registers=4)["controllers"][0])
+    core.transport.scheduler = FakeScheduler()
+    records = []
+
+    def emit(core, snapshot, error):
+        records.append(json.loads(json.dumps(poll_record(core, snapshot, error))))
+
+    task = asyncio.create_task(async_poll_forever(core, 0.1, PhaseAllocator(), emit))
+    while not records:
+        await asyncio.sleep(0.02)
+    task.cancel()
+    core.close()
+
+    record = records[0]
+    assert record["name"] == "cooler"
+    assert record["values"]["t1_temp_c"] == -20.0
+    assert record["values"]["ihm_p1_out1"] is True
+    assert record["stale"] == []
+
+    metrics = format_metrics([core])
+    assert 'novus_value{controller="cooler",key="t1_temp_c"} -20.0' in metrics
+    assert 'novus_value{controller="cooler",key="ihm_p1_out1"} 1.0' in metrics
+    assert 'novus_polls_total{controller="cooler"} 1' in metrics
+
+
+def test_poll_record_error():
+    core = create_core(_config()["controllers"][0])
+    record = poll_record(core, None, TimeoutError())
+    assert record["error"] == "TimeoutError"
+    assert "values" not in record
+
+
+def test_main_refuses_bad_config(tmp_path, capsys):
+    path = tmp_path / "controllers.json"
+    path.write_text(json.dumps({"controllers": [{"name": "cooler"}]}))
+    with pytest.raises(SystemExit):
+        main([str(path)])
+    assert "host" in capsys.readouterr().err
+
+
+def test_imports_without_home_assistant():
+    """The runner and the core never import Home Assistant."""
+    code = (
+        "import sys\n"
+        "sys.modules['homeassistant'] = None\n"
+        "from custom_components.novus_modbus import runner\n"
+        "runner.create_core(runner.RUNNER_SCHEMA("
+        "{'controllers': [{'name': 'cooler', 'host': 'localhost'}]}"
+        ")['controllers'][0])\n"
+        "loaded = [name for name in sys.modules if name.startswith("
+        "('homeassistant.', 'custom_components.novus_modbus.hub', "
+        "'custom_components.novus_modbus.integration'))]\n"
+        "assert not loaded, loaded\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,78 @@
+"""Tests for the fast sampler"""
+from datetime import timedelta
+
+from custom_components.novus_modbus.hub import NovusHub
+from custom_components.novus_modbus.profile import compile_profile
+from custom_components.novus_modbus.sampler import RingBuffer
+
+from .test_hub import FakeScheduler
+from .test_profile import _variant
+
+
+def test_ring_buffer_wraps():
+    """The oldest samples are overwritten once the buffer is full."""
+    buffer = RingBuffer(4)
+    assert buffer.aggregate() is None
+    for i in range(6):
+        buffer.append(float(i), i * 10.0)
+
+    assert len(buffer) == 4
+    assert buffer.window() == [(2.0, 20.0), (3.0, 30.0), (4.0, 40.0), (5.0, 50.0)]
+    assert buffer.window(since=4.0) == [(4.0, 40.0), (5.0, 50.0)]
+    assert buffer.aggregate(since=3.0) == {
+        "min": 30.0,
+        "max": 50.0,
+        "mean": 40.0,
+        "last": 50.0,
+    }
+
+
+async def test_aggregates_published_per_poll(hass):
+    """Samples are aggregated into the next poll's data."""
+    hub = NovusHub(
+        hass,
+        "test",
+        "localhost:5020",
+        timedelta(seconds=10),
+        sample_interval=0.5,
+        sample_window=2,
+    )
+    scheduler = hub.transport.scheduler = FakeScheduler()
+
+    for _ in range(6):
+        assert await hub.sampler.async_sample()
+    assert scheduler.reads == [0] * 6
+    # 2 seconds at 2 samples/s
+    assert len(hub.sampler.channels["t1_temp_c"]) == 4
+
+    data = await hub._async_update_data()
+    assert data["t1_temp_c_min"] == data["t1_temp_c_last"] == -20.0
+    assert data["temp_diff_c_mean"] == data["temp_diff_c"]
+    assert [v for _, v in hub.sampler.dump()["t2_temp_c"]] == [data["t2_temp_c"]] * 4
+
+    hub.close()
+
+
+async def test_aggregates_follow_profile_keys(hass):
+    """The aggregate sensors are keyed like the profile's probes."""
+    data = _variant()
+    data["registers"]["r0"]["key"] = "probe_1_c"
+    hub = NovusHub(
+        hass,
+        "test",
+        "localhost:5020",
+        timedelta(seconds=10),
+        profile=compile_profile(data),
+        sample_interval=0.5,
+    )
+    hub.transport.scheduler = FakeScheduler()
+
+    keys = {description.key for description in hub.aggregates}
+    assert "probe_1_c_max" in keys
+    assert "t1_temp_c_max" not in keys
+
+    assert await hub.sampler.async_sample()
+    data = await hub._async_update_data()
+    assert keys <= set(data)
+
+    hub.close()
@@ -0,0 +1,70 @@
+"""Tests for the bus scheduler"""
+import asyncio
+import time
+
+import pytest
+from pymodbus.exceptions import ModbusIOException
+
+from custom_components.novus_modbus.scheduler import (
+    BusScheduler,
+    DeviceBackoff,
+    backoff_delay,
+)
+
+
+class FakeTransport:
+    """Records the order requests reach the wire"""
+
+    window = 1
+
+    def __init__(self, dead=()):
+        self.calls = []
+        self.dead = set(dead)
+
+    async def async_read(self, unit, address, count, timeout=None):
+        self.calls.append((unit, address))
+        await asyncio.sleep(0)
+        if unit in self.dead:
+            return ModbusIOException("no response")
+        return object()
+
+
+async def _poll(scheduler, unit, addresses):
+    for address in addresses:
+        await scheduler.async_read(unit, address, 4)
+
+
+async def test_scheduler_interleaves_devices():
+    """Blocks from concurrent polls are served one device at a time."""
+    transport = FakeTransport()
+    scheduler = BusScheduler(transport)
+
+    await asyncio.gather(_poll(scheduler, 1, (0, 4)), _poll(scheduler, 2, (0, 4)))
+    assert transport.calls == [(1, 0), (2, 0), (1, 4), (2, 4)]
+
+
+async def test_scheduler_skips_dead_device():
+    """A unit that stops answering is skipped without touching the bus."""
+    transport = FakeTransport(dead={2})
+    scheduler = BusScheduler(transport)
+
+    await _poll(scheduler, 2, (0,))
+    assert not scheduler.device(2).in_backoff(time.monotonic())
+
+    await _poll(scheduler, 2, (4,))
+    assert scheduler.device(2).failures == 2
+
+    with pytest.raises(DeviceBackoff):
+        await scheduler.async_read(2, 8, 4)
+
+    await _poll(scheduler, 1, (0, 4))
+    assert transport.calls == [(2, 0), (2, 4), (1, 0), (1, 4)]
+    assert scheduler.device(2).skipped == 1
+
+
+def test_backoff_delay_jitter():
+    """Backoff doubles per attempt, jittered into the upper half."""
+    for attempt in range(12):
+        delay = backoff_delay(attempt, 5.0, 300.0)
+        ceiling = min(300.0, 5.0 * 2 ** attempt)
+        assert ceiling / 2 <= delay <= ceiling
@@ -0,0 +1,27 @@
+"""Tests for the poll snapshots"""
+import pytest
+
+from custom_components.novus_modbus.snapshot import SnapshotLayout
+
+
+def test_snapshot_is_a_mapping():
+    layout = SnapshotLayout(["t1_temp_c", "t2_temp_c", "ihm_pv", "t1_temp_c"])
+    snapshot = layout.snapshot({"t1_temp_c": 21.5, "ihm_pv": False, "other": 1})
+
+    assert layout.keys == ("t1_temp_c", "t2_temp_c", "ihm_pv")
+    assert snapshot.slots[layout.index["t1_temp_c"]] == 21.5
+    assert snapshot.slots[layout.index["t2_temp_c"]] is None
+    assert snapshot == {"t1_temp_c": 21.5, "ihm_pv": False}
+    assert len(snapshot) == 2
+    assert "t2_temp_c" not in snapshot and "other" not in snapshot
+    assert snapshot.get("t2_temp_c", 0) == 0
+    with pytest.raises(KeyError):
+        snapshot["t2_temp_c"]
+    with pytest.raises(TypeError):
+        snapshot["t1_temp_c"] = 0
+
+
+def test_single_key_layout():
+    layout = SnapshotLayout(["t1_temp_c"])
+    assert layout.snapshot({"t1_temp_c": 1.0}).slots == (1.0,)
+    assert layout.snapshot(layout.values()).slots == (None,)
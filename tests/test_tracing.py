@@ -0,0 +1,93 @@
+"""Tests for the poll tracing"""
+import pstats
+
+import pytest
+
+from custom_components.novus_modbus.telemetry import PollTelemetry
+from custom_components.novus_modbus.tracing import PollTracer, ProfilerBusy, SpanStats
+
+from .test_hub import FakeResponse, FakeScheduler, _hub
+
+
+def test_span_stats_roll():
+    stats = SpanStats(window=4)
+    for seconds in (0.5, 0.1, 0.2, 0.3, 0.4):
+        stats.record(seconds)
+    # the oldest span left the window, the totals keep it
+    assert stats.as_dict() == {
+        "count": 5,
+        "total": 1.5,
+        "mean": 0.25,
+        "p50": 0.3,
+        "p99": 0.4,
+        "max": 0.4,
+    }
+
+
+def test_requests_traced_only_when_enabled():
+    telemetry = PollTelemetry()
+    telemetry.record_request(0.02, FakeResponse([1]), 12, 11, 0.5)
+    assert telemetry.tracer.stages == {}
+
+    telemetry.tracer.enable()
+    telemetry.record_request(0.02, FakeResponse([1]), 12, 11, 0.5)
+    stages = telemetry.tracer.as_dict()["stages"]
+    assert stages["wait"]["max"] == 0.5
+    assert stages["wire"]["max"] == 0.02
+    assert stages["decode"] == {"count": 0}
+
+
+async def test_poll_stages_and_capture(hass, tmp_path):
+    """A capture profiles its polls, then is written for pstats."""
+    hub = _hub(hass, max_registers=4)
+    hub.transport.scheduler = FakeScheduler()
+    tracer = hub.telemetry.tracer
+    path = str(tmp_path / "traces" / "test.prof")
+    tracer.capture(path, 2)
+
+    await hub._async_update_data()
+    hub.async_update_listeners()
+    assert tracer.profile_path == path
+    await hub._async_update_data()
+    hub.async_update_listeners()
+    assert tracer.profile_path is None
+    await hass.async_block_till_done()
+
+    stages = tracer.as_dict()["stages"]
+    assert stages["decode"]["count"] == 2
+    assert stages["notify"]["count"] == 2
+    assert pstats.Stats(path).total_calls > 0
+
+    tracer.disable()
+    await hub._async_update_data()
+    assert tracer.stages["decode"].count == 2
+
+    hub.close()
+
+
+def test_disable_drops_capture(tmp_path):
+    tracer = PollTracer()
+    tracer.capture(str(tmp_path / "dropped.prof"), 5)
+    tracer.poll_started()
+    tracer.disable()
+    assert tracer.poll_finished() is None
+    assert not tmp_path.joinpath("dropped.prof").exists()
+
+
+def test_one_capture_at_a_time(tmp_path):
+    """A second tracer is refused until the running capture ends."""
+    first, second = PollTracer(), PollTracer()
+    first.capture(str(tmp_path / "first.prof"), 1)
+    with pytest.raises(ProfilerBusy):
+        second.capture(str(tmp_path / "second.prof"), 1)
+    assert second.profile_path is None
+
+    # the running tracer may restart its own capture
+    first.capture(str(tmp_path / "again.prof"), 1)
+    first.poll_started()
+    assert first.poll_finished() is not None
+
+    second.capture(str(tmp_path / "second.prof"), 1)
+    second.disable()
+    first.capture(str(tmp_path / "first.prof"), 1)
+    first.disable()
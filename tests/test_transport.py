@@ -0,0 +1,248 @@
+"""Tests for the shared transport registry"""
+import asyncio
+import threading
+import time
+
+from pymodbus.exceptions import ConnectionException
+import pytest
+
+from custom_components.novus_modbus import transport as transport_module
+from custom_components.novus_modbus.capture import ReplayTransport
+from custom_components.novus_modbus.const import (
+    TRANSPORT_ASYNC,
+    TRANSPORT_REPLAY,
+    TRANSPORT_SYNC,
+)
+from custom_components.novus_modbus.transport import (
+    MAX_TIMEOUT,
+    MIN_TIMEOUT,
+    AsyncTransport,
+    BusWorker,
+    NovusTransport,
+    RttEstimator,
+    SyncTransport,
+    acquire_transport,
+    bus_key,
+    close_transports,
+    create_transport,
+    release_transport,
+    supports_pipelining,
+)
+
+
+def test_bus_key():
+    """TCP buses are keyed by host:port, serial buses by device."""
+    assert bus_key("gateway.local") == "gateway.local:502"
+    assert bus_key("gateway.local:5020") == "gateway.local:5020"
+    assert bus_key("/dev/ttyUSB0") == "/dev/ttyUSB0"
+    assert bus_key("com3") == "com3"
+
+
+async def test_transport_shared_per_bus():
+    """Hubs on the same bus share one transport until the last release."""
+    first = acquire_transport("gateway.local", TRANSPORT_ASYNC)
+    second = acquire_transport("gateway.local:502", TRANSPORT_ASYNC)
+    other = acquire_transport("other.local", TRANSPORT_ASYNC)
+
+    assert first is second
+    assert first is not other
+    assert first.users == 2
+
+    release_transport(first)
+    assert acquire_transport("gateway.local", TRANSPORT_ASYNC) is first
+
+    release_transport(first)
+    release_transport(second)
+    release_transport(other)
+    # the idle connection lingers for a reload to pick it up
+    assert acquire_transport("gateway.local", TRANSPORT_ASYNC) is first
+    release_transport(first)
+
+    close_transports()
+    fresh = acquire_transport("gateway.local", TRANSPORT_ASYNC)
+    assert fresh is not first
+    release_transport(fresh, linger=0)
+
+
+async def test_linger_closes_idle_transport():
+    """The last release closes the transport once linger runs out."""
+    transport = acquire_transport("gateway.local", TRANSPORT_ASYNC)
+    release_transport(transport, linger=0.01)
+    assert transport._linger is not None
+    await asyncio.sleep(0.05)
+    assert transport._linger is None
+    fresh = acquire_transport("gateway.local", TRANSPORT_ASYNC)
+    assert fresh is not transport
+    release_transport(fresh, linger=0)
+
+
+def test_release_without_loop_closes():
+    """Without an event loop nothing could close it later, release closes now."""
+    transport = acquire_transport("gateway.local", "sync")
+    release_transport(transport)
+    assert transport._linger is None
+    fresh = acquire_transport("gateway.local", "sync")
+    assert fresh is not transport
+    release_transport(fresh)
+
+
+async def test_close_transports_keeps_used():
+    """Shutdown closes idle and lingering transports, not those in use."""
+    used = acquire_transport("gateway.local", TRANSPORT_ASYNC)
+    idle = acquire_transport("other.local", TRANSPORT_ASYNC)
+    release_transport(idle)
+
+    close_transports()
+    assert idle._linger is None
+    assert acquire_transport("gateway.local", TRANSPORT_ASYNC) is used
+    assert used.users == 2
+    fresh = acquire_transport("other.local", TRANSPORT_ASYNC)
+    assert fresh is not idle
+
+    release_transport(used, linger=0)
+    release_transport(used, linger=0)
+    release_transport(fresh, linger=0)
+
+
+async def test_close_transports_in_use():
+    """On shutdown even transports a hub still holds are closed."""
+    used = acquire_transport("gateway.local", TRANSPORT_ASYNC)
+
+    close_transports(in_use=True)
+    assert used.users == 0
+    fresh = acquire_transport("gateway.local", TRANSPORT_ASYNC)
+    assert fresh is not used
+
+    # the hub letting go later leaves the new transport alone
+    release_transport(used, linger=0)
+    assert acquire_transport("gateway.local", TRANSPORT_ASYNC) is fresh
+    release_transport(fresh, linger=0)
+    release_transport(fresh, linger=0)
+
+
+async def test_pymodbus_supports_pipelining():
+    """Pipelining builds on pymodbus internals, an upgrade may remove them."""
+    transport = acquire_transport("gateway.local", TRANSPORT_ASYNC, window=4)
+    assert supports_pipelining(transport._client)
+    assert transport.window == 4
+    release_transport(transport, linger=0)
+
+
+async def test_pipelining_falls_back_without_internals(monkeypatch):
+    """A pymodbus without the internals sends one request at a time."""
+    assert not supports_pipelining(object())
+    monkeypatch.setattr(transport_module, "supports_pipelining", lambda client: False)
+    transport = AsyncTransport("gateway.local", window=4)
+    assert transport.window == 1
+    transport.close()
+
+
+def test_rtt_timeout():
+    """The timeout follows the measured round trip time within bounds."""
+    rtt = RttEstimator()
+    assert rtt.timeout == MAX_TIMEOUT
+    for _ in range(20):
+        rtt.sample(0.02)
+    assert rtt.timeout == MIN_TIMEOUT
+    for _ in range(20):
+        rtt.sample(0.5)
+    assert 0.5 < rtt.timeout < 1.0
+    rtt.timed_out()
+    rtt.timed_out()
+    rtt.timed_out()
+    assert rtt.timeout == MAX_TIMEOUT
+
+
+async def test_bus_worker_backpressure():
+    """Blocking requests run on the bus's own thread, max_queue at a time."""
+    worker = BusWorker("test bus", max_queue=2)
+    gate = threading.Event()
+    threads = []
+
+    def request(n):
+        threads.append(threading.current_thread().name)
+        gate.wait(1)
+        return n
+
+    tasks = [asyncio.create_task(worker.async_run(request, n)) for n in range(4)]
+    await asyncio.sleep(0.05)
+    assert worker.depth == 2
+    assert worker.waits == 2
+
+    gate.set()
+    assert await asyncio.gather(*tasks) == [0, 1, 2, 3]
+    assert worker.depth == 0 and worker.peak_depth == 2
+    assert set(threads) == {"test bus"}
+
+    closed = threading.Event()
+    worker.close(closed.set)
+    assert await asyncio.get_running_loop().run_in_executor(None, closed.wait, 1)
+    with pytest.raises(ConnectionException):
+        await worker.async_run(request, 4)
+
+
+async def test_sync_transport_honors_timeout(socket_enabled):
+    """A blocking client gives up on a short probe, not after MAX_TIMEOUT."""
+
+    async def silent(reader, writer):
+        await reader.read()
+        writer.close()
+
+    server = await asyncio.start_server(silent, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    transport = SyncTransport(f"127.0.0.1:{port}")
+    try:
+        started = time.monotonic()
+        resp = await transport.async_read(1, 0, 2, timeout=0.2)
+        assert resp.isError()
+        assert time.monotonic() - started < MAX_TIMEOUT / 2
+        assert transport._client.comm_params.timeout_connect == MAX_TIMEOUT
+    finally:
+        transport.close()
+        server.close()
+
+
+def test_transport_base_is_abstract():
+    """Every transport has to implement reading, writing and closing."""
+    with pytest.raises(TypeError):
+        NovusTransport()  # type: ignore[abstract]
+
+
+async def test_create_transport_by_mode():
+    """The mode picks the client flavour, unknown modes are refused."""
+    transport = create_transport("127.0.0.1:1502", TRANSPORT_SYNC)
+    assert isinstance(transport, SyncTransport)
+    transport.close()
+
+    transport = create_transport("127.0.0.1:1502", TRANSPORT_ASYNC, 4)
+    assert isinstance(transport, AsyncTransport)
+    assert transport.window == 4
+    transport.close()
+
+    transport = create_transport("127.0.0.1:1502", TRANSPORT_REPLAY)
+    assert isinstance(transport, ReplayTransport)
+
+    with pytest.raises(ValueError):
+        create_transport("127.0.0.1:1502", "carrier-pigeon")
+
+
+async def test_async_transport_times_out(socket_enabled):
+    """A silent peer surfaces as a timeout once the probe's budget is spent."""
+
+    async def silent(reader, writer):
+        await reader.read()
+        writer.close()
+
+    server = await asyncio.start_server(silent, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    transport = AsyncTransport(f"127.0.0.1:{port}")
+    try:
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await transport.async_read(1, 0, 2, timeout=0.2)
+        assert time.monotonic() - started < MAX_TIMEOUT / 2
+        # a probe's timeout does not feed the round trip estimate
+        assert transport.rtt.timeout == MAX_TIMEOUT
+    finally:
+        transport.close()
+        server.close()
@@ -0,0 +1,62 @@
+"""Tests for the setpoint write queue"""
+import asyncio
+from datetime import timedelta
+
+import pytest
+from homeassistant.exceptions import HomeAssistantError
+
+from custom_components.novus_modbus.const import REGISTERS
+from custom_components.novus_modbus.hub import NovusHub
+from custom_components.novus_modbus.writer import encode, write_runs
+
+from .test_hub import FakeScheduler
+
+
+def test_encode():
+    """Values are scaled into two's complement words."""
+    assert encode(REGISTERS["r3"], 6.5) == 65
+    assert encode(REGISTERS["r3"], -2.0) == 0xFFEC
+    assert encode(REGISTERS["r12"], 3) == 3
+    with pytest.raises(ValueError):
+        encode(REGISTERS["r3"], 4000)
+
+
+def test_write_runs():
+    """Adjacent registers share a request of at most max_count words."""
+    pending = {3: 1, 4: 2, 8: 3, 9: 4, 10: 5, 11: 6, 12: 7, 18: 8}
+    assert write_runs(pending, 4) == [
+        (3, [1, 2]),
+        (8, [3, 4, 5, 6]),
+        (12, [7]),
+        (18, [8]),
+    ]
+
+
+async def test_coalesced_writes_verified_by_next_poll(hass):
+    """Rapid edits collapse into one batched write read back by the next poll."""
+    hub = NovusHub(hass, "test", "localhost:5020", timedelta(seconds=10))
+    scheduler = hub.transport.scheduler = FakeScheduler()
+    await hub._async_update_data()
+    hub.writer.delay = 0
+    scheduler.reads.clear()
+
+    await asyncio.gather(
+        hub.writer.async_write("don", 7.0),
+        hub.writer.async_write("don", 7.5),
+        hub.writer.async_write("doff", 2.5),
+    )
+    assert scheduler.writes == [(3, [75, 25])]
+    assert hub.data["don"] == 7.5
+
+    data = await hub._async_update_data()
+    # the slow tier holding r3/r4 is read again right away
+    assert scheduler.reads == [0, 4, 8, 12, 16, 20]
+    assert data["don"] == 7.5
+    assert data["doff"] == 2.5
+    assert hub.writer.mismatches == 0
+
+    with pytest.raises(HomeAssistantError):
+        await hub.writer.async_write("t1_temp_c", 1.0)
+
+    await hub.async_shutdown()
+    hub.close()